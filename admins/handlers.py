@@ -13,10 +13,12 @@ import asyncio
 import os
 import shutil
 import sys
+import threading
 from pathlib import Path
-from typing import Final, Optional
+from typing import Any, Callable, Dict, Final, Optional
 
-from aiogram import F, types
+from aiogram import F, html, types
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -26,6 +28,8 @@ from admins.filters.allowed_ids import AllowedIDs
 from admins.filters.is_admin import IsAdmin
 from admins.keyboards import (
     get_import_files_kb,
+    import_confirm_kb,
+    import_stop_kb,
     get_practice_supervisor_panel_kb,
     get_superadmin_panel_kb,
     _role_kb,
@@ -34,12 +38,15 @@ from admins.keyboards import (
 from admins.states import ImportFSM
 from admins.role_commands import router as role_router
 from config import ROLES, bot, dp, IMPORT_FILES
+from admins.superadmin.reports.jobs import CANDIDATES, submit
 from db.database import (
-    export_candidates_zip_async,
+    ImportCancelled,
+    writer_connection,
     get_user_role,
     set_user_role,
     has_pending_ps_request,
     get_user_registrations,
+    rebuild_stats_counters,
 )
 
 # --------------------------------------------------------------------------- #
@@ -104,6 +111,64 @@ async def change_role(cb: types.CallbackQuery) -> None:
 #                        ЭКСПОРТ и  ИМПОРТ  Excel-ФАЙЛОВ                      #
 # --------------------------------------------------------------------------- #
 
+IMPORT_PROGRESS_EVERY: float = 3.0  # не чаще раза в N секунд правим статус импорта
+
+# message_id статусного сообщения → флаг остановки импорта, который идёт в потоке
+_RUNNING_IMPORTS: Dict[int, threading.Event] = {}
+
+
+def _import_job(func: Callable[..., Any], /, **kwargs: Any) -> Any:
+    """(в рабочем потоке) Выполняет импорт через собственное соединение с БД."""
+    with writer_connection() as db:
+        return func(db=db, **kwargs)
+
+
+async def _run_import(status: types.Message, title: str, func: Callable[..., Any], /, **kwargs: Any) -> Any:
+    """
+    Выполняет `func(db=…, on_progress=…, cancel=…, **kwargs)` в рабочем
+    потоке, не блокируя event loop.
+
+    Пока импорт идёт, `status` показывает последний этап из `on_progress`
+    и кнопку «Остановить»; нажатие выставляет `cancel`, и `func` бросает
+    `ImportCancelled` на ближайшей проверке.
+    """
+    cancel = threading.Event()
+    stage = {"text": "запускаю…"}
+    _RUNNING_IMPORTS[status.message_id] = cancel
+    task = asyncio.ensure_future(asyncio.to_thread(
+        _import_job, func, cancel=cancel, on_progress=lambda text: stage.update(text=text), **kwargs
+    ))
+    shown = None
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=IMPORT_PROGRESS_EVERY)
+            if done:
+                return task.result()
+            if stage["text"] != shown and not cancel.is_set():
+                shown = stage["text"]
+                try:
+                    await status.edit_text(
+                        f"⏳ {title}: {html.quote(shown)}",
+                        parse_mode="HTML",
+                        reply_markup=import_stop_kb(status.message_id),
+                    )
+                except TelegramBadRequest:
+                    pass  # сообщение удалено или текст не изменился
+    finally:
+        _RUNNING_IMPORTS.pop(status.message_id, None)
+
+
+@dp.callback_query(F.data.startswith("import_stop:"), AllowedIDs())
+async def import_stop(cb: types.CallbackQuery) -> None:
+    """«Остановить» под статусом импорта: импорт прервётся между порциями."""
+    cancel = _RUNNING_IMPORTS.get(int(cb.data.split(":", 1)[1]))
+    if cancel is None:
+        await cb.answer("Импорт уже завершён.")
+        return
+    cancel.set()
+    await cb.answer("Останавливаю импорт…")
+    await cb.message.edit_text("⏹ Останавливаю импорт…")
+
 
 class ReloadCand(StatesGroup):
     """FSM: одно состояние, в котором ждём Excel с переводами."""
@@ -112,9 +177,11 @@ class ReloadCand(StatesGroup):
 
 @dp.message(Command("get_archive"), AllowedIDs())
 async def cmd_get_archive(msg: types.Message) -> None:
-    """Отправляет zip-архив с кандидатами (для суперадмина/рута)."""
-    zip_path: Path = await export_candidates_zip_async(bot)
-    await bot.send_document(msg.chat.id, FSInputFile(zip_path))
+    """Ставит zip-архив с кандидатами в очередь выгрузок (для суперадмина/рута)."""
+    status = await msg.answer("⏳ Архив кандидатов поставлен в очередь…")
+    _, created = submit(CANDIDATES, {"role_code": "user_unauthorized"}, msg.chat.id, status.message_id)
+    if not created:
+        await status.edit_text("⏳ Архив уже собирается — пришлю его, как только будет готов.")
 
 
 @dp.message(Command("reload_cand"), AllowedIDs())
@@ -161,18 +228,24 @@ async def process_excel(msg: types.Message, state: FSMContext) -> None:
         await state.clear()
         return
 
+    from user.registration.utils.locale_to_excel import import_excel_to_db, reload_translations
+
+    await state.clear()
+    status = await msg.answer("⏳ Импорт переводов…")
     try:
-        import_excel_to_db()
+        keys = await _run_import(status, "Импорт переводов", import_excel_to_db, path=save_path, reload=False)
+    except ImportCancelled:
+        await status.edit_text("⏹ Импорт переводов остановлен, таблица не изменена.",
+                               reply_markup=delete_this_msg())
     except Exception as exc:
-        await msg.answer(
-            f"⚠️ Файл сохранён, но ошибка при чтении: {exc}",
+        await status.edit_text(
+            f"⚠️ Файл сохранён, но ошибка при чтении: {html.quote(str(exc))}",
             reply_markup=delete_this_msg(),
         )
     else:
-        await msg.answer("✅ Переводы успешно обновлены.",
-                         reply_markup=delete_this_msg())
-
-    await state.clear()
+        await asyncio.to_thread(reload_translations, True)
+        await status.edit_text(f"✅ Переводы успешно обновлены ({keys} ключей).",
+                               reply_markup=delete_this_msg())
 
 
 # ---------------------------- СЛУЖЕБНЫЕ  UTILS ----------------------------- #
@@ -184,6 +257,14 @@ async def cmd_show_chat_id(msg: types.Message) -> None:
     await msg.answer(str(msg.chat.id), reply_markup=delete_this_msg())
 
 
+@dp.message(Command("rebuild_stats"), AllowedIDs())
+async def cmd_rebuild_stats(msg: types.Message) -> None:
+    """Пересчитывает сводку «Статистики» (stats_counters) по исходным таблицам."""
+    rows = rebuild_stats_counters()
+    await msg.answer(f"✅ Сводка статистики пересчитана ({rows} строк).",
+                     reply_markup=delete_this_msg())
+
+
 # ------------------------------- /import ----------------------------------- #
 
 
@@ -230,9 +311,32 @@ async def import_get_file(cb: types.CallbackQuery, state: FSMContext) -> None:
     await cb.answer()
 
 
+def _import_summary_text(summary) -> str:
+    """Сводка `ImportSummary` для сообщения админу."""
+    lines = [
+        "🔎 <b>Предпросмотр импорта users.xlsx</b>" if summary.dry_run else "✅ <b>Импорт users.xlsx завершён</b>",
+        "",
+        f"🆕 Новых: <b>{summary.new}</b>",
+        f"✏️ Изменённых: <b>{summary.changed}</b>",
+        f"➖ Без изменений: <b>{summary.unchanged}</b>",
+        f"⚠️ Конфликтов (пропущены): <b>{summary.conflicting}</b>",
+    ]
+    if summary.conflicts:
+        lines += ["", "Конфликтные строки (ключи указывают на разных участников):"]
+        lines += [f"• {html.quote(row)}" for row in summary.conflicts]
+        if summary.conflicting > len(summary.conflicts):
+            lines.append(f"… и ещё {summary.conflicting - len(summary.conflicts)}")
+    if summary.dry_run:
+        lines += ["", "Применить изменения?"]
+    return "\n".join(lines)
+
+
 @dp.callback_query(F.data == "import_cancel", AllowedIDs())
 async def import_cancel(cb: types.CallbackQuery, state: FSMContext) -> None:
-    """Отмена процесса импорта."""
+    """Отмена процесса импорта (в т.ч. после предпросмотра users.xlsx)."""
+    staged = (await state.get_data()).get("staged")
+    if staged:
+        Path(staged).unlink(missing_ok=True)
     await state.clear()
     await cb.message.delete()
     await cb.answer("Импорт отменён.")
@@ -253,6 +357,11 @@ async def import_replace_file(msg: types.Message, state: FSMContext) -> None:
         await state.clear()
         return
 
+    # users.xlsx: сначала предпросмотр, файл заменяется только после «Применить»
+    if name == "users.xlsx":
+        await _preview_users_import(msg, state, path)
+        return
+
     backup: Path = path.with_suffix(path.suffix + ".bak")
     try:
         if path.exists():
@@ -273,16 +382,13 @@ async def import_replace_file(msg: types.Message, state: FSMContext) -> None:
     match name:
         case "countries.xlsx":
             from user.registration.utils.countries import load_countries
-            load_countries()
+            await asyncio.to_thread(load_countries)  # новый снимок собирается в потоке
         case "info.xlsx":
             from user.registration.utils.info import load_info
-            load_info()
+            await asyncio.to_thread(load_info)
         case "info_for_rag.xlsx":
             from user.registration.utils.index_faq_local import build_faiss_index
             build_faiss_index()
-        case "users.xlsx":
-            from admins.superadmin.utils.import_excel import import_excel_users
-            import_excel_users()
         case "texts_part.xlsx":
             from user.auth.translations_loader import load_reg_translations
             load_reg_translations()
@@ -300,6 +406,66 @@ async def import_replace_file(msg: types.Message, state: FSMContext) -> None:
     await state.clear()
 
 
+async def _preview_users_import(msg: types.Message, state: FSMContext, path: Path) -> None:
+    """Скачивает users.xlsx рядом с текущим и показывает сводку dry-run."""
+    from admins.superadmin.utils.import_excel import import_excel_users
+
+    staged: Path = path.with_suffix(path.suffix + ".new")
+    status = await msg.answer("⏳ Проверяю файл…")
+    try:
+        await bot.download(msg.document.file_id, staged)
+        summary = await _run_import(
+            status, "Предпросмотр импорта", import_excel_users, xlsx=staged, verbose=False, dry_run=True
+        )
+    except ImportCancelled:
+        staged.unlink(missing_ok=True)
+        await status.edit_text("⏹ Предпросмотр остановлен, файл не заменён.", reply_markup=delete_this_msg())
+        await state.clear()
+        return
+    except Exception as exc:
+        staged.unlink(missing_ok=True)
+        await status.edit_text(f"⚠️ Ошибка при разборе файла: {html.quote(str(exc))}")
+        await state.clear()
+        return
+
+    await state.update_data(staged=str(staged))
+    await state.set_state(ImportFSM.confirm_users)
+    await status.edit_text(_import_summary_text(summary), parse_mode="HTML", reply_markup=import_confirm_kb())
+
+
+@dp.callback_query(ImportFSM.confirm_users, F.data == "import_apply", AllowedIDs())
+async def import_apply_users(cb: types.CallbackQuery, state: FSMContext) -> None:
+    """«Применить» после предпросмотра: подменяем users.xlsx и импортируем изменения."""
+    from admins.superadmin.utils.import_excel import import_excel_users
+
+    data = await state.get_data()
+    await state.clear()
+    staged = Path(data.get("staged") or "")
+    path: Optional[Path] = IMPORT_FILES.get("users.xlsx")
+    if not (path and staged.is_file()):
+        await cb.answer("Контекст утерян. Запустите /import заново.", show_alert=True)
+        return
+
+    await cb.answer()
+    await cb.message.edit_text("⏳ Импортирую…")
+    os.replace(staged, path)
+    try:
+        summary = await _run_import(cb.message, "Импорт users.xlsx", import_excel_users, xlsx=path, verbose=False)
+    except ImportCancelled:
+        await cb.message.edit_text(
+            "⏹ Импорт остановлен. Уже применённые порции сохранены — повторный импорт "
+            "того же файла применит только оставшиеся строки.",
+            reply_markup=delete_this_msg(),
+        )
+        return
+    except Exception as exc:
+        await cb.message.edit_text(f"⚠️ Ошибка импорта: {html.quote(str(exc))}")
+        return
+    await cb.message.edit_text(
+        _import_summary_text(summary), parse_mode="HTML", reply_markup=delete_this_msg()
+    )
+
+
 # ----------------------------- RESTART БОТА ------------------------------- #
 
 
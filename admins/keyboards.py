@@ -108,6 +108,26 @@ def get_import_files_kb() -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
+def import_confirm_kb() -> InlineKeyboardMarkup:
+    """Подтверждение импорта после предпросмотра (users.xlsx)."""
+    return (
+        InlineKeyboardBuilder()
+        .button(text="✅ Применить", callback_data="import_apply")
+        .button(text="🚫 Отмена", callback_data="import_cancel")
+        .adjust(1)
+        .as_markup()
+    )
+
+
+def import_stop_kb(job_id: int) -> InlineKeyboardMarkup:
+    """Кнопка «Остановить» под статусом фонового импорта."""
+    return (
+        InlineKeyboardBuilder()
+        .button(text="⏹ Остановить", callback_data=f"import_stop:{job_id}")
+        .as_markup()
+    )
+
+
 def import_cancel_kb() -> InlineKeyboardMarkup:
     """Отдельная клавиатура «Отмена» (если нужно без списка файлов)."""
     return (
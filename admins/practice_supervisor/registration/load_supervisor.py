@@ -4,29 +4,41 @@ Bulk-загрузка данных руководителей практики 
 Файл *practice_supervisors.xlsx* (рядом с модулем) содержит колонки:
     user_id | full_name | department | module
 
-При вызове `load_practice_supervisors()` делается UPSERT по full_name.
+При вызове `load_practice_supervisors()` делается UPSERT по full_name
+(пакетно, одной транзакцией) и обновляется кэш подразделений/модулей.
 """
 
 from __future__ import annotations
 
 from pathlib import Path
 from threading import RLock
-from typing import Any, Optional
+from typing import Optional
 
 import pandas as pd
 
-from db.database import conn, cursor
+from db.database import conn, cursor, refresh_department_cache
 
 XLSX_PATH: Path = Path(__file__).with_name("practice_supervisors.xlsx")
 _LOCK = RLock()
 
 
-def load_practice_supervisors(path: Optional[Path] = None) -> None:
+def _clean_text(col: pd.Series) -> pd.Series:
+    """Текстовая колонка: обрезаем пробелы, пустые/NaN → None."""
+    col = col.astype("string").str.strip()
+    col = col.mask(col.eq("").fillna(False))
+    return col.astype(object).where(col.notna(), None)
+
+
+def load_practice_supervisors(path: Optional[Path] = None) -> int:
     """
-    Читает Excel и «горячо» обновляет таблицу *practice_supervisors*.
+    Читает Excel и «горячо» обновляет таблицу *practice_supervisors* → число строк.
 
-    • если *full_name* уже есть → UPDATE department, module, user_id;  
+    • если *full_name* уже есть → UPDATE department, module, user_id;
     • иначе → INSERT новой строки.
+
+    Нормализация — по колонкам целиком, запись — один `executemany`
+    с `ON CONFLICT(full_name)` в одной транзакции (уникальный индекс
+    по full_name создаёт init_db).  Повторы ФИО в файле: побеждает последний.
     """
     excel = path or XLSX_PATH
     if not excel.exists():
@@ -36,43 +48,30 @@ def load_practice_supervisors(path: Optional[Path] = None) -> None:
         df = pd.read_excel(excel, engine="openpyxl").iloc[:, :4]
         df.columns = ["user_id", "full_name", "department", "module"]
 
-        for _, row in df.iterrows():
-            full_name = str(row["full_name"]).strip()
-            if not full_name:
-                continue
-
-            department = str(row["department"]).strip()
-            module = str(row["module"]).strip()
-            raw_uid: Any = row["user_id"]
-            uid = None if pd.isna(raw_uid) else int(raw_uid)
-
-            cursor.execute(
-                "SELECT id FROM practice_supervisors WHERE full_name = ?;",
-                (full_name,),
-            )
-            existing = cursor.fetchone()
-
-            if existing:
-                cursor.execute(
-                    """
-                    UPDATE practice_supervisors
-                       SET department = ?,
-                           module     = ?,
-                           user_id    = ?
-                     WHERE id = ?;
-                    """,
-                    (department, module, uid, existing["id"]),
-                )
-            else:
-                cursor.execute(
-                    """
-                    INSERT INTO practice_supervisors (full_name, department, module, user_id)
-                    VALUES (?, ?, ?, ?);
-                    """,
-                    (full_name, department, module, uid),
-                )
+        df["full_name"] = _clean_text(df["full_name"])
+        df = df[df["full_name"].notna()]
+        df["department"] = _clean_text(df["department"])
+        df["module"] = _clean_text(df["module"])
+        uid = pd.to_numeric(df["user_id"], errors="coerce")
+        df["user_id"] = [None if pd.isna(v) else int(v) for v in uid]
+
+        rows = list(df[["full_name", "department", "module", "user_id"]].itertuples(index=False, name=None))
+        cursor.executemany(
+            """
+            INSERT INTO practice_supervisors (full_name, department, module, user_id)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(full_name) DO UPDATE SET
+                department = excluded.department,
+                module     = excluded.module,
+                user_id    = excluded.user_id;
+            """,
+            rows,
+        )
         conn.commit()
 
+    refresh_department_cache()
+    return len(rows)
+
 
 # Автоматическая загрузка при импорте (можно отключить)
 # load_practice_supervisors()
@@ -8,3 +8,4 @@ from aiogram.fsm.state import State, StatesGroup
 class ImportFSM(StatesGroup):
     """Ожидаем файл для замены существующего (используется в /import)."""
     waiting_for_file = State()
+    confirm_users = State()    # users.xlsx: показан предпросмотр, ждём «Применить»
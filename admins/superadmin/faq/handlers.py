@@ -12,7 +12,7 @@ Super-admin FAQ editor
 
 from __future__ import annotations
 
-import importlib
+import asyncio
 from pathlib import Path
 from typing import Final, Iterable, List, Optional, Tuple
 
@@ -33,7 +33,7 @@ from admins.superadmin.faq.keyboards import (
 from admins.superadmin.faq.states import FaqStates
 from config import ROLES, bot, dp
 from db.database import conn, cursor
-from user.registration.utils import info as info_mod  # excel-FAQ «Кандидатка»
+from user.registration.utils.info import load_info  # excel-FAQ «Кандидатка»
 
 XL_PATH: Final = (
     Path(__file__).resolve().parents[3]
@@ -332,8 +332,8 @@ async def faq_handle_excel(msg: types.Message, state: FSMContext) -> None:
     XL_PATH.parent.mkdir(parents=True, exist_ok=True)
     tmp_path.replace(XL_PATH)
 
-    # «горячо» перезагружаем модуль, чтобы новые данные подхватились
-    importlib.reload(info_mod)
+    # новый снимок FAQ собирается в потоке и подменяет старый целиком
+    await asyncio.to_thread(load_info)
 
     await state.clear()
     await msg.reply(
@@ -0,0 +1,250 @@
+"""
+Движок массовых рассылок
+========================
+
+`Broadcaster.run()` рассылает сообщение списку `user_id` пулом воркеров:
+
+* общий token bucket держит скорость чуть ниже глобального лимита Telegram
+  (~30 сообщений/сек) — один на все одновременные рассылки процесса;
+* per-chat pacer не даёт отправить в один чат чаще раза в секунду;
+* `TelegramRetryAfter` ставит на паузу весь bucket на `retry_after` секунд,
+  после чего сообщение повторяется (flood-wait попыткой не считается);
+* сетевые / 5xx-ошибки повторяются с экспоненциальной задержкой;
+* итог и промежуточный прогресс — в `BroadcastStats`;
+* исход каждой доставки можно получить через `on_result(uid, status, error)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+log = logging.getLogger(__name__)
+
+GLOBAL_RATE: float = 25.0       # сообщений в секунду (устойчивый темп)
+GLOBAL_BURST: float = 5.0       # всплеск; rate + burst ≤ 30 в любом окне 1 с
+PER_CHAT_INTERVAL: float = 1.0  # секунд между сообщениями в один чат
+WORKERS: int = 16               # одновременных запросов к Bot API
+MAX_ATTEMPTS: int = 3           # попыток на транзиентные ошибки
+MAX_FLOOD_WAITS: int = 5        # сколько раз подряд терпим RetryAfter
+RETRY_BACKOFF: float = 1.0      # базовая задержка между попытками, сек
+PROGRESS_EVERY: float = 3.0     # как часто дёргать on_progress, сек
+
+DELIVERED = "delivered"
+FAILED = "failed"
+BLOCKED = "blocked"  # чат «мёртв»: бот заблокирован, аккаунт удалён, чат не найден
+
+_DEAD_CHAT_ERRORS = ("chat not found", "user not found", "peer_id_invalid")
+
+SendFunc = Callable[[int], Awaitable[object]]
+ProgressFunc = Callable[["BroadcastStats"], Awaitable[None]]
+ResultFunc = Callable[[int, str, Optional[str]], None]
+
+
+# --------------------------------------------------------------------------- #
+#                              ОГРАНИЧИТЕЛИ                                   #
+# --------------------------------------------------------------------------- #
+
+
+class TokenBucket:
+    """Асинхронный token bucket: `acquire()` ждёт, пока появится токен."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._ts = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Заморозить выдачу токенов (flood-wait от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._ts = time.monotonic()
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ChatPacer:
+    """Минимальный интервал между сообщениями в один и тот же чат."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._next: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int) -> None:
+        now = time.monotonic()
+        ready_at = self._next.get(chat_id, 0.0)
+        self._next[chat_id] = max(now, ready_at) + self.interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+        if len(self._next) > 10_000:  # не даём словарю расти бесконечно
+            self._next = {k: v for k, v in self._next.items() if v > now}
+
+
+# Лимит Telegram — на бота целиком, поэтому bucket и pacer общие для всех рассылок
+_BUCKET = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+_PACER = ChatPacer(PER_CHAT_INTERVAL)
+
+
+# --------------------------------------------------------------------------- #
+#                               СТАТИСТИКА                                    #
+# --------------------------------------------------------------------------- #
+
+
+@dataclass
+class BroadcastStats:
+    total: Optional[int] = None
+    delivered: int = 0
+    failed: int = 0
+    blocked: int = 0
+    started: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.delivered + self.failed + self.blocked
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def as_text(self) -> str:
+        """Короткая сводка для сообщения админу."""
+        head = f"{self.done}/{self.total}" if self.total is not None else str(self.done)
+        return (
+            f"Обработано: {head}\n"
+            f"Доставлено: {self.delivered}\n"
+            f"Недоступны (бот заблокирован / чат не найден): {self.blocked}\n"
+            f"Ошибок: {self.failed}\n"
+            f"Время: {int(self.elapsed)} с"
+        )
+
+
+# --------------------------------------------------------------------------- #
+#                                 ДВИЖОК                                      #
+# --------------------------------------------------------------------------- #
+
+
+class Broadcaster:
+    """Пул воркеров поверх общего token bucket."""
+
+    def __init__(self, *, workers: int = WORKERS, max_attempts: int = MAX_ATTEMPTS) -> None:
+        self.workers = workers
+        self.max_attempts = max_attempts
+
+    async def _deliver(self, uid: int, send: SendFunc) -> Tuple[str, Optional[str]]:
+        """Одна доставка с учётом лимитов и повторов → (статус, ошибка)."""
+        attempts = flood_waits = 0
+        while True:
+            await _BUCKET.acquire()
+            await _PACER.wait(uid)
+            try:
+                await send(uid)
+                return DELIVERED, None
+            except TelegramRetryAfter as exc:
+                flood_waits += 1
+                if flood_waits > MAX_FLOOD_WAITS:
+                    return FAILED, str(exc)
+                log.warning("flood-wait %s с (uid=%s)", exc.retry_after, uid)
+                _BUCKET.pause(exc.retry_after)
+                await asyncio.sleep(exc.retry_after)
+            except TelegramForbiddenError as exc:
+                return BLOCKED, str(exc)
+            except TelegramBadRequest as exc:
+                dead = any(marker in str(exc).lower() for marker in _DEAD_CHAT_ERRORS)
+                return (BLOCKED if dead else FAILED), str(exc)
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    return FAILED, str(exc)
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempts - 1))
+            except TelegramAPIError as exc:
+                return FAILED, str(exc)
+
+    async def run(
+        self,
+        recipients: Iterable[int] | AsyncIterable[int],
+        send: SendFunc,
+        *,
+        total: Optional[int] = None,
+        on_progress: Optional[ProgressFunc] = None,
+        on_result: Optional[ResultFunc] = None,
+    ) -> BroadcastStats:
+        """
+        Разослать `send(uid)` всем получателям.
+
+        `recipients` может быть обычным или асинхронным итератором — список
+        целиком в памяти не нужен.  `on_progress(stats)` вызывается раз в
+        `PROGRESS_EVERY` секунд и один раз в конце, `on_result` — после
+        каждой завершённой доставки.
+        """
+        stats = BroadcastStats(total=total, started=time.monotonic())
+        queue: asyncio.Queue[Optional[int]] = asyncio.Queue(maxsize=self.workers * 2)
+
+        async def _producer() -> None:
+            if isinstance(recipients, AsyncIterable):
+                async for uid in recipients:
+                    await queue.put(uid)
+            else:
+                for uid in recipients:
+                    await queue.put(uid)
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def _worker() -> None:
+            while (uid := await queue.get()) is not None:
+                status, error = await self._deliver(uid, send)
+                setattr(stats, status, getattr(stats, status) + 1)
+                if on_result:
+                    on_result(uid, status, error)
+
+        async def _reporter() -> None:
+            while True:
+                await asyncio.sleep(PROGRESS_EVERY)
+                await _safe_progress(on_progress, stats)
+
+        reporter = asyncio.create_task(_reporter()) if on_progress else None
+        try:
+            await asyncio.gather(_producer(), *(_worker() for _ in range(self.workers)))
+        finally:
+            if reporter:
+                reporter.cancel()
+        await _safe_progress(on_progress, stats)
+        return stats
+
+
+async def _safe_progress(on_progress: Optional[ProgressFunc], stats: BroadcastStats) -> None:
+    """Ошибка обновления прогресса не должна ронять рассылку."""
+    if on_progress is None:
+        return
+    try:
+        await on_progress(stats)
+    except Exception:  # pylint: disable=broad-except
+        log.debug("progress callback failed", exc_info=True)
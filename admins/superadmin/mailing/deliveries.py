@@ -0,0 +1,261 @@
+"""
+Персистентная очередь доставки рассылок
+=======================================
+
+Каждый запуск рассылки раскладывается в таблицу `mailing_deliveries` —
+по строке на получателя.  Дальше очередь «выкачивается» через `Broadcaster`:
+
+* получатели читаются пачками по `BATCH_SIZE` строк со статусом `queued`;
+* перед вызовом Bot API строка переводится в `sending` (и фиксируется),
+  после — в `delivered` / `blocked` / `failed` с текстом ошибки, а исход
+  запоминается в `user_deliverability` (мёртвые чаты в следующий раз
+  не попадут в очередь);
+* после перезапуска процесса строки, застрявшие в `sending`, помечаются
+  `interrupted` и повторно НЕ отправляются (лучше потерять одно сообщение,
+  чем прислать его дважды), а всё, что осталось `queued`, досылается.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+
+from admins.superadmin.mailing.broadcast import Broadcaster, BroadcastStats, ProgressFunc, SendFunc
+from db.database import conn, record_delivery_outcome
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE: int = 200  # сколько строк очереди читаем за раз
+
+# запуски, которые уже выкачиваются этим процессом: (mailing_id, run_at)
+_ACTIVE: Set[Tuple[int, str]] = set()
+
+# фоновые задачи start_drain: event loop держит их лишь слабо
+_DRAINS: Set[asyncio.Task] = set()
+
+InputMedia = Union[InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo]
+
+# тип элемента альбома (как в mailings.media) → класс InputMedia
+_INPUT_MEDIA: Dict[str, type] = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+# --------------------------------------------------------------------------- #
+#                                 ОЧЕРЕДЬ                                     #
+# --------------------------------------------------------------------------- #
+
+
+def enqueue(mailing_id: int, run_at: str, recipients: Iterable[int]) -> int:
+    """
+    Кладёт получателей запуска в очередь (дубликаты игнорируются).
+
+    НЕ делает commit: вызывающий фиксирует очередь в одной транзакции
+    со сдвигом расписания, чтобы запуск не потерялся и не задвоился.
+    """
+    before = conn.total_changes
+    conn.executemany(
+        "INSERT OR IGNORE INTO mailing_deliveries (mailing_id, run_at, user_id) VALUES (?, ?, ?)",
+        ((mailing_id, run_at, uid) for uid in recipients),
+    )
+    return conn.total_changes - before
+
+
+def _claim_batch(mailing_id: int, run_at: str, after_id: int) -> List[Tuple[int, int]]:
+    """Следующая пачка (row_id, user_id) со статусом `queued`."""
+    return [
+        (r[0], r[1])
+        for r in conn.execute(
+            """
+            SELECT id, user_id
+              FROM mailing_deliveries
+             WHERE mailing_id = ? AND run_at = ? AND status = 'queued' AND id > ?
+          ORDER BY id
+             LIMIT ?
+            """,
+            (mailing_id, run_at, after_id, BATCH_SIZE),
+        ).fetchall()
+    ]
+
+
+def _mark_sending(row_id: int) -> None:
+    conn.execute(
+        "UPDATE mailing_deliveries SET status = 'sending', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+        (_now(), row_id),
+    )
+    conn.commit()
+
+
+def _mark_done(row_id: int, status: str, error: Optional[str]) -> None:
+    conn.execute(
+        "UPDATE mailing_deliveries SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+        (status, error, _now(), row_id),
+    )
+    conn.commit()
+
+
+def queued_count(mailing_id: int, run_at: str) -> int:
+    row = conn.execute(
+        "SELECT COUNT(*) FROM mailing_deliveries WHERE mailing_id = ? AND run_at = ? AND status = 'queued'",
+        (mailing_id, run_at),
+    ).fetchone()
+    return row[0]
+
+
+def recover_interrupted() -> int:
+    """При старте: `sending` → `interrupted` (отправка могла уже пройти)."""
+    cur = conn.execute(
+        "UPDATE mailing_deliveries SET status = 'interrupted', error = 'process restarted', updated_at = ? "
+        "WHERE status = 'sending'",
+        (_now(),),
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def pending_runs() -> List[Tuple[int, str]]:
+    """Запуски, в очереди которых ещё есть `queued`-строки."""
+    return [
+        (r[0], r[1])
+        for r in conn.execute(
+            "SELECT DISTINCT mailing_id, run_at FROM mailing_deliveries WHERE status = 'queued'"
+        ).fetchall()
+    ]
+
+
+# --------------------------------------------------------------------------- #
+#                                ОТПРАВКА                                     #
+# --------------------------------------------------------------------------- #
+
+
+def _album(media_json: str) -> List[InputMedia]:
+    """JSON-описание альбома → список `InputMedia*` для `send_media_group`."""
+    return [
+        _INPUT_MEDIA[item["type"]](media=item["file_id"], caption=item.get("caption"), parse_mode="HTML")
+        for item in json.loads(media_json)
+        if item.get("type") in _INPUT_MEDIA
+    ]
+
+
+def build_sender(bot: Bot, mailing_id: int) -> Optional[SendFunc]:
+    """
+    Функция отправки для рассылки `mailing_id` (None — рассылка удалена).
+
+    Альбом уходит одним `send_media_group` по сохранённым `file_id`, одиночное
+    медиа — `copy_message` из чата админа, текст — обычным `send_message`.
+    Каждый вызов — один запрос к Bot API, поэтому лимиты `Broadcaster`
+    действуют на медиа так же, как на текст.
+    """
+    row = conn.execute(
+        "SELECT title, message, source_chat_id, source_message_id, media FROM mailings WHERE id = ?",
+        (mailing_id,),
+    ).fetchone()
+    if not row:
+        return None
+    title, text, src_chat, src_msg, media = row
+
+    if media:
+        album = _album(media)
+        return lambda uid: bot.send_media_group(uid, media=album)
+
+    if src_chat and src_msg:
+        return lambda uid: bot.copy_message(chat_id=uid, from_chat_id=src_chat, message_id=src_msg)
+
+    # ручные рассылки исторически уходят в HTML, запланированные — в Markdown
+    parse_mode = "HTML" if title == "manual" else ParseMode.MARKDOWN
+    return lambda uid: bot.send_message(uid, text, parse_mode=parse_mode)
+
+
+async def drain(
+    bot: Bot,
+    mailing_id: int,
+    run_at: str,
+    *,
+    on_progress: Optional[ProgressFunc] = None,
+) -> BroadcastStats:
+    """Выкачивает очередь одного запуска до конца."""
+    key = (mailing_id, run_at)
+    if key in _ACTIVE:
+        return BroadcastStats(total=0)
+
+    send = build_sender(bot, mailing_id)
+    if send is None:  # рассылку удалили, пока она стояла в очереди
+        conn.execute(
+            "UPDATE mailing_deliveries SET status = 'failed', error = 'mailing deleted' "
+            "WHERE mailing_id = ? AND status = 'queued'",
+            (mailing_id,),
+        )
+        conn.commit()
+        return BroadcastStats(total=0)
+
+    _ACTIVE.add(key)
+    row_of: Dict[int, int] = {}
+
+    async def _source():
+        last_id = 0
+        while batch := _claim_batch(mailing_id, run_at, last_id):
+            for row_id, uid in batch:
+                row_of[uid] = row_id
+                yield uid
+            last_id = batch[-1][0]
+
+    async def _send(uid: int) -> object:
+        _mark_sending(row_of[uid])
+        return await send(uid)
+
+    def _on_result(uid: int, status: str, error: Optional[str]) -> None:
+        _mark_done(row_of.pop(uid), status, error)
+        record_delivery_outcome(uid, status, error)
+
+    try:
+        return await Broadcaster().run(
+            _source(),
+            _send,
+            total=queued_count(mailing_id, run_at),
+            on_progress=on_progress,
+            on_result=_on_result,
+        )
+    finally:
+        _ACTIVE.discard(key)
+
+
+def start_drain(bot: Bot, mailing_id: int, run_at: str) -> asyncio.Task:
+    """Запускает `drain()` фоном и пишет итог в лог."""
+
+    async def _run() -> None:
+        try:
+            stats = await drain(bot, mailing_id, run_at)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Рассылка %s (%s): выкачка очереди упала", mailing_id, run_at)
+            return
+        log.info("Рассылка %s (%s): %s", mailing_id, run_at, stats.as_text().replace("\n", "; "))
+
+    task = asyncio.create_task(_run())
+    _DRAINS.add(task)
+    task.add_done_callback(_DRAINS.discard)
+    return task
+
+
+def resume_pending(bot: Bot) -> int:
+    """После перезапуска: закрывает «зависшие» строки и досылает остальное."""
+    interrupted = recover_interrupted()
+    if interrupted:
+        log.warning("Рассылки: %s доставок прервано перезапуском, повторно не отправляются", interrupted)
+    runs = pending_runs()
+    for mailing_id, run_at in runs:
+        start_drain(bot, mailing_id, run_at)
+    return len(runs)
@@ -7,7 +7,11 @@
 1. «Кому» — участницы (по тикам) / все / сотрудники (по категориям) / кандидатки.
 2. Режим «сейчас» и планирование (дата + периодичность).
 3. Просмотр / редактирование / удаление будущих рассылок.
-4. Фоновый `scheduler.py` раз в минуту отправляет отложенные сообщения.
+4. Фоновый `scheduler.py` отправляет отложенные сообщения точно в срок;
+   хэндлеры, меняющие расписание, сообщают ему об этом через `notify_changed()`.
+5. Любая рассылка идёт через очередь `mailing_deliveries` и переживает перезапуск.
+6. Вместо текста можно прислать фото / видео / документ (рассылается через
+   `copy_message`) или альбом (`send_media_group` по сохранённым `file_id`).
 """
 
 from __future__ import annotations
@@ -15,16 +19,29 @@ from __future__ import annotations
 import json
 from datetime import datetime
 from textwrap import shorten
-from typing import Final, Iterable, List, Set
+from typing import Final, Iterable, List, Optional, Set
 
 from aiogram import F, html, types
 from aiogram.enums import ParseMode
-from aiogram.exceptions import TelegramAPIError
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram_media_group import media_group_handler
 
 from admins.filters.is_admin import IsAdmin
 from admins.keyboards import delete_this_msg, get_superadmin_panel_kb
+from admins.superadmin.mailing.broadcast import BroadcastStats
+from admins.superadmin.mailing.deliveries import drain, enqueue
+from admins.superadmin.mailing.recipients import (
+    audience_size,
+    count_recipients,
+    iter_recipients,
+    participant_tiks,
+    record_skipped,
+    saved_seconds,
+    segment_counts,
+)
+from admins.superadmin.mailing.scheduler import notify_changed
 from admins.superadmin.mailing.keyboards import (
     STAFF_CATEGORIES,
     confirm_kb,
@@ -37,7 +54,7 @@ from admins.superadmin.mailing.keyboards import (
 )
 from admins.superadmin.mailing.states import Mailing
 from config import bot, dp
-from db.database import conn, cursor
+from db.database import conn, count_undeliverable, cursor
 
 # --------------------------------------------------------------------------- #
 #                              ВСПОМОГАТЕЛЬНОЕ                                #
@@ -63,58 +80,52 @@ def _rec_to_human(code: str) -> str:
     return _REC_HUMAN.get(code, code)
 
 
-def _collect_recipients(filters: dict) -> List[int]:
+_CONTENT_KEYS: Final = ("text", "source_chat_id", "source_message_id", "media")
+
+
+def _message_content(msg: types.Message) -> dict:
     """
-    Собираем список `user_id` по выбранной аудитории.
+    Содержимое рассылки из одного сообщения админа.
 
-    *target*:
-        - ml_all
-        - ml_candidates
-        - ml_participants  (нужен filters.chosen_tiks)
-        - ml_staff         (нужен filters.chosen_staff)
+    Текст хранится как есть; для медиа запоминаем само сообщение — получателям
+    оно уйдёт через `copy_message` вместе с подписью и форматированием.
     """
-    target: str = filters["target"]
-
-    if target == "ml_all":
-        cursor.execute("SELECT user_id FROM users")
-        return [r[0] for r in cursor.fetchall()]
-
-    if target == "ml_candidates":
-        cursor.execute("SELECT user_id FROM users WHERE role = 'user_unauthorized'")
-        return [r[0] for r in cursor.fetchall()]
-
-    if target == "ml_participants":
-        tiks: Set[str] = set(filters.get("chosen_tiks", []))
-        if not tiks:
-            return []
-        placeholders = ", ".join("?" * len(tiks))
-        cursor.execute(
-            f"SELECT user_id FROM users "
-            f"WHERE role = 'user_participant' AND tik IN ({placeholders})",
-            tuple(tiks),
-        )
-        return [r[0] for r in cursor.fetchall()]
+    if msg.text:
+        return {"text": msg.md_text, "source_chat_id": None, "source_message_id": None, "media": None}
+    return {
+        "text": msg.md_text,  # подпись (может быть пустой) — для превью
+        "source_chat_id": msg.chat.id,
+        "source_message_id": msg.message_id,
+        "media": None,
+    }
+
+
+def _media_item(msg: types.Message) -> Optional[dict]:
+    """Элемент альбома: тип и `file_id` (None — тип не поддерживается)."""
+    if msg.photo:
+        kind, file_id = "photo", msg.photo[-1].file_id
+    elif msg.video:
+        kind, file_id = "video", msg.video.file_id
+    elif msg.document:
+        kind, file_id = "document", msg.document.file_id
+    elif msg.audio:
+        kind, file_id = "audio", msg.audio.file_id
+    else:
+        return None
+    return {"type": kind, "file_id": file_id, "caption": msg.html_text or None}
 
-    if target == "ml_staff":
-        cats: Set[str] = set(filters.get("chosen_staff", []))
-        if not cats:
-            return []
 
-        roles: list[str] = []
-        if "emp" in cats:
-            roles.append("employee")
-        if "psup" in cats:
-            roles.append("admin_practice_supervisor")
-        if "admin" in cats:
-            roles.append("admin_admin")
-        if "supad" in cats:
-            roles.append("admin_supervisor")
+def _album_content(messages: List[types.Message]) -> dict:
+    """Содержимое рассылки из альбома: `file_id` всех элементов в JSON."""
+    items = [item for m in messages if (item := _media_item(m))]
+    caption = next((m.md_text for m in messages if m.caption), "")
+    return {"text": caption, "source_chat_id": None, "source_message_id": None, "media": json.dumps(items)}
 
-        placeholders = ", ".join("?" * len(roles))
-        cursor.execute(f"SELECT user_id FROM users WHERE role IN ({placeholders})", tuple(roles))
-        return [r[0] for r in cursor.fetchall()]
 
-    return []  # fallback
+def _preview(text: str, media: Optional[str], src_msg: Optional[int]) -> str:
+    """Короткое превью рассылки с пометкой о вложениях."""
+    mark = "📎 медиа\n" if media or src_msg else ""
+    return mark + shorten(text or "", 200, placeholder="…")
 
 
 # --------------------------------------------------------------------------- #
@@ -184,15 +195,16 @@ async def ml_planned_detail(cb: types.CallbackQuery, state: FSMContext) -> None:
     """Подробности конкретной запланированной задачи."""
     mid = int(cb.data.split(":")[1])
     cursor.execute(
-        "SELECT scheduled_at, recurrence, message FROM mailings WHERE id = ?", (mid,)
+        "SELECT scheduled_at, recurrence, message, media, source_message_id FROM mailings WHERE id = ?",
+        (mid,),
     )
     row = cursor.fetchone()
     if not row:
         return await cb.answer("Не найдено.", show_alert=True)
 
-    sched_iso, rec_code, msg = row
+    sched_iso, rec_code, msg, media, src_msg = row
     sched_h = datetime.fromisoformat(sched_iso).strftime("%d.%m.%Y %H:%M")
-    preview = shorten(msg, 200, placeholder="…")
+    preview = _preview(msg, media, src_msg)
 
     await state.update_data(edit_mid=mid)
     await state.set_state(Mailing.PlannedDetail)
@@ -207,6 +219,29 @@ async def ml_planned_detail(cb: types.CallbackQuery, state: FSMContext) -> None:
     await cb.answer()
 
 
+# --------------------------------------------------------------------------- #
+#                        1-a. НЕДОСТАВЛЯЕМЫЕ ЧАТЫ                             #
+# --------------------------------------------------------------------------- #
+
+
+@dp.callback_query(Mailing.ChooseTarget, F.data == "ml_dead_report", IsAdmin())
+async def ml_dead_report(cb: types.CallbackQuery, state: FSMContext) -> None:
+    """Сколько чатов рассылки пропускают и сколько времени это сэкономило."""
+    saved = int(saved_seconds())
+    await cb.message.edit_text(
+        "📵 <b>Недоставляемые чаты</b>\n"
+        f"• Сейчас пропускается: {count_undeliverable()}\n"
+        f"• Сэкономлено времени рассылок: {saved // 60} мин {saved % 60} с\n\n"
+        "Пользователь снова попадает в рассылки, как только отправит боту /start.",
+        parse_mode="HTML",
+        reply_markup=types.InlineKeyboardMarkup(
+            inline_keyboard=[[types.InlineKeyboardButton(text="Назад", callback_data="ml_back_targets")]]
+        ),
+    )
+    await state.set_state(Mailing.ViewPlanned)
+    await cb.answer()
+
+
 # ---------- Удаление ------------------------------------------------------- #
 
 
@@ -231,6 +266,7 @@ async def ml_del_yes(cb: types.CallbackQuery, state: FSMContext) -> None:
     mid = (await state.get_data())["edit_mid"]
     cursor.execute("DELETE FROM mailings WHERE id = ?", (mid,))
     conn.commit()
+    notify_changed(mid)
 
     await state.set_state(Mailing.ViewPlanned)
     await cb.message.edit_text("✅ Удалено.", reply_markup=targets_kb())
@@ -242,10 +278,11 @@ async def ml_del_no(cb: types.CallbackQuery, state: FSMContext) -> None:
     """Возврат к карточке без удаления."""
     mid = (await state.get_data())["edit_mid"]
     cursor.execute(
-        "SELECT scheduled_at, recurrence, message FROM mailings WHERE id = ?", (mid,)
+        "SELECT scheduled_at, recurrence, message, media, source_message_id FROM mailings WHERE id = ?",
+        (mid,),
     )
-    sched_iso, rec_code, msg = cursor.fetchone()
-    preview = shorten(msg, 200, placeholder="…")
+    sched_iso, rec_code, msg, media, src_msg = cursor.fetchone()
+    preview = _preview(msg, media, src_msg)
     await state.set_state(Mailing.PlannedDetail)
     await cb.message.edit_text(
         f"*ID {mid}*\n"
@@ -272,20 +309,36 @@ async def ml_edit_menu(cb: types.CallbackQuery, state: FSMContext) -> None:
 @dp.callback_query(Mailing.EditMenu, F.data == "ml_edit_text", IsAdmin())
 async def ml_edit_text_start(cb: types.CallbackQuery, state: FSMContext) -> None:
     await state.set_state(Mailing.EditText)
-    await cb.message.edit_text("Отправьте новый текст рассылки.\n⬅️ /cancel для возврата.")
+    await cb.message.edit_text(
+        "Отправьте новый текст рассылки или сообщение с медиа (фото, видео, документ, альбом).\n"
+        "⬅️ /cancel для возврата."
+    )
     await cb.answer()
 
 
-@dp.message(Mailing.EditText, IsAdmin())
-async def ml_edit_text_save(msg: types.Message, state: FSMContext) -> None:
+async def _edit_content_save(msg: types.Message, state: FSMContext, content: dict) -> None:
     mid = (await state.get_data())["edit_mid"]
-    cursor.execute("UPDATE mailings SET message = ? WHERE id = ?", (msg.md_text, mid))
+    cursor.execute(
+        "UPDATE mailings SET message = ?, source_chat_id = ?, source_message_id = ?, media = ? WHERE id = ?",
+        (*(content[k] for k in _CONTENT_KEYS), mid),
+    )
     conn.commit()
 
     await state.set_state(Mailing.PlannedDetail)
     await msg.reply("✅ Текст обновлён.", reply_markup=planned_detail_kb(mid), parse_mode="HTML")
 
 
+@dp.message(Mailing.EditText, F.media_group_id, IsAdmin())
+@media_group_handler
+async def ml_edit_album_save(messages: List[types.Message], state: FSMContext) -> None:
+    await _edit_content_save(messages[0], state, _album_content(messages))
+
+
+@dp.message(Mailing.EditText, IsAdmin())
+async def ml_edit_text_save(msg: types.Message, state: FSMContext) -> None:
+    await _edit_content_save(msg, state, _message_content(msg))
+
+
 # --- Дата/время ------------------------------------------------------------ #
 @dp.callback_query(Mailing.EditMenu, F.data == "ml_edit_dt", IsAdmin())
 async def ml_edit_dt_start(cb: types.CallbackQuery, state: FSMContext) -> None:
@@ -309,6 +362,7 @@ async def ml_edit_dt_save(msg: types.Message, state: FSMContext) -> None:
         (dt.isoformat(timespec="seconds"), mid),
     )
     conn.commit()
+    notify_changed(mid)
 
     await state.set_state(Mailing.PlannedDetail)
     await msg.reply("✅ Дата изменена.", reply_markup=planned_detail_kb(mid), parse_mode="HTML")
@@ -329,6 +383,7 @@ async def ml_edit_rec_save(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     cursor.execute("UPDATE mailings SET recurrence = ? WHERE id = ?", (rec_code, mid))
     conn.commit()
+    notify_changed(mid)
 
     await state.set_state(Mailing.PlannedDetail)
     await cb.message.edit_text("✅ Периодичность изменена.", reply_markup=planned_detail_kb(mid))
@@ -349,36 +404,30 @@ async def ml_target_chosen(cb: types.CallbackQuery, state: FSMContext) -> None:
     cmd = cb.data
     await state.update_data(target=cmd, gmsid=cb.message.message_id)
 
+    counts = segment_counts()
+
     # --- участницы: выбор тиков
     if cmd == "ml_participants":
-        cursor.execute(
-            """
-            SELECT DISTINCT tik
-              FROM users
-             WHERE role = 'user_participant' AND tik IS NOT NULL
-          ORDER BY tik
-            """
-        )
-        all_tiks = [str(r[0]) for r in cursor.fetchall()]
+        all_tiks = participant_tiks()
         if not all_tiks:
             return await cb.answer("Нет участниц с указанным тиком.", show_alert=True)
 
         await state.update_data(all_tiks=all_tiks, chosen_tiks=set())
         await state.set_state(Mailing.ChooseTik)
-        await cb.message.edit_text("Выберите тики:", reply_markup=tiks_kb(all_tiks, set()))
+        await cb.message.edit_text("Выберите тики:", reply_markup=tiks_kb(all_tiks, set(), counts))
         return await cb.answer()
 
     # --- сотрудники: категории
     if cmd == "ml_staff":
         await state.update_data(chosen_staff=set())
         await state.set_state(Mailing.ChooseStaff)
-        await cb.message.edit_text("Выберите категории сотрудников:", reply_markup=staff_kb(set()))
+        await cb.message.edit_text("Выберите категории сотрудников:", reply_markup=staff_kb(set(), counts))
         return await cb.answer()
 
     # --- остальные цели: сразу ввод текста
     await state.set_state(Mailing.WriteText)
     await cb.message.edit_text(
-        "Введите текст рассылки:",
+        f"Получателей: {audience_size({'target': cmd})}\n\nВведите текст рассылки или пришлите медиа:",
         reply_markup=types.InlineKeyboardMarkup(
             inline_keyboard=[[types.InlineKeyboardButton(text="Отмена", callback_data="ml_cancel")]]
         ),
@@ -400,7 +449,7 @@ async def ml_tik_toggle(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     chosen.symmetric_difference_update({tik})
     await state.update_data(chosen_tiks=chosen)
-    await cb.message.edit_reply_markup(reply_markup=tiks_kb(all_tiks, chosen))
+    await cb.message.edit_reply_markup(reply_markup=tiks_kb(all_tiks, chosen, segment_counts()))
     await cb.answer()
 
 
@@ -412,7 +461,9 @@ async def ml_tiks_done(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     await state.set_state(Mailing.WriteText)
     await cb.message.edit_text(
-        f"Тики выбраны: {', '.join(sorted(chosen))}\n\nВведите текст рассылки:",
+        f"Тики выбраны: {', '.join(sorted(chosen))}\n"
+        f"Получателей: {audience_size({'target': 'ml_participants', 'chosen_tiks': chosen})}\n\n"
+        "Введите текст рассылки или пришлите медиа:",
         reply_markup=types.InlineKeyboardMarkup(
             inline_keyboard=[[types.InlineKeyboardButton(text="Отмена", callback_data="ml_cancel")]]
         ),
@@ -433,7 +484,7 @@ async def ml_staff_toggle(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     chosen.symmetric_difference_update({code})
     await state.update_data(chosen_staff=chosen)
-    await cb.message.edit_reply_markup(reply_markup=staff_kb(chosen))
+    await cb.message.edit_reply_markup(reply_markup=staff_kb(chosen, segment_counts()))
     await cb.answer()
 
 
@@ -448,7 +499,9 @@ async def ml_staff_done(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     await state.set_state(Mailing.WriteText)
     await cb.message.edit_text(
-        f"Категории выбраны: {names}\n\nВведите текст рассылки:",
+        f"Категории выбраны: {names}\n"
+        f"Получателей: {audience_size({'target': 'ml_staff', 'chosen_staff': chosen})}\n\n"
+        "Введите текст рассылки или пришлите медиа:",
         reply_markup=types.InlineKeyboardMarkup(
             inline_keyboard=[[types.InlineKeyboardButton(text="Отмена", callback_data="ml_cancel")]]
         ),
@@ -461,9 +514,8 @@ async def ml_staff_done(cb: types.CallbackQuery, state: FSMContext) -> None:
 # --------------------------------------------------------------------------- #
 
 
-@dp.message(Mailing.WriteText, IsAdmin())
-async def ml_text_saved(msg: types.Message, state: FSMContext) -> None:
-    await state.update_data(text=msg.md_text)
+async def _content_saved(msg: types.Message, state: FSMContext, content: dict) -> None:
+    await state.update_data(**content)
     data = await state.get_data()
     gmsid: int = data["gmsid"]
 
@@ -482,6 +534,17 @@ async def ml_text_saved(msg: types.Message, state: FSMContext) -> None:
     )
 
 
+@dp.message(Mailing.WriteText, F.media_group_id, IsAdmin())
+@media_group_handler
+async def ml_album_saved(messages: List[types.Message], state: FSMContext) -> None:
+    await _content_saved(messages[0], state, _album_content(messages))
+
+
+@dp.message(Mailing.WriteText, IsAdmin())
+async def ml_text_saved(msg: types.Message, state: FSMContext) -> None:
+    await _content_saved(msg, state, _message_content(msg))
+
+
 # ---------- шаг ➊ — запрос даты ------------------------------------------- #
 @dp.callback_query(Mailing.Confirm, F.data == "ml_set_dt", IsAdmin())
 async def ml_set_dt(cb: types.CallbackQuery, state: FSMContext) -> None:
@@ -531,7 +594,7 @@ async def ml_pick_recurrence(cb: types.CallbackQuery, state: FSMContext) -> None
 
     data = await state.get_data()
     when_human = datetime.fromisoformat(data["scheduled_at"]).strftime("%d.%m.%Y %H:%M")
-    text_preview = html.quote(shorten(data["text"], 200, placeholder="…"))
+    text_preview = html.quote(_preview(data["text"], data.get("media"), data.get("source_message_id")))
 
     await state.set_state(Mailing.Confirm)
     await cb.message.edit_text(
@@ -558,12 +621,19 @@ async def ml_plan_confirm(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     cursor.execute(
         """
-        INSERT INTO mailings (title, message, scheduled_at, sent, filters, recurrence)
-        VALUES ('scheduled', ?, ?, 0, ?, ?)
+        INSERT INTO mailings (title, message, source_chat_id, source_message_id, media,
+                              scheduled_at, sent, filters, recurrence)
+        VALUES ('scheduled', ?, ?, ?, ?, ?, 0, ?, ?)
         """,
-        (data["text"], data["scheduled_at"], json.dumps(filters), data["recurrence"]),
+        (
+            *(data.get(k) for k in _CONTENT_KEYS),
+            data["scheduled_at"],
+            json.dumps(filters),
+            data["recurrence"],
+        ),
     )
     conn.commit()
+    notify_changed(cursor.lastrowid)
 
     await state.clear()
     await cb.message.edit_text(
@@ -579,34 +649,41 @@ async def ml_plan_confirm(cb: types.CallbackQuery, state: FSMContext) -> None:
 
 @dp.callback_query(Mailing.Confirm, F.data == "ml_send", IsAdmin())
 async def ml_do_send(cb: types.CallbackQuery, state: FSMContext) -> None:
-    await cb.answer("Отправка рассылки, это может занять некоторое время…", show_alert=True)
     data = await state.get_data()
-    users = _collect_recipients(data)
-    if not users:
+    if not count_recipients(data):
         await cb.answer("Пользователи не найдены.", show_alert=True)
         await state.clear()
         return
 
-    sent = failed = 0
-    for uid in users:
-        try:
-            await bot.send_message(uid, data["text"], parse_mode="HTML")
-            sent += 1
-        except TelegramAPIError:
-            failed += 1
+    await cb.answer("Отправка рассылки, это может занять некоторое время…", show_alert=True)
+    await state.clear()
 
+    # сначала фиксируем рассылку и всю очередь — после перезапуска она будет дослана
+    run_at = datetime.now().isoformat(timespec="seconds")
     cursor.execute(
-        "INSERT INTO mailings (title, message, scheduled_at, sent) VALUES ('manual', ?, ?, 1)",
-        (data["text"], datetime.now().isoformat(timespec="seconds")),
+        """
+        INSERT INTO mailings (title, message, source_chat_id, source_message_id, media, scheduled_at, sent)
+        VALUES ('manual', ?, ?, ?, ?, ?, 1)
+        """,
+        (*(data.get(k) for k in _CONTENT_KEYS), run_at),
     )
+    mid = cursor.lastrowid
+    enqueue(mid, run_at, iter_recipients(data))
     conn.commit()
+    record_skipped(data)
+
+    async def _progress(stats: BroadcastStats) -> None:
+        try:
+            await cb.message.edit_text(f"⏳ Идёт рассылка…\n\n{stats.as_text()}")
+        except TelegramBadRequest:
+            pass  # текст не изменился
+
+    stats = await drain(bot, mid, run_at, on_progress=_progress)
 
-    await state.clear()
     await cb.message.edit_text(
-        f"Рассылка отправлена.\nДоставлено: {sent}\nОшибок: {failed}",
+        f"Рассылка отправлена.\n\n{stats.as_text()}",
         reply_markup=targets_kb(),
     )
-    await cb.answer()
 
 
 # --------------------------------------------------------------------------- #
@@ -4,7 +4,7 @@ Inline-клавиатуры модуля «Рассылки».
 
 from __future__ import annotations
 
-from typing import List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -22,6 +22,7 @@ def targets_kb() -> InlineKeyboardMarkup:
     kb.button(text="Всем сотрудникам", callback_data="ml_staff")
     kb.button(text="Кандидаткам", callback_data="ml_candidates")
     kb.button(text="📅 Запланированные", callback_data="ml_planned")
+    kb.button(text="📵 Недоставляемые", callback_data="ml_dead_report")
     kb.button(text="Назад", callback_data="sa_menu")
     return kb.adjust(1).as_markup()
 
@@ -29,17 +30,25 @@ def targets_kb() -> InlineKeyboardMarkup:
 # --------------------------------------------------------------------------- #
 #                       1.  Участницы  — тики                                 #
 # --------------------------------------------------------------------------- #
-def tiks_kb(all_tiks: List[str], chosen: Set[str]) -> InlineKeyboardMarkup:
+def _count_suffix(counts: Optional[Dict[str, int]], segment: str) -> str:
+    """' (42)' — размер сегмента из кэша `recipients.segment_counts()`."""
+    return f" ({counts.get(segment, 0)})" if counts is not None else ""
+
+
+def tiks_kb(
+    all_tiks: List[str], chosen: Set[str], counts: Optional[Dict[str, int]] = None
+) -> InlineKeyboardMarkup:
     """
     Чекбоксы тик-кодов.
 
     `all_tiks` — фиксированный полный список (порядок не меняем);  
-    `chosen`   — отмеченные коды.
+    `chosen`   — отмеченные коды;  
+    `counts`   — размеры сегментов, показываются рядом с тиком.
     """
     kb = InlineKeyboardBuilder()
     for t in all_tiks:
         mark = "✅ " if t in chosen else ""
-        kb.button(text=f"{mark}{t}", callback_data=f"ml_tik_toggle:{t}")
+        kb.button(text=f"{mark}{t}{_count_suffix(counts, f'tik:{t}')}", callback_data=f"ml_tik_toggle:{t}")
     kb.adjust(2)
 
     kb.row(
@@ -60,11 +69,14 @@ STAFF_CATEGORIES: List[Tuple[str, str]] = [
 ]
 
 
-def staff_kb(chosen: Set[str]) -> InlineKeyboardMarkup:
+def staff_kb(chosen: Set[str], counts: Optional[Dict[str, int]] = None) -> InlineKeyboardMarkup:
     kb = InlineKeyboardBuilder()
     for code, title in STAFF_CATEGORIES:
         prefix = "✅ " if code in chosen else ""
-        kb.button(text=f"{prefix}{title}", callback_data=f"ml_staff_toggle:{code}")
+        kb.button(
+            text=f"{prefix}{title}{_count_suffix(counts, f'staff:{code}')}",
+            callback_data=f"ml_staff_toggle:{code}",
+        )
     kb.adjust(2)
 
     kb.row(
@@ -0,0 +1,188 @@
+"""
+Получатели рассылок
+===================
+
+* `iter_recipients(filters)` — потоковый генератор `user_id` по фильтру
+  аудитории: курсор читается пачками `fetchmany`, список целиком в памяти
+  не строится.  `user_id` — первичный ключ, поэтому дублей нет, а
+  заблокированные пользователи (`status = 'blocked'`) и «мёртвые» чаты из
+  `user_deliverability` отсекаются в SQL.
+* `record_skipped(filters)` — копит, сколько доставок в мёртвые чаты
+  сэкономлено; `saved_seconds()` переводит это в секунды лимита Bot API.
+* `segment_counts()` / `audience_size(filters)` — размеры именованных
+  сегментов («all», «candidates», «tik:12», «staff:emp» …).  Считаются одним
+  GROUP BY и кэшируются на `SEGMENT_TTL` секунд, так что размер аудитории
+  показывается в клавиатурах мгновенно.  Кэш сбрасывается при импорте
+  пользователей, смене роли и блокировке (`invalidate_mailing_segments`).
+* `participant_tiks()` и `count_recipients(filters)` — живые запросы: по ним
+  строится список тиков и решается, есть ли кому отправлять.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from admins.superadmin.mailing.broadcast import GLOBAL_RATE
+from db.database import conn, get_int_setting, incr_int_setting
+
+FETCH_SIZE: int = 500   # строк за один fetchmany
+SEGMENT_TTL: int = 300  # сек жизни кэша размеров сегментов
+
+# код категории сотрудников → роль в users
+STAFF_ROLES: Dict[str, str] = {
+    "emp": "employee",
+    "psup": "admin_practice_supervisor",
+    "admin": "admin_admin",
+    "supad": "admin_supervisor",
+}
+
+SKIPPED_KEY = "ml_dead_skipped"  # счётчик в таблице settings
+
+_ALIVE_SQL = "COALESCE(status, '') <> 'blocked'"
+_DEAD_SQL = "user_id IN (SELECT user_id FROM user_deliverability WHERE deliverable = 0)"
+
+_segments: Dict[str, int] = {}
+_segments_ts: float = 0.0
+
+
+def _audience_where(filters: dict) -> Optional[Tuple[str, List]]:
+    """WHERE-часть и параметры для выбранной аудитории (None — пусто)."""
+    target: str = filters.get("target", "")
+
+    if target == "ml_all":
+        return "1 = 1", []
+
+    if target == "ml_candidates":
+        return "role = 'user_unauthorized'", []
+
+    if target == "ml_participants":
+        tiks = sorted(set(filters.get("chosen_tiks", [])))
+        if not tiks:
+            return None
+        return f"role = 'user_participant' AND tik IN ({', '.join('?' * len(tiks))})", tiks
+
+    if target == "ml_staff":
+        roles = [STAFF_ROLES[c] for c in sorted(set(filters.get("chosen_staff", []))) if c in STAFF_ROLES]
+        if not roles:
+            return None
+        return f"role IN ({', '.join('?' * len(roles))})", roles
+
+    return None  # fallback
+
+
+def iter_recipients(filters: dict, *, include_dead: bool = False) -> Iterator[int]:
+    """Потоково отдаёт `user_id` получателей рассылки."""
+    where = _audience_where(filters)
+    if where is None:
+        return
+    sql, params = where
+    dead = "" if include_dead else f" AND NOT {_DEAD_SQL}"
+
+    cur = conn.execute(
+        f"SELECT user_id FROM users WHERE {sql} AND {_ALIVE_SQL}{dead} ORDER BY user_id",
+        params,
+    )
+    while rows := cur.fetchmany(FETCH_SIZE):
+        for r in rows:
+            yield r[0]
+
+
+def count_recipients(filters: dict) -> int:
+    """Число получателей прямо сейчас (без кэша) — как у `iter_recipients`."""
+    where = _audience_where(filters)
+    if where is None:
+        return 0
+    sql, params = where
+    return conn.execute(
+        f"SELECT COUNT(*) FROM users WHERE {sql} AND {_ALIVE_SQL} AND NOT {_DEAD_SQL}",
+        params,
+    ).fetchone()[0]
+
+
+def participant_tiks() -> List[str]:
+    """Все тики участниц, по порядку."""
+    rows = conn.execute(
+        """
+        SELECT DISTINCT tik
+          FROM users
+         WHERE role = 'user_participant' AND tik IS NOT NULL
+      ORDER BY tik
+        """
+    ).fetchall()
+    return [str(r[0]) for r in rows]
+
+
+def record_skipped(filters: dict) -> int:
+    """Считает мёртвые чаты аудитории, которые рассылка пропустит, и копит счётчик."""
+    where = _audience_where(filters)
+    if where is None:
+        return 0
+    sql, params = where
+    skipped = conn.execute(
+        f"SELECT COUNT(*) FROM users WHERE {sql} AND {_ALIVE_SQL} AND {_DEAD_SQL}",
+        params,
+    ).fetchone()[0]
+    if skipped:
+        incr_int_setting(SKIPPED_KEY, skipped)
+    return skipped
+
+
+def saved_seconds() -> float:
+    """Сколько секунд лимита Bot API сэкономили пропуски мёртвых чатов."""
+    return get_int_setting(SKIPPED_KEY) / GLOBAL_RATE
+
+
+# --------------------------------------------------------------------------- #
+#                         РАЗМЕРЫ СЕГМЕНТОВ (кэш)                             #
+# --------------------------------------------------------------------------- #
+
+
+def invalidate_segments() -> None:
+    """Сбросить кэш (например, после импорта пользователей)."""
+    global _segments_ts
+    _segments_ts = 0.0
+
+
+def segment_counts() -> Dict[str, int]:
+    """{имя сегмента: число получателей}; пересчитывается не чаще SEGMENT_TTL."""
+    global _segments, _segments_ts
+    if _segments and time.monotonic() - _segments_ts < SEGMENT_TTL:
+        return _segments
+
+    counts: Dict[str, int] = {"all": 0, "candidates": 0}
+    role2staff = {role: code for code, role in STAFF_ROLES.items()}
+    for role, tik, cnt in conn.execute(
+        f"SELECT role, tik, COUNT(*) FROM users WHERE {_ALIVE_SQL} AND NOT {_DEAD_SQL} GROUP BY role, tik"
+    ).fetchall():
+        counts["all"] += cnt
+        if role == "user_unauthorized":
+            counts["candidates"] += cnt
+        elif role == "user_participant" and tik is not None:
+            key = f"tik:{tik}"
+            counts[key] = counts.get(key, 0) + cnt
+        elif role in role2staff:
+            key = f"staff:{role2staff[role]}"
+            counts[key] = counts.get(key, 0) + cnt
+
+    _segments, _segments_ts = counts, time.monotonic()
+    return counts
+
+
+def _segment_names(filters: dict) -> Iterable[str]:
+    target = filters.get("target", "")
+    if target == "ml_all":
+        return ["all"]
+    if target == "ml_candidates":
+        return ["candidates"]
+    if target == "ml_participants":
+        return [f"tik:{t}" for t in set(filters.get("chosen_tiks", []))]
+    if target == "ml_staff":
+        return [f"staff:{c}" for c in set(filters.get("chosen_staff", []))]
+    return []
+
+
+def audience_size(filters: dict) -> int:
+    """Размер аудитории по кэшу сегментов (сегменты не пересекаются)."""
+    counts = segment_counts()
+    return sum(counts.get(name, 0) for name in _segment_names(filters))
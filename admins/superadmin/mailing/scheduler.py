@@ -1,28 +1,42 @@
 """
 Фоновый планировщик рассылок.
 
-Корутина `mailing_scheduler(bot)` раз в минуту:
-1. Берёт из таблицы `mailings` задачи, у которых `scheduled_at` ≤ сейчас.
-2. Вызывает `_collect_recipients()` из `handlers.py`, чтобы получить TG-ID.
-3. Рассылает сообщения (Markdown) и:
+Вместо опроса БД раз в минуту держит в памяти min-heap «ближайших сроков»:
+
+0. При старте досылает очереди, прерванные перезапуском (`deliveries.py`),
+   и загружает в heap все ещё не отправленные рассылки.
+1. Спит ровно до ближайшего срока (или пока хэндлер не сообщит об изменении
+   через `notify_changed()` — создание, перенос, смена периода, удаление).
+2. Для наступившей рассылки потоково читает получателей `iter_recipients()`
+   и в ОДНОЙ транзакции кладёт получателей в `mailing_deliveries` и:
    • для «once» помечает `sent = 1`;
-   • для периодических рассчитывает новую дату и сдвигает `scheduled_at`.
+   • для периодических рассчитывает новую дату и сдвигает `scheduled_at`
+     (новый срок сразу попадает обратно в heap).
+3. Выкачивает очередь фоном через `Broadcaster` с учётом лимитов.
 """
 
 from __future__ import annotations
 
 import asyncio
+import heapq
 import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from aiogram import Bot, types
-from aiogram.enums import ParseMode
+from aiogram import Bot
 from dateutil.relativedelta import relativedelta
 
-from db.database import conn, cursor
+from admins.superadmin.mailing.deliveries import enqueue, resume_pending, start_drain
+from admins.superadmin.mailing.recipients import iter_recipients, record_skipped
+from db.database import conn
 
-CHECK_INTERVAL: int = 60  # секунд между проверками
+MAX_SLEEP: int = 300  # сек; страховка от перевода системных часов, БД при этом не читается
+
+# heap из (срок, mailing_id); актуальный срок каждой рассылки — в _DUE,
+# устаревшие элементы heap просто пропускаются при извлечении
+_HEAP: List[Tuple[datetime, int]] = []
+_DUE: Dict[int, datetime] = {}
+_WAKEUP = asyncio.Event()
 
 
 def _next_run(current: datetime, recurrence: str) -> Optional[datetime]:
@@ -38,45 +52,110 @@ def _next_run(current: datetime, recurrence: str) -> Optional[datetime]:
             return None  # 'once' или неизвестное
             
 
+def notify_changed(mailing_id: int) -> None:
+    """
+    Перечитать срок рассылки из БД и разбудить планировщик.
+
+    Вызывается хэндлерами после commit: создание, перенос даты, смена
+    периодичности, удаление.
+    """
+    row = conn.execute(
+        """
+        SELECT scheduled_at
+          FROM mailings
+         WHERE id = ?
+           AND scheduled_at IS NOT NULL
+           AND (recurrence <> 'once' OR sent = 0)
+        """,
+        (mailing_id,),
+    ).fetchone()
+
+    if row is None:
+        _DUE.pop(mailing_id, None)
+    else:
+        due = datetime.fromisoformat(row[0])
+        _DUE[mailing_id] = due
+        heapq.heappush(_HEAP, (due, mailing_id))
+    _WAKEUP.set()
+
+
+def _load_all() -> None:
+    """Первичная загрузка heap из таблицы `mailings`."""
+    _HEAP.clear()
+    _DUE.clear()
+    for mid, sched_iso in conn.execute(
+        """
+        SELECT id, scheduled_at
+          FROM mailings
+         WHERE scheduled_at IS NOT NULL
+           AND (recurrence <> 'once' OR sent = 0)
+        """
+    ).fetchall():
+        _DUE[mid] = datetime.fromisoformat(sched_iso)
+    _HEAP.extend((due, mid) for mid, due in _DUE.items())
+    heapq.heapify(_HEAP)
+
+
+def _peek() -> Optional[Tuple[datetime, int]]:
+    """Ближайший актуальный элемент heap (устаревшие выбрасываются)."""
+    while _HEAP and _DUE.get(_HEAP[0][1]) != _HEAP[0][0]:
+        heapq.heappop(_HEAP)
+    return _HEAP[0] if _HEAP else None
+
+
+def _fire(bot: Bot, mail_id: int) -> None:
+    """Ставит наступившую рассылку в очередь доставки и сдвигает расписание."""
+    row = conn.execute(
+        """
+        SELECT filters, recurrence, scheduled_at
+          FROM mailings
+         WHERE id = ? AND (recurrence <> 'once' OR sent = 0)
+        """,
+        (mail_id,),
+    ).fetchone()
+    if row is None:
+        return
+    filters_json, recurrence, sched_iso = row
+    if datetime.fromisoformat(sched_iso) > datetime.now():  # срок успели перенести
+        notify_changed(mail_id)
+        return
+
+    filters: Dict = json.loads(filters_json or "{}")
+    enqueue(mail_id, sched_iso, iter_recipients(filters))
+    record_skipped(filters)
+
+    next_dt = _next_run(datetime.fromisoformat(sched_iso), recurrence)
+
+    if next_dt is None:  # одноразовая
+        conn.execute("UPDATE mailings SET sent = 1 WHERE id = ?", (mail_id,))
+    else:  # периодическая
+        conn.execute(
+            "UPDATE mailings SET scheduled_at = ? WHERE id = ?",
+            (next_dt.isoformat(timespec="seconds"), mail_id),
+        )
+    conn.commit()  # очередь и новое расписание фиксируются вместе
+
+    notify_changed(mail_id)
+    start_drain(bot, mail_id, sched_iso)
+
+
 async def mailing_scheduler(bot: Bot) -> None:
     """Корутина-демон; запускать через `asyncio.create_task()` из `main.py`."""
-    # локальный импорт, чтобы избежать циклов
-    from admins.superadmin.mailing.handlers import _collect_recipients
+    resume_pending(bot)
+    _load_all()
 
     while True:
-        now_iso = datetime.now().isoformat(timespec="seconds")
-
-        cursor.execute(
-            """
-            SELECT id, message, filters, recurrence, scheduled_at
-              FROM mailings
-             WHERE scheduled_at <= ?
-               AND (recurrence <> 'once' OR sent = 0)
-            """,
-            (now_iso,),
-        )
-        tasks: List[tuple] = cursor.fetchall()
-
-        for mail_id, message, filters_json, recurrence, sched_iso in tasks:
-            filters: Dict = json.loads(filters_json or "{}")
-            recipients = _collect_recipients(filters)
-
-            for uid in recipients:
-                try:
-                    await bot.send_message(uid, message, parse_mode=ParseMode.MARKDOWN)
-                except Exception:  # pylint: disable=broad-except
-                    # можно логировать uid / исключение
-                    pass
-
-            next_dt = _next_run(datetime.fromisoformat(sched_iso), recurrence)
-
-            if next_dt is None:  # одноразовая
-                cursor.execute("UPDATE mailings SET sent = 1 WHERE id = ?", (mail_id,))
-            else:  # периодическая
-                cursor.execute(
-                    "UPDATE mailings SET scheduled_at = ? WHERE id = ?",
-                    (next_dt.isoformat(timespec="seconds"), mail_id),
-                )
-            conn.commit()
-
-        await asyncio.sleep(CHECK_INTERVAL)
+        head = _peek()
+        delay = MAX_SLEEP if head is None else (head[0] - datetime.now()).total_seconds()
+
+        if delay > 0:
+            _WAKEUP.clear()
+            try:
+                await asyncio.wait_for(_WAKEUP.wait(), timeout=min(delay, MAX_SLEEP))
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        due, mail_id = heapq.heappop(_HEAP)
+        _DUE.pop(mail_id, None)
+        _fire(bot, mail_id)
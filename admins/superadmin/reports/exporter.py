@@ -1,46 +1,67 @@
 """
-Экспорт отчётов в Excel или PDF + ZIP с изображениями.
+Экспорт отчётов в Excel, PDF, CSV или Parquet + ZIP с изображениями.
 
 Функция верхнего уровня — **export_report()**:
     Path = await export_report(kind, date_from, date_to,
-                               fmt="xlsx" | "pdf",
+                               fmt="xlsx" | "pdf" | "csv" | "parquet",
                                abs_places=[...])
 
 * Создаёт DataFrame по SQL-запросу;
-* подменяет file_id на миниатюры и собирает картинки;
-* пишет Excel (xlsxwriter) или PDF (reportlab);
-* упаковывает результат + изображения в ZIP и возвращает путь.
+* подменяет file_id на миниатюры и собирает картинки (миниатюры считаются
+  в пуле процессов, см. thumbs.py);
+* пишет Excel (xlsxwriter), PDF (reportlab platypus), CSV или Parquet
+  (pyarrow, если установлен); всё, кроме Excel, — потоково порциями строк;
+* пишет результат и изображения прямо в ZIP (без временных файлов)
+  и возвращает путь к архиву;
+* повторный запрос при неизменных данных отдаёт прошлый архив, а режим
+  «только новые» (`delta=True`) — лишь строки после прошлой выгрузки.
 
 Модуль независим, но использует `config.LOCATION_NAMES` и бот для загрузки фото.
 """
 
 from __future__ import annotations
 
+import asyncio
+import json
+import logging
 import re
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+from html import escape as html_escape
+from io import BytesIO, TextIOWrapper
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-
-from zipfile import ZIP_DEFLATED, ZipFile
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
 
 import pandas as pd
-from PIL import Image
+from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
+from reportlab.platypus import Frame, Image as RLImage, LongTable, Paragraph, TableStyle
+
+try:  # Parquet — опционально
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
 
+from admins.superadmin.reports.thumbs import Thumb, make_thumbs
+from admins.superadmin.utils.zip_stream import ZipStream
 from config import LOCATION_NAMES, bot
-from db.database import conn
+from db import file_cache, replica
+from db.database import conn, data_stamp
+
+log = logging.getLogger(__name__)
 
 # --- директории ------------------------------------------------------------ #
 DIR = Path(__file__).resolve().parent
 DIR_EXPORT = DIR / "exports"
-DIR_IMG = DIR_EXPORT / "images"
+DIR_THUMBS = DIR_EXPORT / "thumbs"
 DIR_EXPORT.mkdir(parents=True, exist_ok=True)
-DIR_IMG.mkdir(exist_ok=True)
 
 pdfmetrics.registerFont(TTFont("DejaVuSans", str(DIR / "fonts" / "DejaVuSans.ttf")))
 pdfmetrics.registerFont(
@@ -49,10 +70,19 @@ pdfmetrics.registerFont(
 
 # --- константы ------------------------------------------------------------- #
 THUMB = 90     # px
+PDF_THUMB = 240  # px — ~20 мм строки PDF при печати 300 dpi
+PDF_IMG_H = 20 * mm     # высота миниатюры в ячейке PDF
+STREAM_CHUNK = 500      # строк за одно чтение из БД при потоковых выгрузках
+PDF_TABLE_ROWS = 20     # строк в одной LongTable (дешевле делить по страницам)
+PDF_CELL_CHARS = 1500   # длиннее — обрезаем, чтобы строка влезла на страницу
 ROW_H = 90     # Excel row height
 COL_W = 18     # Excel col width for «Фото»
 
+FORMATS = ("xlsx", "pdf", "csv", "parquet")
+
 PHOTO_RE = re.compile(r"(?i)(photo|file|screenshot|argument)")
+FILE_ID_RE = r"[\w-]{20,}"   # похоже на Telegram file_id, а не на путь
+IMAGE_CONCURRENCY = 8        # одновременных загрузок фото
 
 BOOL_RU = {True: "Да", False: "Нет"}
 STATUS_RU = {"approved": "Одобрено", "pending": "На рассмотрении",
@@ -80,10 +110,13 @@ RU_HEADERS = {
     "argument": "Аргумент",
 }
 
-# --- SQL-шаблоны (с параметрами d_from / d_to) ----------------------------- #
+# --- SQL-шаблоны (с параметрами d_from / d_next) --------------------------- #
+# период полуоткрытый: col >= d_from AND col < d_next (день после конца) — так
+# фильтр идёт по индексу; даты в БД приведены к одному виду (normalize_report_dates)
+# row_id — id строки основной таблицы: по нему считается режим «только новые»
 QUERIES: Dict[str, str] = {
     "clean": """
-        SELECT r.id,
+        SELECT r.id        AS row_id,
                u.full_name  AS user_name,
                r.room_number,
                r.cleanliness_status,
@@ -92,10 +125,11 @@ QUERIES: Dict[str, str] = {
                r.file_id     AS photo
           FROM room_cleanliness_reports r
           JOIN users u ON u.user_id = r.user_id
-         WHERE DATE(r.created_at) BETWEEN :d_from AND :d_to
+         WHERE r.created_at >= :d_from AND r.created_at < :d_next
     """,
     "events": """
-        SELECT e.title AS event_title,
+        SELECT ea.id   AS row_id,
+               e.title AS event_title,
                e.event_date,
                u.full_name AS user_name,
                ea.attended,
@@ -104,10 +138,10 @@ QUERIES: Dict[str, str] = {
           FROM event_attendance ea
           JOIN events e ON e.id = ea.event_id
           JOIN users  u ON u.user_id = ea.user_id
-         WHERE DATE(ea.checked_at) BETWEEN :d_from AND :d_to
+         WHERE ea.checked_at >= :d_from AND ea.checked_at < :d_next
     """,
     "violations": """
-        SELECT v.id,
+        SELECT v.id        AS row_id,
                u.full_name AS user_name,
                v.description,
                v.violation_date,
@@ -122,10 +156,18 @@ QUERIES: Dict[str, str] = {
                WHERE document_type = 'violation_proof'
                GROUP BY user_id
           ) ud ON ud.user_id = v.user_id
-         WHERE DATE(v.violation_date) BETWEEN :d_from AND :d_to
+         WHERE v.violation_date >= :d_from AND v.violation_date < :d_next
     """,
 }
 
+# таблицы, из которых читает каждый отчёт (для кэша по версиям данных)
+SOURCES: Dict[str, Tuple[str, ...]] = {
+    "clean": ("room_cleanliness_reports", "users"),
+    "events": ("event_attendance", "events", "users"),
+    "violations": ("violations", "users", "user_documents"),
+    "absence": ("absences", "absence_files", "users"),
+}
+
 
 # --------------------------------------------------------------------------- #
 #                           ВСПОМОГАТЕЛЬНЫЕ                                   #
@@ -141,12 +183,8 @@ def _fname(kind: str, ext: str) -> Path:
 
 
 async def _ensure_image(file_id: str) -> Path:
-    """Скачивает файл-фото по file_id и кэширует локально."""
-    tg = await bot.get_file(file_id)
-    dst = DIR_IMG / f"{file_id}{Path(tg.file_path).suffix or '.jpg'}"
-    if not dst.exists():
-        await bot.download_file(tg.file_path, dst)
-    return dst
+    """Локальный путь к фото по file_id (через общий файловый кэш)."""
+    return await file_cache.get_path(bot, file_id)
 
 
 def _photo_cols(df: pd.DataFrame) -> List[str]:
@@ -158,20 +196,46 @@ async def _collect_images(df: pd.DataFrame) -> Dict[Tuple[int, str], Path]:
     """
     Находит все изображения, загружает их локально и возвращает маппинг
     (row-idx, col-name) → Path.  Ячейки в DataFrame при этом очищаются.
+
+    Все фото-колонки разворачиваются в одну серию ячеек, уникальные file_id
+    качаются параллельно (не больше `IMAGE_CONCURRENCY`), а результат
+    раскладывается обратно по ячейкам без построчного цикла.
     """
-    out: Dict[Tuple[int, str], Path] = {}
-    for r, row in df.iterrows():
-        for col in _photo_cols(df):
-            val = str(row[col])
-            if not val or val == "nan":
-                continue
+    t0 = time.perf_counter()
+    cols = _photo_cols(df)
+    if not cols or df.empty:
+        return {}
+
+    cells = df[cols].stack().dropna().astype(str)          # (row, col) → значение
+    cells = cells[(cells != "") & (cells != "nan")]
+    is_fid = cells.str.fullmatch(FILE_ID_RE)
+    file_ids = pd.unique(cells[is_fid])
+
+    sem = asyncio.Semaphore(IMAGE_CONCURRENCY)
+
+    async def _resolve(fid: str) -> Optional[Path]:
+        async with sem:
             try:
-                p = await _ensure_image(val) if re.fullmatch(r"[\w-]{20,}", val) else Path(val)
-            except Exception:
-                continue
-            out[(r, col)] = p
-            df.at[r, col] = ""
-    return out
+                return await _ensure_image(fid)
+            except Exception:  # pylint: disable=broad-except
+                return None
+
+    resolved = dict(zip(file_ids, await asyncio.gather(*map(_resolve, file_ids))))
+
+    paths = cells.map(Path).where(~is_fid, cells.map(resolved)).dropna()
+    hit = (
+        pd.Series(True, index=paths.index)
+        .unstack(fill_value=False)
+        .reindex(index=df.index, columns=cols, fill_value=False)
+        .astype(bool)
+    )
+    df[cols] = df[cols].mask(hit, "")
+
+    log.info(
+        "_collect_images: %d строк, %d ячеек, %d уникальных file_id, %.2f с",
+        len(df), len(cells), len(file_ids), time.perf_counter() - t0,
+    )
+    return dict(zip(paths.index, paths))
 
 
 def _strip_ids(df: pd.DataFrame) -> pd.DataFrame:
@@ -190,8 +254,13 @@ def _translate(df: pd.DataFrame) -> None:
 # --------------------------------------------------------------------------- #
 #                             XLSX  /  PDF                                    #
 # --------------------------------------------------------------------------- #
-def _excel(df: pd.DataFrame, dst: Path, images: Dict[Tuple[int, str], Path]) -> None:
-    """Сохраняет DataFrame в Excel + встраивает превью изображений."""
+def _excel(
+    df: pd.DataFrame,
+    dst: BinaryIO,
+    images: Dict[Tuple[int, str], Path],
+    thumbs: Dict[Path, Thumb],
+) -> None:
+    """Сохраняет DataFrame в Excel + встраивает миниатюры (оригиналы — по ссылке в ZIP)."""
     with pd.ExcelWriter(dst, engine="xlsxwriter") as writer:
         df.to_excel(writer, index=False, sheet_name="Report", startrow=1, header=False)
         wb, ws = writer.book, writer.sheets["Report"]
@@ -202,82 +271,162 @@ def _excel(df: pd.DataFrame, dst: Path, images: Dict[Tuple[int, str], Path]) ->
             ws.set_column(col_idx, col_idx, COL_W if col_name == "Фото" else 20)
 
         for (row_idx, col_name), img_path in images.items():
+            thumb = thumbs.get(img_path)
+            if thumb is None:
+                continue
             col_idx = df.columns.get_loc(col_name)
-            with Image.open(img_path) as im:
-                w, h = im.size
-            scale = min(THUMB / w, THUMB / h, 1.0)
 
             ws.set_row(row_idx + 1, ROW_H)
             ws.insert_image(
-                row_idx + 1, col_idx, str(img_path),
-                {"x_scale": scale, "y_scale": scale, "url": f"external:images/{img_path.name}",
-                 "positioning": 1}
+                row_idx + 1, col_idx, str(thumb.path),
+                {"url": f"external:images/{img_path.name}", "positioning": 1}
             )
 
 
-def _pdf(df: pd.DataFrame, dst: Path, images: Dict[Tuple[int, str], Path]) -> None:
-    """Пишет PDF-таблицу с изображениями (ReportLab)."""
-    c = canvas.Canvas(str(dst), pagesize=landscape(A4))
-    page_w, page_h = landscape(A4)
-
-    # — заголовок —
-    c.setFont("DejaVuSans-Bold", 14)
-    c.drawString(20 * mm, page_h - 15 * mm, f"Отчёт — {dst.stem}")
-
-    col_w = (page_w - 40 * mm) / len(df.columns)
-    y = page_h - 25 * mm
-
-    def _new_page():
-        nonlocal y
-        c.showPage()
-        y = page_h - 25 * mm
-
-    # — header —
-    c.setFont("DejaVuSans-Bold", 9)
-    for i, col in enumerate(df.columns):
-        c.drawString(20 * mm + i * col_w, y, str(col))
-    c.line(20 * mm, y - 2, page_w - 20 * mm, y - 2)
-    c.setFont("DejaVuSans", 8)
-    y -= 10 * mm
-    row_h = 20 * mm
-
-    for r, row in df.iterrows():
-        if y < 20 * mm:
-            _new_page()
-        for i, (col, val) in enumerate(row.items()):
-            x = 20 * mm + i * col_w
-            key = (r, col)
-            if key in images:
-                c.drawImage(str(images[key]), x, y - 5 * mm,
-                            width=col_w - 4 * mm, preserveAspectRatio=True, mask="auto")
-                c.linkURL(f"external:images/{images[key].name}",
-                          (x, y - 5 * mm, x + col_w - 4 * mm, y + row_h - 5 * mm))
-            else:
-                c.drawString(x, y + 4 * mm, str(val)[:40])
-        y -= row_h
-    c.save()
+class _PdfStream:
+    """
+    PDF-таблица, которая дописывается порциями строк (platypus `LongTable`).
+
+    Порция режется на небольшие `LongTable` по `PDF_TABLE_ROWS` строк с
+    переносом текста в ячейках и сразу раскладывается по страницам через
+    `Frame`, так что строки и таблицы держатся в памяти только для текущей
+    порции.  Готовые страницы reportlab хранит до `save()` уже сжатыми, а
+    `close()` пишет документ прямо в `dst` (запись ZIP) — без копии в
+    BytesIO.  Шапка таблицы ставится в начало каждой страницы; маленькие
+    таблицы дёшево делятся на границе страницы (LongTable пересчитывает
+    высоты всех своих строк при каждом делении).
+    """
+
+    def __init__(self, dst: BinaryIO, title: str) -> None:
+        self._dst = dst
+        self.c = canvas.Canvas(dst, pagesize=landscape(A4), pageCompression=1)
+        self.title = title
+        self.page_w, self.page_h = landscape(A4)
+        self.pages = 0
+        self._frame: Optional[Frame] = None
+        self._pending: List[LongTable] = []
+        self._header: Optional[LongTable] = None
+        self._cell = ParagraphStyle("cell", fontName="DejaVuSans", fontSize=7, leading=8.5)
+        self._head = ParagraphStyle("head", parent=self._cell, fontName="DejaVuSans-Bold")
+
+    # — страницы —
+    def _start_page(self) -> None:
+        top = self.page_h - 12 * mm
+        if self.pages == 0:
+            self.c.setFont("DejaVuSans-Bold", 14)
+            self.c.drawString(20 * mm, self.page_h - 15 * mm, f"Отчёт — {self.title}")
+            top = self.page_h - 22 * mm
+        self._frame = Frame(20 * mm, 12 * mm, self.page_w - 40 * mm, top - 12 * mm,
+                            leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+        self._frame.add(self._header, self.c)
+
+    def _end_page(self) -> None:
+        self.pages += 1
+        self.c.setFont("DejaVuSans", 7)
+        self.c.drawRightString(self.page_w - 20 * mm, 6 * mm, str(self.pages))
+        self.c.showPage()
+        self._frame = None
+
+    # — таблица —
+    def _image_cell(self, original: Path, thumb: Optional[Thumb], col_w: float) -> list:
+        link = Paragraph(f'<link href="images/{original.name}">оригинал</link>', self._cell)
+        if thumb is None:
+            return [link]
+        scale = min((col_w - 2 * mm) / thumb.width, PDF_IMG_H / thumb.height, 1.0)
+        return [RLImage(str(thumb.path), thumb.width * scale, thumb.height * scale), link]
+
+    def _styled(self, rows: list, col_w: float, header: bool = False) -> LongTable:
+        table = LongTable(rows, colWidths=[col_w] * len(rows[0]))
+        style = [
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 2),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 2),
+        ]
+        if header:
+            style.append(("BACKGROUND", (0, 0), (-1, -1), colors.HexColor("#eeeeee")))
+        table.setStyle(TableStyle(style))
+        return table
+
+    def _tables(self, df: pd.DataFrame, images: Dict[Tuple[int, str], Path],
+                thumbs: Dict[Path, Thumb]) -> List[LongTable]:
+        cols = list(df.columns)
+        col_w = (self.page_w - 40 * mm) / len(cols)
+        if self._header is None:
+            self._header = self._styled([[Paragraph(html_escape(str(c)), self._head) for c in cols]],
+                                        col_w, header=True)
+
+        rows: list = []
+        texts = df.fillna("").astype(str).itertuples(index=False)
+        for r, vals in zip(df.index, texts):
+            row = []
+            for col, val in zip(cols, vals):
+                img = images.get((r, col))
+                if img is not None:
+                    row.append(self._image_cell(img, thumbs.get(img), col_w))
+                else:
+                    row.append(Paragraph(html_escape(val[:PDF_CELL_CHARS]), self._cell))
+            rows.append(row)
+
+        return [
+            self._styled(rows[i:i + PDF_TABLE_ROWS], col_w)
+            for i in range(0, len(rows), PDF_TABLE_ROWS)
+        ]
+
+    def add(self, df: pd.DataFrame, images: Dict[Tuple[int, str], Path],
+            thumbs: Dict[Path, Thumb]) -> None:
+        """Дописать порцию строк и выложить всё, что уже заполняет страницы."""
+        self._pending.extend(self._tables(df, images, thumbs))
+        while self._pending:  # страница, заполненная не до конца, ждёт следующую порцию
+            if self._frame is None:
+                self._start_page()
+            head = self._pending[0]
+            if self._frame.add(head, self.c, trySplit=0):
+                self._pending.pop(0)
+                continue
+
+            parts = self._frame.split(head, self.c)  # таблица режется по строкам, шапка повторяется
+            if parts:
+                self._pending[0:1] = parts
+                if self._frame.add(parts[0], self.c, trySplit=0):
+                    self._pending.pop(0)
+            elif self._frame._atTop:  # строка выше страницы — пропускаем, иначе зациклимся
+                log.warning("PDF: строка не помещается на страницу и пропущена")
+                self._pending.pop(0)
+            self._end_page()
+
+    def close(self) -> None:
+        if self._frame is not None:
+            self._end_page()
+        self.c.save()
+        self._dst.close()
 
 
 # --------------------------------------------------------------------------- #
 #                            ОСНОВНАЯ ФУНКЦИЯ                                 #
 # --------------------------------------------------------------------------- #
-async def export_report(
-    kind: str,
-    date_from: str,
-    date_to: str,
-    fmt: str = "xlsx",
-    abs_places: Optional[List[str]] | None = None,
-) -> Path:
-    """Основная точка входа."""
-    # — DataFrame —
-    params = {"d_from": _iso(date_from), "d_to": _iso(date_to)}
+def _report_sql(kind: str, date_from: str, date_to: str,
+                abs_places: Optional[List[str]],
+                since_row_id: Optional[int] = None) -> Tuple[str, dict]:
+    """SQL и параметры отчёта `kind`; `since_row_id` — только строки новее него."""
+    sql, params = _base_sql(kind, date_from, date_to, abs_places)
+    if since_row_id is not None:
+        sql = f"SELECT * FROM ({sql}) WHERE row_id > :since"
+        params["since"] = since_row_id
+    return sql, params
+
+
+def _base_sql(kind: str, date_from: str, date_to: str,
+              abs_places: Optional[List[str]]) -> Tuple[str, dict]:
+    d_next = datetime.strptime(_iso(date_to), "%Y-%m-%d") + timedelta(days=1)
+    params = {"d_from": _iso(date_from), "d_next": d_next.strftime("%Y-%m-%d")}
     if kind in QUERIES:
-        df = pd.read_sql_query(QUERIES[kind], conn, params=params)
-    elif kind == "absence":
-        ph = ", ".join("?" * len(abs_places)) if abs_places else ""
+        return QUERIES[kind], params
+    if kind == "absence":
+        ph = ", ".join(f":p{i}" for i in range(len(abs_places))) if abs_places else ""
         sql = (
-            f"""
-            SELECT a.id,
+            """
+            SELECT a.id                AS row_id,
                    u.full_name         AS user_name,
                    a.reason,
                    a.place,
@@ -288,57 +437,224 @@ async def export_report(
               FROM absences a
               JOIN users u ON u.user_id = a.user_id
               LEFT JOIN absence_files af ON af.absence_id = a.id
-             WHERE DATE(a.date_from) <= :d_to
-               AND DATE(a.date_to)   >= :d_from
+             WHERE a.date_from < :d_next
+               AND a.date_to   >= :d_from
         """
             + (f" AND a.place IN ({ph})" if ph else "")
         )
         params.update({f"p{i}": v for i, v in enumerate(abs_places or [])})
-        df = pd.read_sql_query(sql, conn, params=params)
-        df["place"] = df["place"].map(LOCATION_NAMES).fillna(df["place"])
-    else:
-        raise ValueError(f"Неизвестный тип отчёта: {kind}")
+        return sql, params
+    raise ValueError(f"Неизвестный тип отчёта: {kind}")
 
-    if df.empty:
-        raise ValueError("За выбранный период записей нет.")
 
+async def _prepare(
+    df: pd.DataFrame, *, images: bool = True
+) -> Tuple[pd.DataFrame, Dict[Tuple[int, str], Path]]:
+    """Порция строк → (DataFrame с русскими заголовками, картинки по ячейкам)."""
+    if "place" in df.columns:
+        df["place"] = df["place"].map(LOCATION_NAMES).fillna(df["place"])
     df = _strip_ids(df)
     _translate(df)
-    images = await _collect_images(df)
-    # переименовать заголовки
+    found = await _collect_images(df) if images else {}
     df = df.rename(columns={c: RU_HEADERS.get(c, c) for c in df.columns})
-    img_map = {(r, RU_HEADERS.get(c, c)): p for (r, c), p in images.items()}
-
-    # — сохранить —
-    if fmt not in {"xlsx", "pdf"}:
-        raise ValueError("Формат должен быть xlsx или pdf.")
-    file_path = _fname(kind, "pdf" if fmt == "pdf" else "xlsx")
-    (_pdf if fmt == "pdf" else _excel)(df, file_path, img_map)
-
-    # — упаковать ZIP с картинками —
-    zip_path = _fname(kind, "zip")
-    with ZipFile(zip_path, "w", ZIP_DEFLATED) as arc:
-        arc.write(file_path, file_path.name)
-        for p in set(img_map.values()):
-            arc.write(p, Path("images") / p.name)
-    file_path.unlink(missing_ok=True)
+    return df, {(r, RU_HEADERS.get(c, c)): p for (r, c), p in found.items()}
+
+
+def _link_images(df: pd.DataFrame, images: Dict[Tuple[int, str], Path]) -> None:
+    """В табличных выгрузках ячейка с фото получает путь к файлу внутри ZIP."""
+    links = pd.Series({key: f"images/{p.name}" for key, p in images.items()}, dtype=object)
+    if links.empty:
+        return
+    links = links.unstack().reindex(index=df.index)
+    for col in links.columns:
+        df[col] = links[col].fillna(df[col])
+
+
+class _CsvStream:
+    """CSV, который дописывается порциями прямо в запись ZIP."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self._out = TextIOWrapper(raw, encoding="utf-8-sig", newline="")  # BOM — для Excel
+        self._header = True
+
+    def add(self, df: pd.DataFrame) -> None:
+        df.to_csv(self._out, index=False, header=self._header)
+        self._header = False
+
+    def close(self) -> None:
+        self._out.close()
+
+
+class _ParquetStream:
+    """Parquet, который дописывается row group'ами прямо в запись ZIP."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        if pq is None:
+            raise ValueError("Для выгрузки в Parquet нужен пакет pyarrow.")
+        self._raw = raw
+        self._writer = None
+
+    def add(self, df: pd.DataFrame) -> None:
+        # текстовые колонки — всегда string, чтобы схема не «прыгала» между порциями
+        df = df.astype({c: "string" for c in df.select_dtypes(include="object").columns})
+        schema = self._writer.schema if self._writer else None
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._raw, table.schema, compression="zstd")
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._raw.close()
+
+
+def _keys(kind: str, date_from: str, date_to: str, abs_places: Optional[List[str]],
+          fmt: str, with_images: bool) -> Tuple[str, str]:
+    """→ (ключ запроса целиком, ключ отчёта без формата) для `export_logs`."""
+    scope = {"kind": kind, "from": _iso(date_from), "to": _iso(date_to),
+             "places": sorted(abs_places or [])}
+    request = {**scope, "fmt": fmt, "images": with_images}
+    return (json.dumps(request, ensure_ascii=False, sort_keys=True),
+            json.dumps(scope, ensure_ascii=False, sort_keys=True))
+
+
+def _cached_export(request_key: str, stamp: str) -> Optional[Path]:
+    """Прошлый ZIP того же полного отчёта, если данные с тех пор не менялись."""
+    for (path,) in conn.execute(
+        "SELECT file_path FROM export_logs WHERE request_key = ? AND data_stamp = ? ORDER BY id DESC",
+        (request_key, stamp),
+    ).fetchall():
+        if path and Path(path).is_file():
+            return Path(path)
+    return None
+
+
+def _last_row_id(scope_key: str) -> Optional[int]:
+    """Последняя выгруженная строка отчёта (любой формат) — граница «только новых»."""
+    return conn.execute(
+        "SELECT MAX(max_row_id) FROM export_logs WHERE scope_key = ?", (scope_key,)
+    ).fetchone()[0]
+
+
+async def export_report(
+    kind: str,
+    date_from: str,
+    date_to: str,
+    fmt: str = "xlsx",
+    abs_places: Optional[List[str]] | None = None,
+    on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+    with_images: bool = True,
+    delta: bool = False,
+) -> Path:
+    """
+    Основная точка входа; `on_progress(percent)` — по мере готовности этапов.
+
+    PDF, CSV и Parquet строятся потоково: строки читаются из БД порциями по
+    `STREAM_CHUNK` и сразу дописываются в файл внутри ZIP, поэтому память не
+    растёт с размером отчёта.  Excel по-прежнему собирается из одного
+    DataFrame.  Для CSV/Parquet `with_images=False` пропускает загрузку фото
+    (в ячейках остаются file_id), иначе в ячейке — путь `images/...` в архиве.
+
+    Если такой же отчёт уже выгружался и исходные таблицы с тех пор не
+    менялись (см. `data_versions`), сразу возвращается прошлый ZIP.
+    `delta=True` — только строки, появившиеся после прошлой выгрузки этого
+    отчёта (тип, период, объекты — в любом формате).
+
+    Строки читаются из снимка базы (db/replica.py), а не из боевого `conn`,
+    поэтому долгая выгрузка не держит read-транзакцию, мешающую записи;
+    снимок может отставать не более чем на `replica.MAX_AGE` секунд.
+    """
+
+    async def _progress(percent: int) -> None:
+        if on_progress:
+            await on_progress(percent)
+
+    if fmt not in FORMATS:
+        raise ValueError(f"Формат должен быть одним из: {', '.join(FORMATS)}.")
+    if fmt == "parquet" and pq is None:
+        raise ValueError("Для выгрузки в Parquet нужен пакет pyarrow.")
+    with_images = with_images or fmt in {"xlsx", "pdf"}
+
+    # данные читаются из снимка базы (db/replica.py), журнал выгрузок — боевой
+    async with replica.snapshot() as source:
+        request_key, scope_key = _keys(kind, date_from, date_to, abs_places, fmt, with_images)
+        stamp = data_stamp(SOURCES.get(kind, ()), source)
+        since = _last_row_id(scope_key) if delta else None
+        if delta:
+            request_key = None  # дельту не переиспользуем: она зависит от прошлых выгрузок
+        else:
+            cached = _cached_export(request_key, stamp)
+            if cached is not None:
+                log.info("Отчёт %s: данные не менялись, отдаю %s", kind, cached.name)
+                return cached
+
+        sql, params = _report_sql(kind, date_from, date_to, abs_places, since)
+        total, max_row_id = source.execute(
+            f"SELECT COUNT(*), MAX(row_id) FROM ({sql})", params
+        ).fetchone()
+        if not total:
+            raise ValueError(
+                "Новых записей с прошлой выгрузки нет." if since is not None
+                else "За выбранный период записей нет."
+            )
+        await _progress(10)
+
+        report_name = _fname(kind, fmt).name
+        zip_path = _fname(kind, "zip")
+        img_paths: set = set()
+        arc = ZipStream(zip_path)
+        try:
+            if fmt == "xlsx":
+                df, img_map = await _prepare(pd.read_sql_query(sql, source, params=params))
+                await _progress(60)
+                thumbs = await make_thumbs(img_map.values(), THUMB, DIR_THUMBS)
+                await _progress(70)
+                buf = BytesIO()
+                await asyncio.to_thread(_excel, df, buf, img_map, thumbs)
+                await asyncio.to_thread(arc.write_bytes, report_name, buf.getvalue())
+                img_paths.update(img_map.values())
+            else:
+                if fmt == "pdf":
+                    out = _PdfStream(arc.open(report_name), Path(report_name).stem)
+                elif fmt == "csv":
+                    out = _CsvStream(arc.open(report_name))
+                else:
+                    out = _ParquetStream(arc.open(report_name))
+
+                done = 0
+                for chunk in pd.read_sql_query(sql, source, params=params, chunksize=STREAM_CHUNK):
+                    chunk, img_map = await _prepare(chunk, images=with_images)
+                    if fmt == "pdf":
+                        thumbs = await make_thumbs(img_map.values(), PDF_THUMB, DIR_THUMBS)
+                        await asyncio.to_thread(out.add, chunk, img_map, thumbs)
+                    else:
+                        _link_images(chunk, img_map)
+                        await asyncio.to_thread(out.add, chunk)
+                    img_paths.update(img_map.values())
+                    done += len(chunk)
+                    await _progress(10 + 70 * done // total)
+                await asyncio.to_thread(out.close)
+
+            await _progress(80)
+
+            # — картинки — следом за отчётом в тот же ZIP —
+            def _pack_images() -> None:
+                for p in img_paths:
+                    arc.write_file(f"images/{p.name}", p)
+                arc.close()
+
+            await asyncio.to_thread(_pack_images)
+        except BaseException:
+            arc.abort()
+            raise
 
     # — лог —
     conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS export_logs(
-            id INTEGER PRIMARY KEY,
-            report_type TEXT,
-            start_date TEXT,
-            end_date   TEXT,
-            file_path  TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-    )
-    conn.execute(
-        "INSERT INTO export_logs(report_type, start_date, end_date, file_path) VALUES(?,?,?,?)",
-        (kind, _iso(date_from), _iso(date_to), str(zip_path)),
+        "INSERT INTO export_logs(report_type, start_date, end_date, file_path, "
+        "request_key, scope_key, data_stamp, max_row_id) VALUES(?,?,?,?,?,?,?,?)",
+        (kind, _iso(date_from), _iso(date_to), str(zip_path),
+         request_key, scope_key, stamp, max_row_id),
     )
     conn.commit()
 
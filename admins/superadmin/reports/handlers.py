@@ -10,19 +10,19 @@ Handlers блока «Экспорт отчётов / статистика» с
 
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import List, Optional
 from textwrap import shorten
 
-from aiogram import F, html, types
+from aiogram import F, types
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram_dialog import DialogManager, StartMode
 
 from admins.filters.is_admin import IsAdmin
 from admins.superadmin.reports.calendar import rep_calendar_dialog
-from admins.superadmin.reports.exporter import export_report
+from admins.superadmin.reports.jobs import REPORT, submit
 from admins.superadmin.reports.keyboards import (
     absence_obj_kb,
     date_choose_kb,
@@ -30,8 +30,9 @@ from admins.superadmin.reports.keyboards import (
     reports_main_kb,
 )
 from admins.superadmin.reports.states import RepFSM
-from config import LOCATION_NAMES, bot, dp
-from db.database import conn
+from config import LOCATION_NAMES, dp
+from db import replica
+from db.database import get_stats_summary
 
 
 # ──────────────────────────────────────────
@@ -77,7 +78,7 @@ async def rep_choose_report(cb: types.CallbackQuery, state: FSMContext) -> None:
 
     # экспорт отчёта
     kind = cmd.split("_", 1)[1]  # clean / events / violations / absence
-    await state.update_data(report_kind=kind)
+    await state.update_data(report_kind=kind, delta=False)
 
     if kind == "absence":
         # шаг 1 — выбор объектов (локаций)
@@ -97,37 +98,43 @@ async def rep_choose_report(cb: types.CallbackQuery, state: FSMContext) -> None:
 # ──────────────────────────────────────────
 
 async def _show_stats(cb: types.CallbackQuery, state: FSMContext) -> None:
-    """Формирует и выводит агрегированную статистику по четырём таблицам."""
-    cur = conn.cursor()
-
-    cur.execute("SELECT COUNT(*) FROM room_cleanliness_reports")
-    clean_cnt = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM event_attendance WHERE attended = 1")
-    events_cnt = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM violations")
-    viol_cnt = cur.fetchone()[0]
-
-    cur.execute("SELECT place, COUNT(*) FROM absences GROUP BY place")
-    abs_rows = cur.fetchall()
-
+    """
+    Статистика из сводки `stats_counters`: всего / 30 дней / 7 дней / сегодня.
+
+    Читается из снимка базы (db/replica.py), поэтому может отставать на
+    `replica.MAX_AGE` секунд.
+    """
+    today = datetime.now().date()
+    periods = {
+        "month": (today - timedelta(days=29)).isoformat(),
+        "week": (today - timedelta(days=6)).isoformat(),
+        "today": today.isoformat(),
+    }
+    async with replica.snapshot() as source:
+        summary = get_stats_summary(periods, source)
+
+    def _line(counts: dict) -> str:
+        return (f"<b>{counts['total']}</b> "
+                f"(30 дн: {counts['month']}, 7 дн: {counts['week']}, сегодня: {counts['today']})")
+
+    empty = {"total": 0, "month": 0, "week": 0, "today": 0}
     lines = [
-        f"🧹 Отчётов чистоты: <b>{clean_cnt}</b>",
-        f"📅 Посещений мероприятий: <b>{events_cnt}</b>",
-        f"🚔 Нарушений: <b>{viol_cnt}</b>",
+        f"🧹 Отчётов чистоты: {_line(summary['clean'].get('', empty))}",
+        f"📅 Посещений мероприятий: {_line(summary['attended'].get('', empty))}",
+        f"🚔 Нарушений: {_line(summary['violations'].get('', empty))}",
         "",
         "🚪 <b>Отсутствия по объектам</b>:",
     ]
-    for place, cnt in abs_rows:
-        lines.append(f"  • {LOCATION_NAMES.get(place, place)} — {cnt}")
+    for place, counts in sorted(summary["absence"].items()):
+        if counts["total"]:
+            lines.append(f"  • {LOCATION_NAMES.get(place, place or '—')} — {_line(counts)}")
 
     await state.set_state(RepFSM.StatsShow)
     await cb.message.edit_text(
         "\n".join(lines),
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup.inline_keyboard(
-            [[InlineKeyboardButton(text="Назад", callback_data="rep_back2main")]]
+        reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text="Назад", callback_data="rep_back2main")]]
         ),
     )
     await cb.answer()
@@ -237,31 +244,43 @@ async def _ask_format(src: types.Message | types.CallbackQuery, state: FSMContex
         "Выберите формат файла:"
     )
     tgt = src.message if isinstance(src, types.CallbackQuery) else src
-    await _edit_safe(tgt, text=txt, reply_markup=format_kb())
+    await _edit_safe(tgt, text=txt, reply_markup=format_kb(data.get("delta", False)))
+
+
+@dp.callback_query(RepFSM.ChooseFormat, F.data == "rep_delta", IsAdmin())
+async def rep_toggle_delta(cb: types.CallbackQuery, state: FSMContext) -> None:
+    """Переключатель «только новые записи с прошлой выгрузки»."""
+    delta = not (await state.get_data()).get("delta", False)
+    await state.update_data(delta=delta)
+    await cb.message.edit_reply_markup(reply_markup=format_kb(delta))
+    await cb.answer()
 
 
 @dp.callback_query(RepFSM.ChooseFormat, F.data.startswith("rep_fmt:"), IsAdmin())
 async def rep_do_export(cb: types.CallbackQuery, state: FSMContext) -> None:
-    """Формируем и отправляем отчёт."""
-    fmt = cb.data.split(":")[1]
+    """Ставим отчёт в очередь выгрузок — файл пришлёт фоновый воркер."""
+    fmt, _, img = cb.data.split(":")[1].partition("+")
     data = await state.get_data()
 
-    await cb.answer("Формирую отчёт, это может занять время…", show_alert=True)
-    try:
-        zip_path = await export_report(
-            kind=data["report_kind"],
-            date_from=data["start"],
-            date_to=data["end"],
-            fmt=fmt,
-            abs_places=data.get("absence_objs"),
-        )
-    except Exception as exc:  # pylint: disable=broad-except
-        await _edit_safe(cb.message, text=f"❗️ Ошибка: {html.quote(str(exc))}")
-        await state.clear()
-        return
-
-    await bot.send_document(cb.from_user.id, FSInputFile(zip_path))
-    await cb.message.edit_text("✅ Отчёт готов!", reply_markup=reports_main_kb())
+    _, created = submit(
+        REPORT,
+        {
+            "kind": data["report_kind"],
+            "date_from": data["start"],
+            "date_to": data["end"],
+            "fmt": fmt,
+            "abs_places": data.get("absence_objs"),
+            "with_images": fmt in {"xlsx", "pdf"} or img == "img",
+            "delta": data.get("delta", False),
+        },
+        cb.message.chat.id,
+        cb.message.message_id,
+    )
+    await _edit_safe(
+        cb.message,
+        text="⏳ Отчёт поставлен в очередь…" if created
+        else "⏳ Такой отчёт уже формируется — пришлю его, как только будет готов.",
+    )
     await state.set_state(RepFSM.Main)
     await cb.answer()
 
@@ -0,0 +1,234 @@
+"""
+Очередь выгрузок
+================
+
+Хэндлеры не ждут формирования файла: `submit()` кладёт задачу в таблицу
+`export_jobs` и сразу возвращает управление, а фоновый `export_worker()`
+выполняет задачи (не больше `MAX_RUNNING` одновременно):
+
+* статусное сообщение запросившего правится по ходу работы («⏳ 40 %»);
+* одинаковая задача, пока она ждёт или выполняется, повторно не ставится —
+  новый запросивший добавляется в `export_job_waiters` и получит тот же файл;
+* готовый файл отправляется всем ожидающим, исход фиксируется в БД;
+* после перезапуска прерванные задачи (`running`) выполняются заново,
+  а недоставленные готовые файлы — досылаются.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from aiogram import Bot, html
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InlineKeyboardMarkup
+
+from admins.superadmin.reports.exporter import export_report
+from admins.superadmin.reports.keyboards import reports_main_kb
+from db.database import conn, export_candidates_zip_async
+
+log = logging.getLogger(__name__)
+
+MAX_RUNNING: int = 2           # одновременно выполняемых выгрузок
+PROGRESS_EVERY: float = 3.0    # не чаще раза в N секунд правим статус
+
+REPORT = "report"
+CANDIDATES = "candidates"
+
+_TITLES = {REPORT: "Отчёт", CANDIDATES: "Архив кандидатов"}
+
+_WAKEUP = asyncio.Event()
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+# --------------------------------------------------------------------------- #
+#                                 ОЧЕРЕДЬ                                     #
+# --------------------------------------------------------------------------- #
+
+
+def submit(kind: str, params: dict, chat_id: int, message_id: int) -> Tuple[int, bool]:
+    """
+    Ставит выгрузку в очередь → (job_id, создана ли новая задача).
+
+    `message_id` — статусное сообщение в `chat_id`, которое воркер будет
+    править; туда же уйдёт готовый файл.
+    """
+    params_json = json.dumps(params, ensure_ascii=False, sort_keys=True)
+    job_key = f"{kind}:{params_json}"
+
+    row = conn.execute(
+        "SELECT id FROM export_jobs WHERE job_key = ? AND status IN ('pending', 'running') LIMIT 1",
+        (job_key,),
+    ).fetchone()
+    created = row is None
+    if created:
+        job_id = conn.execute(
+            "INSERT INTO export_jobs (kind, params, job_key) VALUES (?, ?, ?)",
+            (kind, params_json, job_key),
+        ).lastrowid
+    else:
+        job_id = row[0]
+
+    conn.execute(
+        "INSERT OR IGNORE INTO export_job_waiters (job_id, chat_id, message_id) VALUES (?, ?, ?)",
+        (job_id, chat_id, message_id),
+    )
+    conn.commit()
+    _WAKEUP.set()
+    return job_id, created
+
+
+def _claim_next() -> Optional[Tuple[int, str, dict]]:
+    """Берёт самую старую `pending`-задачу и переводит её в `running`."""
+    row = conn.execute(
+        "SELECT id, kind, params FROM export_jobs WHERE status = 'pending' ORDER BY id LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return None
+    conn.execute(
+        "UPDATE export_jobs SET status = 'running', progress = 0, started_at = ? WHERE id = ?",
+        (_now(), row[0]),
+    )
+    conn.commit()
+    return row[0], row[1], json.loads(row[2])
+
+
+def _finish(job_id: int, *, path: Optional[str] = None, error: Optional[str] = None) -> None:
+    conn.execute(
+        "UPDATE export_jobs SET status = ?, progress = ?, result_path = ?, error = ?, finished_at = ? "
+        "WHERE id = ?",
+        ("done" if error is None else "failed", 100 if error is None else 0, path, error, _now(), job_id),
+    )
+    conn.commit()
+
+
+def _waiters(job_id: int) -> List[Tuple[int, int]]:
+    return [
+        (r[0], r[1])
+        for r in conn.execute(
+            "SELECT chat_id, message_id FROM export_job_waiters WHERE job_id = ? AND delivered = 0",
+            (job_id,),
+        ).fetchall()
+    ]
+
+
+def recover_interrupted() -> int:
+    """При старте: `running` → `pending` (выгрузка идемпотентна, её можно повторить)."""
+    cur = conn.execute("UPDATE export_jobs SET status = 'pending', progress = 0 WHERE status = 'running'")
+    conn.commit()
+    return cur.rowcount
+
+
+# --------------------------------------------------------------------------- #
+#                                 ВОРКЕР                                      #
+# --------------------------------------------------------------------------- #
+
+
+async def _edit_status(bot: Bot, job_id: int, text: str, markup: Optional[InlineKeyboardMarkup] = None) -> None:
+    for chat_id, message_id in _waiters(job_id):
+        try:
+            await bot.edit_message_text(
+                text, chat_id=chat_id, message_id=message_id, parse_mode="HTML", reply_markup=markup
+            )
+        except TelegramBadRequest:
+            pass  # сообщение удалено или текст не изменился
+
+
+async def _deliver(bot: Bot, job_id: int, kind: str, path: str) -> None:
+    """Отправляет готовый файл всем, кто его ждёт."""
+    markup = reports_main_kb() if kind == REPORT else None
+    for chat_id, message_id in _waiters(job_id):
+        try:
+            await bot.send_document(chat_id, FSInputFile(path))
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Выгрузка %s: не удалось отправить файл в %s", job_id, chat_id)
+            continue  # не доставлено — повторим после перезапуска (_redeliver)
+        conn.execute(
+            "UPDATE export_job_waiters SET delivered = 1 WHERE job_id = ? AND chat_id = ? AND message_id = ?",
+            (job_id, chat_id, message_id),
+        )
+        conn.commit()
+        try:
+            await bot.edit_message_text(
+                f"✅ {_TITLES[kind]} готов!", chat_id=chat_id, message_id=message_id, reply_markup=markup
+            )
+        except TelegramBadRequest:
+            pass  # статусное сообщение уже удалено
+
+
+async def _run(bot: Bot, job_id: int, kind: str, params: dict) -> None:
+    title = _TITLES.get(kind, "Выгрузка")
+    last = 0.0
+
+    async def _progress(percent: int) -> None:
+        nonlocal last
+        conn.execute("UPDATE export_jobs SET progress = ? WHERE id = ?", (percent, job_id))
+        conn.commit()
+        if time.monotonic() - last >= PROGRESS_EVERY:
+            last = time.monotonic()
+            await _edit_status(bot, job_id, f"⏳ {title}: {percent} %")
+
+    await _edit_status(bot, job_id, f"⏳ {title}: формирую…")
+    try:
+        if kind == REPORT:
+            path = await export_report(**params, on_progress=_progress)
+        elif kind == CANDIDATES:
+            path = await export_candidates_zip_async(
+                bot, **params, on_progress=lambda done, total: _progress(done * 100 // max(total, 1))
+            )
+        else:
+            raise ValueError(f"Неизвестный тип выгрузки: {kind}")
+    except Exception as exc:  # pylint: disable=broad-except
+        log.exception("Выгрузка %s (%s) упала", job_id, kind)
+        _finish(job_id, error=str(exc))
+        markup = reports_main_kb() if kind == REPORT else None
+        await _edit_status(bot, job_id, f"❗️ Ошибка: {html.quote(str(exc))}", markup)
+        return
+
+    _finish(job_id, path=str(path))
+    await _deliver(bot, job_id, kind, str(path))
+
+
+async def _redeliver(bot: Bot) -> None:
+    """Готовые файлы, которые не успели отправить до перезапуска."""
+    for job_id, kind, path in conn.execute(
+        """
+        SELECT DISTINCT j.id, j.kind, j.result_path
+          FROM export_jobs j
+          JOIN export_job_waiters w ON w.job_id = j.id
+         WHERE j.status = 'done' AND w.delivered = 0
+        """
+    ).fetchall():
+        if path and Path(path).is_file():
+            await _deliver(bot, job_id, kind, path)
+
+
+async def export_worker(bot: Bot) -> None:
+    """Фоновая задача: выполняет выгрузки из `export_jobs`, пока работает бот."""
+    restarted = recover_interrupted()
+    if restarted:
+        log.warning("Выгрузки: %s задач прервано перезапуском, выполняю заново", restarted)
+    await _redeliver(bot)
+
+    slots = asyncio.Semaphore(MAX_RUNNING)
+    running: set = set()  # сильные ссылки на задачи, пока они выполняются
+    while True:
+        await slots.acquire()
+        job = _claim_next()
+        if job is None:
+            slots.release()
+            _WAKEUP.clear()
+            await _WAKEUP.wait()
+            continue
+        task = asyncio.create_task(_run(bot, *job))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
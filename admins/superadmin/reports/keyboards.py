@@ -4,6 +4,7 @@ Inline-клавиатуры блока «Экспорт отчётов».
 
 from __future__ import annotations
 
+from importlib.util import find_spec
 from typing import List
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
@@ -11,6 +12,8 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from config import LOCATION_NAMES
 
+PARQUET = find_spec("pyarrow") is not None  # без pyarrow кнопки Parquet не показываем
+
 
 # ─── Главное меню ────────────────────────────────────────────────────────── #
 def reports_main_kb() -> InlineKeyboardMarkup:
@@ -49,12 +52,20 @@ def date_choose_kb(back_cb: str) -> InlineKeyboardMarkup:
 
 
 # ─── Формат файла ────────────────────────────────────────────────────────── #
-def format_kb() -> InlineKeyboardMarkup:
-    return (
+def format_kb(delta: bool = False) -> InlineKeyboardMarkup:
+    """`delta` — включён ли режим «только новые с прошлой выгрузки»."""
+    kb = (
         InlineKeyboardBuilder()
+        .button(
+            text=("✅" if delta else "⬜️") + " Только новые с прошлой выгрузки",
+            callback_data="rep_delta",
+        )
         .button(text="📄 PDF", callback_data="rep_fmt:pdf")
         .button(text="📊 Excel", callback_data="rep_fmt:xlsx")
-        .button(text="Назад", callback_data="rep_back2start")
-        .adjust(1)
-        .as_markup()
+        .button(text="🧾 CSV", callback_data="rep_fmt:csv")
+        .button(text="🧾 CSV + фото", callback_data="rep_fmt:csv+img")
     )
+    if PARQUET:
+        kb.button(text="🗄 Parquet", callback_data="rep_fmt:parquet")
+        kb.button(text="🗄 Parquet + фото", callback_data="rep_fmt:parquet+img")
+    return kb.button(text="Назад", callback_data="rep_back2start").adjust(1).as_markup()
@@ -0,0 +1,94 @@
+"""
+Миниатюры для отчётов.
+
+В Excel/PDF встраиваются только миниатюры, а оригиналы лежат рядом в ZIP.
+Декодирование и уменьшение фото — работа для CPU, поэтому идёт в пуле
+процессов и не держит event loop бота.  Готовая миниатюра кэшируется
+на диске под sha256 содержимого оригинала и размером рамки, так что
+повторные выгрузки тех же фото ничего не пересчитывают.
+
+Пул запускается методом «spawn», а не fork: форк работающего бота копировал
+бы его соединение с SQLite, сессию aiohttp, потоки `to_thread` и захваченные
+ими блокировки.  Дочерние процессы импортируют этот модуль заново, поэтому
+он нарочно не импортирует ни `config`, ни бота; точка входа (main.py) держит
+побочные действия под `if __name__ == "__main__"`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+WORKERS: int = max(1, min(4, (os.cpu_count() or 2) - 1))  # процессов в пуле
+QUALITY: int = 80                                          # JPEG-качество миниатюр
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+@dataclass(frozen=True)
+class Thumb:
+    path: Path
+    width: int
+    height: int
+
+
+def _make_thumb(src: str, box: int, thumb_dir: str) -> Tuple[str, int, int]:
+    """
+    (выполняется в дочернем процессе) Миниатюра `src`, вписанная в `box`×`box`.
+
+    → (путь к миниатюре, ширина, высота).
+    """
+    h = hashlib.sha256()
+    with open(src, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    dst = Path(thumb_dir) / f"{h.hexdigest()}_{box}.jpg"
+
+    if dst.exists():
+        with Image.open(dst) as im:
+            return str(dst), im.width, im.height
+
+    with Image.open(src) as im:
+        im.draft("RGB", (box, box))  # JPEG декодируется сразу в уменьшенном масштабе
+        im = ImageOps.exif_transpose(im).convert("RGB")
+        im.thumbnail((box, box), Image.Resampling.LANCZOS)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_suffix(f".{os.getpid()}.part")
+        im.save(tmp, "JPEG", quality=QUALITY, optimize=True)
+        os.replace(tmp, dst)
+        return str(dst), im.width, im.height
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _POOL
+
+
+async def make_thumbs(paths: Iterable[Path], box: int, thumb_dir: Path) -> Dict[Path, Thumb]:
+    """
+    Миниатюры для набора файлов → {оригинал: Thumb}.
+
+    Файлы, которые не удалось декодировать (не картинка, битый файл), в
+    результат не попадают — в отчёте для них просто не будет превью.
+    """
+    loop = asyncio.get_running_loop()
+    paths = list(dict.fromkeys(paths))
+    results = await asyncio.gather(
+        *(loop.run_in_executor(_pool(), _make_thumb, str(p), box, str(thumb_dir)) for p in paths),
+        return_exceptions=True,
+    )
+    return {
+        p: Thumb(Path(r[0]), r[1], r[2])
+        for p, r in zip(paths, results)
+        if not isinstance(r, BaseException)
+    }
@@ -5,25 +5,38 @@
 Главные задачи:
 1. Найти Excel‑файл (`users.xlsx`) в подпапке `excel/` и для каждого листа сделать UPSERT строк в БД.
 2. Поддерживать разные структуры блоков внутри листа: данные могут разделяться «шапками» и метками «2024 / 2025».
+   Листы читаются потоково (openpyxl, read_only), порциями по `BATCH_ROWS` строк — память не зависит
+   от размера книги.
 3. Конвертировать «сырые» значения (телефон, username, ФИО) к единообразному формату.
 4. Обеспечивать целостность по «ключевым» полям (`UNIQUE_PRIORITY`), т.е. если пользователь найден по телефону,
    username или ФИО — обновлять, а не дублировать.
 5. Поддерживать конкурентный доступ (RLock) для безопасного повторного импорта во время работы бота.
+6. Писать пакетно: ключевые поля `users` читаются одним запросом (`UserUpsert`), совпадения ищутся
+   в памяти, запись — `executemany`, транзакция на порцию строк.
+7. Не трогать неизменённых: хэш содержимого строки хранится по (user_id, data_period) в
+   `import_row_hashes`; повторный импорт применяет только новые и изменённые строки и возвращает
+   сводку (`ImportSummary`), в том числе в режиме предпросмотра `dry_run`.
 """
 
 # ────────────────────────────
 #           ИМПОРТЫ
 # ────────────────────────────
+import hashlib          # Хэш содержимого строки → пропуск неизменённых
+import json
 import math             # Для проверки NaN через math.isnan()
 import re               # Регулярные выражения для очистки строк
+import sqlite3
 import threading        # RLock → защищаем импорт от параллельного вызова
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
-import pandas as pd     # Pandas → удобное чтение/обработка Excel
+import pandas as pd     # pd.isna → единая проверка пустых значений
+from openpyxl import load_workbook  # Потоковое (read_only) чтение листов
 
 # ───── Подключение к БД (ваш модуль) ──────────────────────────────────────
-from db.database import conn, cursor  # conn: sqlite3.Connection, cursor: sqlite3.Cursor
+from db.database import ImportCancelled, conn, invalidate_mailing_segments  # conn: sqlite3.Connection
 
 # ──────────────────────────── Константы ────────────────────────────────────
 BASE_DIR = Path(__file__).resolve().parent        # Папка текущего модуля
@@ -36,6 +49,7 @@ SHEET_MIR = "СВОД МИР"                     # Второе названи
 # Название поля‑столбца в БД, куда кладём «период данных»
 DATA_PERIOD_FIELD = "data_period"
 TABLE = "users"                             # Целевая таблица в SQLite
+BATCH_ROWS = 2000                           # Строк в одной порции для UserUpsert
 
 # Поля «первого приоритета» при UPSERT — в таком порядке пытаемся найти совпадение
 UNIQUE_PRIORITY = ["phone_number", "username", "full_name"]
@@ -128,17 +142,17 @@ def is_null(v: Any) -> bool:
 
 # ─────────────── Обеспечиваем колонку data_period в users ────────────────
 
-def ensure_data_period_column() -> None:
+def ensure_data_period_column(db: sqlite3.Connection = conn) -> None:
     """Если в таблице `users` ещё нет столбца `data_period`, добавляем его."""
-    cursor.execute("PRAGMA table_info(users)")
-    cols = {row[1] for row in cursor.fetchall()}
+    cols = {row[1] for row in db.execute("PRAGMA table_info(users)").fetchall()}
     if DATA_PERIOD_FIELD not in cols:
-        cursor.execute(f"ALTER TABLE users ADD COLUMN {DATA_PERIOD_FIELD} TEXT;")
+        db.execute(f"ALTER TABLE users ADD COLUMN {DATA_PERIOD_FIELD} TEXT;")
 
 
 # ─────────────────── Деление листа на «блоки данных» ─────────────────────
 #  Файл Excel может содержать несколько «шапок» — под каждый период (2023/2024 и т.п.).
-#  Функции ниже позволяют нарезать лист на DataFrame‑блоки с собственной шапкой.
+#  Лист читается потоково (openpyxl, read_only): функции ниже узнают шапки и метки
+#  периодов на лету и отдают готовые строки, не держа в памяти ни лист, ни блок.
 
 HEADER_TOKENS = {
     "фио",
@@ -151,59 +165,70 @@ HEADER_TOKENS = {
 }
 
 
-def is_header_row(row: pd.Series) -> bool:
-    """Определяем «шапку» по наличию ≥2 узнаваемых токенов."""
-    return len({norm(c) for c in row.dropna()} & HEADER_TOKENS) >= 2
+def cell_value(v: Any) -> Any:
+    """Значение ячейки, как его отдал бы `pd.read_excel`: "" → None, 25.0 → 25."""
+    if v == "":
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+
+
+def is_header_row(values: Iterable[Any]) -> bool:
+    """Определяем «шапку» по наличию ≥2 узнаваемых токенов среди непустых ячеек."""
+    return len({norm(c) for c in values if isinstance(c, str)} & HEADER_TOKENS) >= 2
+
+
+def select_columns(header: Sequence[Any], mapping: Dict[str, str]) -> List[Tuple[int, str]]:
+    """Шапка блока → [(номер колонки, поле users)] (регистр/пробелы в шапке не важны)."""
+    real_cols = {norm(c): i for i, c in enumerate(header) if norm(c)}  # при повторах — последняя
+    return [
+        (real_cols[norm(src)], dest)
+        for src, dest in mapping.items()
+        if dest and norm(src) in real_cols
+    ]
 
 
-def iter_blocks(raw_df: pd.DataFrame) -> Iterable[Tuple[pd.DataFrame, str]]:
-    """Итерирует лист и отдаёт пары (DataFrame блока, «строка‑метка периода»).
+def iter_block_rows(
+    rows: Iterable[Sequence[Any]],
+) -> Iterator[Tuple[Sequence[Any], str, List[Any]]]:
+    """Итерирует строки листа и отдаёт (шапка блока, «строка‑метка периода», строка данных).
 
-    Алгоритм построчно сканирует DataFrame и:
-    • При встрече новой «шапки» закрывает предыдущий буфер и начинает новый.
-    • Строка с ≤2 непустыми ячейками трактуется как «метка блока» (год/ап/проч.).
+    Алгоритм построчно сканирует лист и:
+    • При встрече новой «шапки» начинает новый блок.
+    • Строка с ≤2 непустыми ячейками трактуется как «метка блока» (год/ап/проч.);
+      метка вступает в силу со следующей шапки.
     • Пустая строка завершает блок, если он уже начат.
     """
-    header: List[Any] | None = None  # Текущая шапка блока
-    buf: List[List[Any]] = []        # Буфер строк текущего блока
-    current_label = "current"        # Текущий «период» (по умолчанию)
-    pending_label: str | None = None # Лейбл, который вступит в силу после шапки
-
-    for _, row in raw_df.iterrows():
-        if is_header_row(row):
-            # → Сохраняем предыдущий блок, если он существует
-            if header and buf:
-                yield pd.DataFrame(buf, columns=header), current_label
-                buf.clear()
+    header: Sequence[Any] | None = None  # Текущая шапка блока
+    current_label = "current"            # Текущий «период» (по умолчанию)
+    pending_label: str | None = None     # Лейбл, который вступит в силу после шапки
+
+    for raw in rows:
+        row = [cell_value(v) for v in raw]
+        non_null = [v for v in row if v is not None]
+
+        if is_header_row(non_null):
             # Если до шапки встретилась строка‑метка — применяем
             if pending_label:
                 current_label = pending_label
                 pending_label = None
-            # Обновляем текущую шапку
-            header = row.tolist()
+            header = row
             continue
 
-        non_null = row.dropna()
-
         # Строка‑метка: не шапка и ≤2 непустых ячейки
-        if 0 < non_null.count() <= 2 and not is_header_row(row):
-            val = norm(non_null.iloc[0])
+        if 0 < len(non_null) <= 2:
+            val = norm(non_null[0])
             if val:
                 pending_label = val
             continue
 
-        # «Обычная» строка датасета → добавляем в буфер
+        # «Обычная» строка датасета
         if header:
-            if non_null.empty:  # Пустая строка → завершает блок
-                if buf:
-                    yield pd.DataFrame(buf, columns=header), current_label
-                header, buf = None, []
+            if not non_null:  # Пустая строка → завершает блок
+                header = None
             else:
-                buf.append(row.tolist())
-
-    # Финальный блок (если файл не кончался пустой строкой)
-    if header and buf:
-        yield pd.DataFrame(buf, columns=header), current_label
+                yield header, current_label, row
 
 
 def translate_label(raw: str) -> str:
@@ -226,105 +251,266 @@ def translate_label(raw: str) -> str:
 INVALID_ROW_TOKENS = {"фио", "страна", "country", "full name", "username", "tg"}
 
 
-def looks_like_header_dup(s: pd.Series) -> bool:
+def looks_like_header_dup(rec: Dict[str, Any]) -> bool:
     """Похожа ли строка на повтор шапки внутри блока."""
-    return len({norm(v) for v in s.dropna()} & INVALID_ROW_TOKENS) >= 2
+    return len({norm(v) for v in rec.values() if isinstance(v, str)} & INVALID_ROW_TOKENS) >= 2
 
 
-def looks_like_year_row(s: pd.Series) -> bool:
+def looks_like_year_row(rec: Dict[str, Any]) -> bool:
     """Проверяем: строка содержит год (4‑значное число) в колонке full_name — такие удаляем."""
-    name_val = s.get("full_name")
+    name_val = rec.get("full_name")
     return isinstance(name_val, str) and name_val.isdigit() and len(name_val) == 4
 
 
-# ───────────────────── Подготовка DataFrame блока к UPSERT ────────────────
+# ───────────────────── Подготовка строк листа к UPSERT ─────────────────────
 
-def prepare_df(
-    df: pd.DataFrame,
+def iter_records(
+    rows: Iterable[Sequence[Any]],
     mapping: Dict[str, str],
     program_val: str,
-    period: str | None = None,
-) -> pd.DataFrame:
-    """Мэппинг колонок Excel → столбцы БД + очистка/фильтрация строк."""
-    if df.empty:
-        return pd.DataFrame()
-
-    # 1. Определяем реальные названия колонок в Excel (регистр/пробелы могут различаться)
-    real_cols = {norm(c): c for c in df.columns if norm(c)}
-
-    # 2. Строим select‑словарь: Excel‑колонка → поле users
-    select = {
-        real_cols[norm(src)]: dest
-        for src, dest in mapping.items()
-        if dest and norm(src) in real_cols
-    }
-    if not select:
-        return pd.DataFrame()  # Нет ни одной нужной колонки
-
-    # 3. Переименовываем/оставляем только нужные столбцы
-    df = df[list(select.keys())].rename(columns=select)
-
-    # 4. Очистка телефонов/username
-    if "phone_number" in df:
-        df["phone_number"] = df["phone_number"].apply(clean_phone)
-    if "username" in df:
-        df["username"] = df["username"].apply(clean_username)
-
-    # 5. Удаляем «мусорные» строки (дубли шапки, строчка с годом)
-    df = df[
-        ~df.apply(looks_like_header_dup, axis=1)
-        & ~df.apply(looks_like_year_row, axis=1)
-    ]
+) -> Iterator[Dict[str, Any]]:
+    """Строки листа → словари для `UserUpsert`: мэппинг колонок + очистка/фильтрация.
 
-    # 6. Удаляем полностью пустые строки
-    df.dropna(how="all", inplace=True)
+    В словаре только непустые значения; `program` и `data_period` проставлены.
+    """
+    header: Sequence[Any] | None = None
+    select: List[Tuple[int, str]] = []
+    period = "current"
+    for block_header, raw_label, row in iter_block_rows(rows):
+        # 1. Колонки считаем один раз на блок
+        if block_header is not header:
+            header = block_header
+            select = select_columns(header, mapping)
+            period = translate_label(raw_label)
+        if not select:
+            continue  # Нет ни одной нужной колонки
+
+        # 2. Excel‑колонка → поле users (пустые значения не берём)
+        rec: Dict[str, Any] = {}
+        for i, dest in select:
+            v = row[i] if i < len(row) else None
+            if v is not None:
+                rec[dest] = v
+
+        # 3. Очистка телефонов/username
+        if "phone_number" in rec:
+            rec["phone_number"] = clean_phone(rec["phone_number"])
+        if "username" in rec:
+            rec["username"] = clean_username(rec["username"])
+        rec = {k: v for k, v in rec.items() if v is not None}
+
+        # 4. Удаляем «мусорные» строки (дубли шапки, строчка с годом) и пустые
+        if not rec or looks_like_header_dup(rec) or looks_like_year_row(rec):
+            continue
 
-    # 7. Проставляем program (значение зависит от листа). Россия → отдельное значение «РФ»
-    df["program"] = program_val
-    if "country" in df.columns:
-        mask_russia = (
-            df["country"].fillna("").str.strip().str.lower().isin({"россия", "russia"})
-        )
-        df.loc[mask_russia, "program"] = "РФ"
-
-    # 8. Если передан период — записываем в поле data_period
-    if period is not None:
-        df[DATA_PERIOD_FIELD] = period
-
-    return df
-
-
-# ───────────────────────────── UPSERT в БД ───────────────────────────────
-
-def upsert_user(row: Dict[str, Any]) -> None:
-    """UPSERT одной записи в таблицу `users` по приоритету из `UNIQUE_PRIORITY`."""
-    existing_id = None
-
-    # 1. Пытаемся найти совпадение по телефону / username / ФИО (в указанном порядке)
-    for field in UNIQUE_PRIORITY:
-        val = row.get(field)
-        if val:
-            cursor.execute(f"SELECT user_id FROM {TABLE} WHERE {field} = ?", (val,))
-            res = cursor.fetchone()
-            if res:
-                existing_id = res[0]
-                break
-
-    # 2. Если пользователь найден → UPDATE только непустых колонок
-    if existing_id:
-        cols = [k for k, v in row.items() if k != "user_id" and not is_null(v)]
-        if not cols:
-            return  # Обновлять нечего
-        cursor.execute(
-            f"UPDATE {TABLE} SET {', '.join(f'{c}=?' for c in cols)} WHERE user_id = ?",
-            [row[c] for c in cols] + [existing_id],
-        )
-    # 3. Если не найден → INSERT новой строки
-    else:
-        cols = list(row.keys())
-        cursor.execute(
-            f"INSERT INTO {TABLE} ({', '.join(cols)}) VALUES ({', '.join('?'*len(cols))})",
-            [row[c] for c in cols],
+        # 5. Проставляем program (значение зависит от листа). Россия → отдельное значение «РФ»
+        country = rec.get("country")
+        is_russia = isinstance(country, str) and country.strip().lower() in {"россия", "russia"}
+        rec["program"] = "РФ" if is_russia else program_val
+
+        # 6. Период блока → поле data_period
+        rec[DATA_PERIOD_FIELD] = period
+        yield rec
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Режет поток на списки по `size` элементов."""
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+# ─────────────────────────── Пакетный UPSERT ─────────────────────────────
+CONFLICT_SAMPLES = 20  # сколько конфликтных строк перечислять в сводке
+
+
+@dataclass
+class ImportSummary:
+    """Итог импорта (или предпросмотра) по строкам Excel."""
+    new: int = 0            # нет такого участника → добавлен
+    changed: int = 0        # найден, содержимое строки изменилось → обновлён
+    unchanged: int = 0      # найден, та же строка уже импортировалась → пропущен
+    conflicting: int = 0    # ключи указывают на разных участников → пропущен
+    conflicts: List[str] = field(default_factory=list)  # первые CONFLICT_SAMPLES примеров
+    dry_run: bool = False
+
+
+def _canon(v: Any) -> str:
+    """Значение для хэша: 25.0 == 25, лишние пробелы не в счёт."""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    if isinstance(v, str):
+        return SPACE_RE.sub(" ", v).strip()
+    return str(v)
+
+
+def row_hash(row: Dict[str, Any]) -> str:
+    """Хэш нормализованного содержимого строки (пустые поля не учитываются)."""
+    items = sorted((k, _canon(v)) for k, v in row.items() if not is_null(v))
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False).encode()).hexdigest()
+
+
+def _describe(row: Dict[str, Any]) -> str:
+    return " / ".join(str(row[f]) for f in ("full_name", "phone_number", "username") if row.get(f))
+
+
+def _key(v: Any) -> str | None:
+    """Значение ключевого поля для словаря совпадений (как его сравнит SQLite с TEXT)."""
+    return None if is_null(v) else str(v)
+
+
+class UserUpsert:
+    """Пакетный UPSERT в `users` по приоритету из `UNIQUE_PRIORITY`.
+
+    • Найденному участнику обновляются только непустые колонки строки,
+      ненайденный добавляется новой записью.
+
+    • Ключевые поля (`UNIQUE_PRIORITY`) всех пользователей читаются одним
+      запросом в словари «значение → user_id» — поиск совпадения без SQL.
+    • Строки сопоставляются по порядку, и словари сразу обновляются, поэтому
+      более поздняя строка «видит» пользователя, добавленного или изменённого
+      более ранней, как и при построчном импорте.
+    • Запись — `executemany`, сгруппированный по набору колонок, через
+      соединение `db`; коммит делает вызывающий (после каждой порции).
+    • Строка, чей хэш совпал с сохранённым для (user_id, data_period, номер
+      повтора), пропускается.  Но если участник уже изменён этим импортом,
+      его последующие строки применяются всегда — «последняя строка
+      побеждает», как при полном импорте.
+    • Строка, ключи которой однозначно указывают на разных участников, не
+      применяется и попадает в сводку.
+    • `dry_run=True` — только сопоставление и сводка, без записи в БД.
+    """
+
+    def __init__(self, dry_run: bool = False, db: sqlite3.Connection = conn) -> None:
+        self.db = db
+        self.dry_run = dry_run
+        self.summary = ImportSummary(dry_run=dry_run)
+        self._ids: Dict[str, Dict[str, set]] = {f: {} for f in UNIQUE_PRIORITY}
+        self._keys: Dict[int, Dict[str, str | None]] = {}  # user_id → его ключевые значения
+        for uid, *vals in db.execute(f"SELECT user_id, {', '.join(UNIQUE_PRIORITY)} FROM {TABLE}"):
+            self._set_keys(uid, dict(zip(UNIQUE_PRIORITY, vals)))
+        max_id = db.execute(f"SELECT MAX(user_id) FROM {TABLE}").fetchone()[0]
+        self._next_id = (max_id or 0) + 1  # как у SQLite при INSERT без user_id
+        self._hashes: Dict[Tuple[int, str, int], str] = {
+            (uid, period, seq): h
+            for uid, period, seq, h in db.execute(
+                "SELECT user_id, data_period, seq, row_hash FROM import_row_hashes"
+            )
+        }
+        self._seq: Dict[Tuple[int, str], int] = {}  # (user_id, период) → строк в этом импорте
+        self._touched: set = set()                  # user_id, изменённые этим импортом
+
+    def _set_keys(self, uid: int, values: Dict[str, Any]) -> None:
+        current = self._keys.setdefault(uid, {})
+        for key_field, val in values.items():
+            old = current.get(key_field)
+            if old is not None:
+                self._ids[key_field][old].discard(uid)
+            current[key_field] = _key(val)
+            if current[key_field] is not None:
+                self._ids[key_field].setdefault(current[key_field], set()).add(uid)
+
+    def _match(self, row: Dict[str, Any]) -> Tuple[int | None, bool]:
+        """
+        → (user_id, конфликт).
+
+        Участника определяет самое приоритетное поле, совпавшее ровно с
+        одним id (тёзки по ФИО не мешают совпадению по телефону).  Если
+        однозначных совпадений нет — как `SELECT user_id … WHERE поле = ?`
+        по приоритету (первый, т.е. меньший id).  Конфликт — два поля
+        однозначно указывают на разных участников.
+        """
+        unique: set = set()  # id, на которые однозначно указало какое-либо поле
+        uid = fallback = None
+        for key_field in UNIQUE_PRIORITY:
+            val = row.get(key_field)
+            if val:
+                ids = self._ids[key_field].get(_key(val))
+                if not ids:
+                    continue
+                if len(ids) == 1:
+                    unique |= ids
+                    if uid is None:
+                        uid = next(iter(ids))
+                elif fallback is None:
+                    fallback = min(ids)
+        return (uid if uid is not None else fallback), len(unique) > 1
+
+    def add(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Сопоставляет порцию строк и сразу пишет её в БД (без коммита)."""
+        summary = self.summary
+        inserts: Dict[int, Dict[str, Any]] = {}
+        updates: Dict[int, Dict[str, Any]] = {}
+        hashes: Dict[Tuple[int, str, int], str] = {}
+        for row in records:
+            uid, conflict = self._match(row)
+            if conflict:
+                summary.conflicting += 1
+                if len(summary.conflicts) < CONFLICT_SAMPLES:
+                    summary.conflicts.append(_describe(row))
+                continue
+
+            if uid is None:
+                uid = self._next_id
+                self._next_id += 1
+                inserts[uid] = dict(row)
+                self._set_keys(uid, {f: row.get(f) for f in UNIQUE_PRIORITY})
+                self._touched.add(uid)
+                summary.new += 1
+                hashes[self._hash_key(uid, row)] = row_hash(row)
+                continue
+
+            key, h = self._hash_key(uid, row), row_hash(row)
+            if uid not in self._touched and self._hashes.get(key) == h:
+                summary.unchanged += 1
+                continue
+            cols = {k: v for k, v in row.items() if k != "user_id" and not is_null(v)}
+            target = inserts[uid] if uid in inserts else updates.setdefault(uid, {})
+            target.update(cols)
+            self._set_keys(uid, {f: cols[f] for f in UNIQUE_PRIORITY if f in cols})
+            self._touched.add(uid)
+            summary.changed += 1
+            hashes[key] = h
+
+        if not self.dry_run:
+            self._write(inserts, updates, hashes)
+
+    def _hash_key(self, uid: int, row: Dict[str, Any]) -> Tuple[int, str, int]:
+        """(user_id, период, номер повтора) — повторы участника в периоде не затирают друг друга."""
+        period = str(row.get(DATA_PERIOD_FIELD) or "")
+        seq = self._seq.get((uid, period), 0)
+        self._seq[(uid, period)] = seq + 1
+        return uid, period, seq
+
+    def _write(
+        self,
+        inserts: Dict[int, Dict[str, Any]],
+        updates: Dict[int, Dict[str, Any]],
+        hashes: Dict[Tuple[int, str, int], str],
+    ) -> None:
+        groups: Dict[Tuple[str, Tuple[str, ...]], List[List[Any]]] = {}
+        for uid, row in inserts.items():
+            groups.setdefault(("insert", tuple(row)), []).append([uid, *row.values()])
+        for uid, row in updates.items():
+            if not row:
+                continue
+            groups.setdefault(("update", tuple(row)), []).append([*row.values(), uid])
+
+        for (op, cols), params in groups.items():
+            if op == "insert":
+                sql = (f"INSERT INTO {TABLE} (user_id, {', '.join(cols)}) "
+                       f"VALUES ({', '.join('?' * (len(cols) + 1))})")
+            else:
+                sql = f"UPDATE {TABLE} SET {', '.join(f'{c}=?' for c in cols)} WHERE user_id = ?"
+            self.db.executemany(sql, params)
+
+        self.db.executemany(
+            """
+            INSERT INTO import_row_hashes (user_id, data_period, seq, row_hash) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, data_period, seq)
+            DO UPDATE SET row_hash = excluded.row_hash, updated_at = CURRENT_TIMESTAMP
+            """,
+            [(*key, h) for key, h in hashes.items()],
         )
 
 
@@ -335,48 +521,75 @@ _import_lock = threading.RLock()  # Гарантируем, что только
 def import_excel_users(
     xlsx: Path = EXCEL_PATH,
     verbose: bool = True,
-) -> None:
+    dry_run: bool = False,
+    *,
+    db: sqlite3.Connection = conn,
+    on_progress: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> ImportSummary:
     """Главная функция: импортирует пользователей из Excel в БД.
 
-    • Можно вызывать многократно — для «горячего» обновления базы.
+    • Можно вызывать многократно — для «горячего» обновления базы;
+      неизменённые с прошлого импорта строки пропускаются.
     • Использует RLock → не блокирует чтение БД из других потоков.
     • Поддерживает отчётность через флаг `verbose`.
+    • `dry_run=True` — предпросмотр: та же сводка, но БД не меняется.
+    • Рассчитана на запуск в рабочем потоке: `db` — его собственное
+      соединение (см. `writer_connection`), `on_progress(текст)` вызывается
+      после каждой порции, выставленный `cancel` останавливает импорт
+      между порциями (`ImportCancelled`).  Каждая порция коммитится
+      отдельно, поэтому запись не держит базу на весь импорт, а после
+      остановки повторный импорт того же файла применит только остаток.
     """
     with _import_lock:
         # 1. Проверяем наличие файла
         if not xlsx.exists():
             raise FileNotFoundError(f"Excel‑файл не найден: {xlsx}")
 
-        # 2. Убеждаемся, что в БД есть колонка data_period
-        ensure_data_period_column()
+        # 2. Убеждаемся, что в БД есть колонка data_period (предпросмотр схему не меняет)
+        if not dry_run:
+            ensure_data_period_column(db)
 
-        # 3. Открываем книгу Excel (без чтения всего файла в память)
-        book = pd.ExcelFile(xlsx)
+        # 3. Открываем книгу Excel в режиме read_only: строки читаются потоком
+        book = load_workbook(xlsx, read_only=True, data_only=True)
         total_rows_imported = 0
-
-        # 4. Проходим по каждому «официальному» листу
-        for sheet_name, program_val in SHEET_PROGRAM.items():
-            if sheet_name not in book.sheet_names:
+        upsert = UserUpsert(dry_run, db)  # ключи users и хэши строк — одним запросом
+
+        try:
+            # 4. Проходим по каждому «официальному» листу
+            for sheet_name, program_val in SHEET_PROGRAM.items():
+                if sheet_name not in book.sheetnames:
+                    if verbose:
+                        print(f"[WARN] Лист '{sheet_name}' отсутствует — пропущен.")
+                    continue
+
+                rows = book[sheet_name].iter_rows(values_only=True)
+                rows_this_sheet = 0
+
+                # 5. Строки листа → порции по BATCH_ROWS → UPSERT (коммит на порцию)
+                for batch in batched(iter_records(rows, COLUMN_MAP[sheet_name], program_val), BATCH_ROWS):
+                    if cancel is not None and cancel.is_set():
+                        raise ImportCancelled(f"Импорт остановлен на листе «{sheet_name}»")
+                    rows_this_sheet += len(batch)
+                    upsert.add(batch)
+                    db.commit()
+                    if on_progress is not None:
+                        on_progress(f"{sheet_name}, период {batch[-1][DATA_PERIOD_FIELD]}: "
+                                    f"{rows_this_sheet} строк")
+
+                total_rows_imported += rows_this_sheet
                 if verbose:
-                    print(f"[WARN] Лист '{sheet_name}' отсутствует — пропущен.")
-                continue
-
-            raw = book.parse(sheet_name, header=None)  # Читаем лист без авто‑шапок
-            rows_this_sheet = 0
-
-            # 5. Нарезаем лист на блоки, каждый блок → prepare_df → UPSERT
-            for block_df, raw_label in iter_blocks(raw):
-                period = translate_label(raw_label)
-                df = prepare_df(block_df, COMMON_MAPPING, program_val, period)
-                rows_this_sheet += len(df)
-                for _, ser in df.iterrows():
-                    upsert_user(ser.dropna().to_dict())
-
-            total_rows_imported += rows_this_sheet
-            if verbose:
-                print(f"[INFO] {sheet_name}: импортировано {rows_this_sheet} строк (program={program_val})")
+                    print(f"[INFO] {sheet_name}: импортировано {rows_this_sheet} строк (program={program_val})")
+        finally:
+            book.close()  # read_only‑книга держит файл открытым
+            if not dry_run:
+                invalidate_mailing_segments()  # порции могли закоммититься и до ошибки / остановки
 
         # 6. Сохраняем изменения
-        conn.commit()
+        db.commit()
+        summary = upsert.summary
         if verbose:
-            print(f"[OK] Импорт завершён. Всего строк: {total_rows_imported}")
+            print(f"[OK] {'Предпросмотр' if dry_run else 'Импорт'} завершён. Всего строк: "
+                  f"{total_rows_imported} (новых: {summary.new}, изменено: {summary.changed}, "
+                  f"без изменений: {summary.unchanged}, конфликтов: {summary.conflicting})")
+        return summary
@@ -0,0 +1,111 @@
+"""
+Потоковая сборка ZIP-архивов для выгрузок.
+
+`ZipStream` пишет байты и файлы сразу в запись архива — без промежуточной
+папки на диске, которую потом пришлось бы архивировать и удалять:
+
+* уже сжатые форматы (JPEG, PNG, PDF, ZIP …) кладутся как `ZIP_STORED` —
+  пережимать их бессмысленно, а время тратится;
+* остальное (xlsx, txt, csv …) — `ZIP_DEFLATED`;
+* архив пишется в `<имя>.part` и переименовывается только после успешного
+  закрытия, так что недописанный файл никто не отправит.
+"""
+
+from __future__ import annotations
+
+import shutil
+import time
+from pathlib import Path, PurePosixPath
+from types import TracebackType
+from typing import IO, Optional, Set, Type
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+# форматы, которые уже сжаты — их не пережимаем
+STORED_SUFFIXES: Set[str] = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".pdf", ".zip", ".gz", ".mp4", ".mov", ".mp3", ".ogg", ".oga", ".parquet",
+}
+CHUNK = 1024 * 1024  # размер блока при копировании файла в архив
+
+
+def compression_for(name: str) -> int:
+    """ZIP_STORED для уже сжатых форматов, иначе ZIP_DEFLATED."""
+    return ZIP_STORED if PurePosixPath(name).suffix.lower() in STORED_SUFFIXES else ZIP_DEFLATED
+
+
+class ZipStream:
+    """ZIP-архив, в который записи пишутся по мере готовности."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".part")
+        self._zip = ZipFile(self._tmp, "w", ZIP_DEFLATED)
+        self._names: Set[str] = set()
+
+    def _unique(self, name: str) -> str:
+        """Не даём двум записям получить одно имя: a.jpg → a_2.jpg."""
+        name = PurePosixPath(name).as_posix()
+        if name not in self._names:
+            self._names.add(name)
+            return name
+        p = PurePosixPath(name)
+        n = 2
+        while (candidate := str(p.with_name(f"{p.stem}_{n}{p.suffix}"))) in self._names:
+            n += 1
+        self._names.add(candidate)
+        return candidate
+
+    def _info(self, name: str) -> ZipInfo:
+        info = ZipInfo(self._unique(name), date_time=time.localtime()[:6])
+        info.compress_type = compression_for(info.filename)
+        return info
+
+    def write_bytes(self, name: str, data: bytes) -> str:
+        """Записать готовые байты; → имя записи в архиве."""
+        info = self._info(name)
+        self._zip.writestr(info, data)
+        return info.filename
+
+    def write_file(self, name: str, src: Path) -> str:
+        """Скопировать файл с диска блоками по `CHUNK`; → имя записи."""
+        info = self._info(name)
+        with open(src, "rb") as fin, self._zip.open(info, "w", force_zip64=True) as fout:
+            shutil.copyfileobj(fin, fout, CHUNK)
+        return info.filename
+
+    def open(self, name: str) -> IO[bytes]:
+        """
+        Открыть запись на запись — для данных, которые пишутся порциями.
+
+        Пока поток не закрыт, другие записи в архив добавлять нельзя.
+        """
+        return self._zip.open(self._info(name), "w", force_zip64=True)
+
+    def close(self) -> Path:
+        """Закрыть архив и переименовать `.part` в итоговое имя."""
+        self._zip.close()
+        self._tmp.replace(self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """Бросить недописанный архив."""
+        try:
+            self._zip.close()
+        except ValueError:  # осталась открытая запись — файл всё равно выбрасываем
+            self._zip.fp.close()
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "ZipStream":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
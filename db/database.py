@@ -1,15 +1,23 @@
+import asyncio
+import logging
 import os
 import re
-import shutil
 import sqlite3
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from io import BytesIO
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Awaitable, Callable, Iterator, Tuple
 
 import pandas as pd
 from aiogram.types import FSInputFile
 
 from admins.utils import find_photo
+from db import replica
+
+log = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).resolve().parent
 conn = sqlite3.connect(BASE_DIR / "database.db", check_same_thread=False)
@@ -42,6 +50,13 @@ def db_user_insert(id: int, username: str, tg_full_name: str):
     cursor.execute('INSERT INTO users (user_id, username, tg_full_name, bot_user) VALUES (?, ?, ?, 1)',
                    (id, username, tg_full_name))
     conn.commit()
+    invalidate_mailing_segments()
+
+
+def invalidate_mailing_segments() -> None:
+    """Сбросить кэш размеров сегментов рассылок: изменились роли, тики, статусы или состав users."""
+    from admins.superadmin.mailing.recipients import invalidate_segments
+    invalidate_segments()
 
 
 def db_user_update(id: int, username: str, tg_full_name: str):
@@ -633,7 +648,7 @@ def mark_user_attendance(event_id: int, user_id: int, attended: bool, comment: s
     'attended' (True/False) — был ли пользователь на мероприятии.
     'comment' может содержать отчёт, ссылку на фото и т. д.
     """
-    now = datetime.now().isoformat()
+    now = datetime.now().strftime(FMT_ISO)
 
     # Проверяем, есть ли уже запись
     cursor.execute(
@@ -697,7 +712,7 @@ def admin_update_attendance(attendance_id: int, approved: bool):
     - approved=False => attended=0
     Также обновляем поле checked_at текущим временем.
     """
-    now = datetime.now().isoformat()
+    now = datetime.now().strftime(FMT_ISO)
     attended_val = 1 if approved else 0
 
     cursor.execute("""
@@ -719,7 +734,7 @@ def get_attendance_by_id(attendance_id: int) -> dict:
       "user_id": 123456,
       "attended": True,
       "comment": "photo_file_id=...",
-      "checked_at": "2025-08-20T15:34:12",
+      "checked_at": "2025-08-20 15:34:12",
       "photo_id": "...",
       "event_title": "Ефрейторство ФИНАЛ",
       "event_date": "2024-08-21 20:00:00"
@@ -908,6 +923,7 @@ def set_user_role(user_id: int, role: str | None) -> None:
             (user_id, role),
         )
     conn.commit()
+    invalidate_mailing_segments()
 
     # 3) если пользователь перестал быть РП – чистим practice_supervisors
     if (
@@ -950,6 +966,7 @@ def block_user(user_id: int, reason: str = "auto_registration_fail") -> None:
         (reason, user_id),
     )
     conn.commit()
+    invalidate_mailing_segments()
 
 
 def unblock_user(user_id: int) -> None:
@@ -963,6 +980,7 @@ def unblock_user(user_id: int) -> None:
         (user_id,),
     )
     conn.commit()
+    invalidate_mailing_segments()
 
 
 def save_practice_feedback(data: dict):
@@ -995,96 +1013,208 @@ def _slugify(text: str, max_len: int = 40) -> str:
     return text[:max_len] or "user"
 
 
-async def _download_telegram_file(bot, file_id: str, dest_base: Path):
+ARCHIVE_DOWNLOADS = 8        # одновременных скачиваний из Telegram
+ARCHIVE_PROGRESS_EVERY = 3.0  # как часто дёргать on_progress, сек
+
+ArchiveProgress = Callable[[int, int], Awaitable[None]]
+
+
+@dataclass
+class _ArchiveItem:
+    """Один файл архива: куда положить и откуда взять."""
+    dest: Path                   # путь без расширения, относительно корня выгрузки
+    src: Optional[str] = None    # локальный путь или file_id
+    text: Optional[str] = None   # содержимое .txt, если файла нет
+
+
+def _load_candidates_bundle(
+    role_code: str, source: sqlite3.Connection = conn
+) -> tuple[list[dict], list[_ArchiveItem]]:
     """
-    Качает файл по file_id и сохраняет на диске.
-    Если не удалось — создаёт .txt-заглушку.
+    Один запрос на всё: кандидаты + их документы + скрины симуляций.
+
+    Возвращает (строки для Excel, список файлов архива).  Читает собственным
+    курсором и сразу отпускает его — общий `cursor` не занимается на время
+    скачивания.  `source` — соединение, из которого читать (по умолчанию боевое).
     """
+    rows = source.execute(
+        """
+        SELECT u.user_id, u.username, u.full_name, u.tg_full_name, u.gender, u.country,
+               u.phone_number, u.email, u.age, u.program,
+               'doc' AS kind, d.document_type AS name, d.file_path AS src,
+               d.reason_of_absence AS reason, d.rowid AS ord
+          FROM users u
+          LEFT JOIN user_documents d ON d.user_id = u.user_id
+         WHERE u.role LIKE ?
+        UNION ALL
+        SELECT u.user_id, u.username, u.full_name, u.tg_full_name, u.gender, u.country,
+               u.phone_number, u.email, u.age, u.program,
+               'sim', s.simulation_type, s.screenshot_path, NULL, s.rowid
+          FROM users u
+          JOIN simulations s ON s.user_id = u.user_id
+         WHERE u.role LIKE ?
+         ORDER BY 1, 11, 15
+        """,
+        (f"{role_code}%", f"{role_code}%"),
+    ).fetchall()
+
+    user_cols = ("user_id", "username", "full_name", "tg_full_name", "gender",
+                 "country", "phone_number", "email", "age", "program")
+    candidates: Dict[int, dict] = {}
+    items: List[_ArchiveItem] = []
+    doc_idx: Dict[int, int] = {}
+
+    for r in rows:
+        uid = r["user_id"]
+        if uid not in candidates:
+            candidates[uid] = {c: r[c] for c in user_cols}
+        if r["name"] is None and r["src"] is None:  # LEFT JOIN без документов
+            continue
+
+        name_for_slug = r["full_name"] or r["tg_full_name"] or r["username"] or str(uid)
+        sub = Path("documents") / f"{uid}_{_slugify(name_for_slug)}"
+        if r["kind"] == "doc":
+            doc_idx[uid] = doc_idx.get(uid, 0) + 1
+            dest = sub / f"{r['name']}_{doc_idx[uid]}"
+            if r["src"]:
+                items.append(_ArchiveItem(dest, src=r["src"]))
+            else:  # нет файла → причина
+                items.append(_ArchiveItem(dest, text=r["reason"] or "—"))
+        elif r["src"]:
+            items.append(_ArchiveItem(sub / f"{r['name']}", src=r["src"]))
+
+    return list(candidates.values()), items
+
+
+async def _resolve_archive_item(
+    bot, item: _ArchiveItem, sem: asyncio.Semaphore
+) -> tuple[Path, bytes | Path]:
+    """Где взять содержимое одного файла → (путь в архиве, байты или локальный файл)."""
+    if item.text is not None:
+        return item.dest.with_suffix(".txt"), item.text.encode("utf-8")
+
+    src = item.src
+    if os.path.isfile(src):  # локальный файл
+        return item.dest.with_suffix(Path(src).suffix), Path(src)
+
+    from db import file_cache
+
     try:
-        tg_file = await bot.get_file(file_id)  # ①
-        suffix = Path(tg_file.file_path).suffix or ".bin"
-        dest = dest_base.with_suffix(suffix)
-        await bot.download(tg_file, destination=dest)  # ②
-    except Exception as e:
-        with open(dest_base.with_suffix(".txt"), "w", encoding="utf-8") as f:
-            f.write(f"Не удалось скачать {file_id}\n{e}")
+        async with sem:
+            path = await file_cache.get_path(bot, src)
+        return item.dest.with_suffix(path.suffix), path
+    except Exception as e:  # не удалось скачать → .txt-заглушка
+        return item.dest.with_suffix(".txt"), f"Не удалось скачать {src}\n{e}".encode("utf-8")
 
 
-async def export_candidates_zip_async(bot, role_code: str = "user_unauthorized") -> str:
+def _write_archive_entry(arc, rel: Path, content: bytes | Path) -> None:
+    if isinstance(content, Path):
+        arc.write_file(rel.as_posix(), content)
+    else:
+        arc.write_bytes(rel.as_posix(), content)
+
+
+async def export_candidates_zip_async(
+    bot,
+    role_code: str = "user_unauthorized",
+    on_progress: Optional[ArchiveProgress] = None,
+) -> str:
     """
     Асинхронно формирует excel + все документы/скрины,
-    скачивая file_id из Telegram, затем архивирует в .zip.
+    скачивая file_id из Telegram, и пишет их прямо в .zip.
+
+    Конвейер: один общий запрос → до `ARCHIVE_DOWNLOADS` параллельных
+    скачиваний → писатель, который складывает готовые файлы в записи архива
+    (промежуточной папки на диске нет).
+    `on_progress(done, total)` вызывается не чаще раза в
+    `ARCHIVE_PROGRESS_EVERY` секунд и один раз в конце.
 
     Возвращает абсолютный путь к архиву.
     """
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    root_dir = Path("exports") / f"candidates_{ts}"
-    docs_dir = root_dir / "documents"
-    docs_dir.mkdir(parents=True, exist_ok=True)
+    from admins.superadmin.utils.zip_stream import ZipStream
 
-    # 1. все кандидаты
-    cursor.execute(
-        """
-        SELECT user_id, username, full_name, tg_full_name, gender, country,
-               phone_number, email, age, program
-        FROM   users
-        WHERE  role LIKE ?
-        """,
-        (f"{role_code}%",)
-    )
-    candidates = cursor.fetchall()
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    zip_path = (Path("exports") / f"candidates_{ts}.zip").resolve()
 
-    # 2. excel
-    pd.DataFrame([dict(r) for r in candidates]).to_excel(root_dir / "candidates.xlsx", index=False)
+    # 1. все кандидаты и их файлы — одним запросом к снимку базы
+    async with replica.snapshot() as source:
+        candidates, items = _load_candidates_bundle(role_code, source)
 
-    # 3. собираем документы
-    for row in candidates:
-        uid = row["user_id"]
-        name_for_slug = row["full_name"] or row["tg_full_name"] or row["username"] or str(uid)
-        sub = docs_dir / f"{uid}_{_slugify(name_for_slug)}"
-        sub.mkdir(exist_ok=True)
+    # 2. excel — сразу в архив
+    def _excel_bytes() -> bytes:
+        buf = BytesIO()
+        pd.DataFrame(candidates).to_excel(buf, index=False)
+        return buf.getvalue()
 
-        # 3.1 документы
-        cursor.execute(
-            """SELECT document_type, file_path, reason_of_absence
-               FROM user_documents WHERE user_id=?""", (uid,)
-        )
-        docs = cursor.fetchall()
-        for idx, doc in enumerate(docs, 1):
-            src = doc["file_path"]
-            dst_base = sub / f"{doc['document_type']}_{idx}"
-            if src and os.path.isfile(src):  # локальный файл
-                shutil.copy2(src, dst_base.with_suffix(Path(src).suffix))
-            elif src:  # file_id
-                await _download_telegram_file(bot, src, dst_base.with_suffix(".bin"))
-            else:  # нет файла → причина
-                with open(dst_base.with_suffix(".txt"), "w", encoding="utf-8") as f:
-                    f.write(doc["reason_of_absence"] or "—")
-
-        # 3.2 скрины симуляций
-        cursor.execute("SELECT simulation_type, screenshot_path FROM simulations WHERE user_id=?", (uid,))
-        sims = cursor.fetchall()
-        for sim in sims:
-            src = sim["screenshot_path"]
-            dst = sub / f"{sim['simulation_type']}"
-            if src and os.path.isfile(src):
-                shutil.copy2(src, dst.with_suffix(Path(src).suffix))
-            elif src:  # file_id
-                await _download_telegram_file(bot, src, dst.with_suffix(".bin"))
-
-    # 4. архив
-    zip_path = shutil.make_archive(str(root_dir), "zip", root_dir)
+    arc = ZipStream(zip_path)
+    try:
+        arc.write_bytes("candidates.xlsx", await asyncio.to_thread(_excel_bytes))
+
+        # 3. скачивание (ограниченная параллельность) → писатель в архив
+        sem = asyncio.Semaphore(ARCHIVE_DOWNLOADS)
+        ready: asyncio.Queue = asyncio.Queue(maxsize=ARCHIVE_DOWNLOADS * 2)
+        total = len(items)
+
+        pending: set = set()  # задачи скачивания в полёте
+
+        async def _producer() -> None:
+            async def _one(item: _ArchiveItem) -> None:
+                await ready.put(await _resolve_archive_item(bot, item, sem))
+
+            for item in items:  # не больше 2×ARCHIVE_DOWNLOADS задач в полёте
+                if len(pending) >= ARCHIVE_DOWNLOADS * 2:
+                    finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    pending.difference_update(finished)
+                    for task in finished:
+                        task.result()  # ошибка скачивания — сразу наружу
+                pending.add(asyncio.create_task(_one(item)))
+            if pending:
+                await asyncio.gather(*pending)
+            await ready.put(None)
+
+        async def _writer() -> None:
+            done, last = 0, time.monotonic()
+            while (entry := await ready.get()) is not None:
+                write = asyncio.ensure_future(asyncio.to_thread(_write_archive_entry, arc, *entry))
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    await asyncio.wait([write])  # поток допишет запись — abort() только после него
+                    raise
+                done += 1
+                if on_progress and time.monotonic() - last >= ARCHIVE_PROGRESS_EVERY:
+                    last = time.monotonic()
+                    await on_progress(done, total)
+            if on_progress:
+                await on_progress(done, total)
+
+        # упала одна сторона конвейера — отменяем другую и все скачивания,
+        # иначе они навсегда повиснут на полной (или пустой) очереди
+        stages = [asyncio.create_task(_producer()), asyncio.create_task(_writer())]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            leftovers = [*stages, *pending]
+            for task in leftovers:
+                task.cancel()
+            await asyncio.gather(*leftovers, return_exceptions=True)
+
+        # 4. закрываем архив (.part → .zip)
+        await asyncio.to_thread(arc.close)
+    except BaseException:
+        arc.abort()
+        raise
 
     # 5. лог
-    cursor.execute("INSERT INTO export_logs (report_type, file_path) VALUES ('candidates_export', ?)", (zip_path,))
+    conn.execute("INSERT INTO export_logs (report_type, file_path) VALUES ('candidates_export', ?)", (str(zip_path),))
     conn.commit()
 
-    return zip_path
+    return str(zip_path)
 
 
-def load_translations_from_db() -> dict[str, dict[str, str]]:
-    """Читаем всю таблицу -> {lang: {key: txt, …}, …}"""
-    rows = cursor.execute("SELECT * FROM translations").fetchall()
+def load_translations_from_db(db: sqlite3.Connection = conn) -> dict[str, dict[str, str]]:
+    """Читаем всю таблицу -> {lang: {key: txt, …}, …} (`db` — соединение вызывающего потока)"""
+    rows = db.execute("SELECT * FROM translations").fetchall()
     data = {l: {} for l in LANGS}
     for row in rows:
         k = row["key_text"]
@@ -1094,27 +1224,41 @@ def load_translations_from_db() -> dict[str, dict[str, str]]:
     return data
 
 
-def replace_all_translations(data: dict[str, dict[str, str]]):
-    """Полностью перезаписываем таблицу translations."""
-    cursor.execute("DELETE FROM translations")
-    conn.commit()
-    # --- 1. вставляем уникальные key_text ---------------------------------
-    all_keys = {k for pairs in data.values() for k in pairs.keys()}
-    cursor.executemany(
-        "INSERT INTO translations (key_text) VALUES (?) "
-        "ON CONFLICT(key_text) DO NOTHING",
-        [(k,) for k in all_keys]
-    )
+def replace_all_translations(data: dict[str, dict[str, str]], db: sqlite3.Connection = conn) -> tuple[int, int]:
+    """
+    Приводим таблицу translations к `data` ({lang: {key: txt}}) → (изменено строк, удалено).
 
-    # --- 2. обновляем значения по языкам -----------------------------------
-    for lang, pairs in data.items():
-        for key, txt in pairs.items():
-            cursor.execute(
-                f"UPDATE translations SET {lang} = ? WHERE key_text = ?",
-                (txt, key)
-            )
+    Пишется только разница с текущей таблицей — целыми строками (ключ + все
+    языки) одним `executemany`, в одной транзакции: читатели видят либо
+    старые переводы, либо новые, но не пустую таблицу.
+    """
+    # --- 1. новые строки: key_text → значения по LANGS ----------------------
+    all_keys = {k for pairs in data.values() for k in pairs}
+    new = {k: tuple(data.get(l, {}).get(k) for l in LANGS) for k in all_keys}
+
+    # --- 2. разница с текущей таблицей -------------------------------------
+    current = {
+        row[0]: tuple(row[1:])
+        for row in db.execute(f"SELECT key_text, {', '.join(LANGS)} FROM translations")
+    }
+    changed = [(k, *vals) for k, vals in new.items() if current.get(k) != vals]
+    removed = [(k,) for k in current.keys() - new.keys()]
 
-    conn.commit()
+    # --- 3. применяем одной транзакцией ------------------------------------
+    try:
+        db.executemany(
+            f"INSERT INTO translations (key_text, {', '.join(LANGS)}) "
+            f"VALUES (?{', ?' * len(LANGS)}) "
+            f"ON CONFLICT(key_text) DO UPDATE SET "
+            f"{', '.join(f'{l} = excluded.{l}' for l in LANGS)}",
+            changed,
+        )
+        db.executemany("DELETE FROM translations WHERE key_text = ?", removed)
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    return len(changed), len(removed)
 
 
 def _is_blocked(uid: int) -> bool:
@@ -1151,6 +1295,22 @@ def set_bool_setting(key: str, val: bool) -> None:
     conn.commit()
 
 
+def get_int_setting(key: str, default: int = 0) -> int:
+    cursor.execute("SELECT value FROM settings WHERE key_setting = ?", (key,))
+    row = cursor.fetchone()
+    return int(row[0]) if row and row[0] else default
+
+
+def incr_int_setting(key: str, delta: int) -> None:
+    """Атомарно прибавляет `delta` к числовой настройке (счётчику)."""
+    cursor.execute(
+        "INSERT INTO settings(key_setting, value) VALUES(?, ?) "
+        "ON CONFLICT(key_setting) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value",
+        (key, str(delta))
+    )
+    conn.commit()
+
+
 def get_reg_translation(key: str) -> str:
     """
     Возвращает текст по ключу из таблицы reg_translations.
@@ -1173,12 +1333,20 @@ def update_ps_user_id(ps_id: int, user_id: int) -> None:
 
 
 def insert_practice_supervisor(full_name: str, department: str, module: str, user_id: int) -> int:
+    # full_name уникален: если РП с таким ФИО успели добавить (например, из Excel) — обновляем
     cursor.execute(
-        "INSERT INTO practice_supervisors (full_name, department, module, user_id) VALUES (?, ?, ?, ?)",
+        """
+        INSERT INTO practice_supervisors (full_name, department, module, user_id) VALUES (?, ?, ?, ?)
+        ON CONFLICT(full_name) DO UPDATE SET
+            department = excluded.department,
+            module     = excluded.module,
+            user_id    = excluded.user_id
+        """,
         (full_name, department, module, user_id)
     )
     conn.commit()
-    return cursor.lastrowid
+    cursor.execute("SELECT id FROM practice_supervisors WHERE full_name = ?", (full_name,))
+    return cursor.fetchone()["id"]
 
 def create_ps_request(
         user_id: int,
@@ -1229,14 +1397,43 @@ def has_pending_ps_request(user_id: int) -> bool:
     return cursor.fetchone() is not None
 
 
+# Кэш списков подразделений / модулей для регистрации РП:
+# (версия users из data_versions, [department], {CF(department): [module]})
+_departments_cache: tuple[str | None, List[str], Dict[str, List[str]]] = (None, [], {})
+
+
+def refresh_department_cache() -> None:
+    """Перечитывает из users списки подразделений и модулей одним запросом."""
+    global _departments_cache
+    stamp = data_stamp(["users"])
+    departments: set = set()
+    modules: Dict[str, set] = {}
+    for dept, module in conn.execute(
+        """
+        SELECT DISTINCT department, CASE WHEN TRIM(module) != '' THEN module END
+          FROM users
+         WHERE department IS NOT NULL
+        """
+    ).fetchall():
+        if dept.strip(" "):  # как TRIM(department) != '' в SQL
+            departments.add(dept)
+        if module is not None:
+            modules.setdefault(_casefold(dept), set()).add(module)
+    _departments_cache = (stamp, sorted(departments), {k: sorted(v) for k, v in modules.items()})
+
+
+def _departments() -> tuple[str | None, List[str], Dict[str, List[str]]]:
+    """Кэш подразделений; перечитывается, если users изменилась (см. data_stamp)."""
+    if _departments_cache[0] != data_stamp(["users"]):
+        refresh_department_cache()
+    return _departments_cache
+
+
 def get_all_departments() -> List[str]:
     """
     Возвращает отсортированный список уникальных department из таблицы users (не NULL, не пустые).
     """
-    cursor.execute(
-        "SELECT DISTINCT department FROM users WHERE department IS NOT NULL AND TRIM(department) != '' ORDER BY department")
-    rows = cursor.fetchall()
-    return [row["department"] for row in rows]
+    return list(_departments()[1])
 
 
 def get_modules_by_department(department: str) -> List[str]:
@@ -1244,12 +1441,87 @@ def get_modules_by_department(department: str) -> List[str]:
     Возвращает отсортированный список уникальных module из таблицы users,
     где department = переданному (точное совпадение, нечувствительное к регистру).
     """
-    cursor.execute(
-        "SELECT DISTINCT module FROM users WHERE CF(department) = CF(?) AND module IS NOT NULL AND TRIM(module) != '' ORDER BY module",
-        (department,)
-    )
-    rows = cursor.fetchall()
-    return [row["module"] for row in rows]
+    return list(_departments()[2].get(_casefold(department), []))
+
+
+def enable_wal():
+    """
+    Переводит базу в WAL: читатели (снимки для отчётов, см. db/replica.py)
+    не блокируют запись.  Режим сохраняется в файле базы.
+    """
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.fetchone()
+
+
+def create_practice_supervisors_unique_index():
+    """
+    Уникальный индекс по full_name в practice_supervisors — на нём держится
+    UPSERT загрузки из Excel (load_supervisor.py).
+
+    Перед созданием дубли ФИО схлопываются в самую позднюю запись — как при
+    загрузке, «побеждает последний»: её department/module остаются, а если
+    у неё нет user_id, он берётся у последнего дубля, где он есть.  Сколько
+    строк и каких ФИО схлопнуто — пишется в лог.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('practice_supervisors', 'ux_ps_full_name')")
+    found = {row[0] for row in cursor.fetchall()}
+    if "practice_supervisors" not in found or "ux_ps_full_name" in found:
+        return
+    dups = cursor.execute("""
+        SELECT full_name, COUNT(*) - 1 FROM practice_supervisors
+         WHERE full_name IS NOT NULL
+         GROUP BY full_name HAVING COUNT(*) > 1
+    """).fetchall()
+    if dups:
+        log.warning(
+            "practice_supervisors: удалено %s дублей ФИО (оставлена последняя запись): %s",
+            sum(n for _, n in dups), ", ".join(f"{name} ×{n + 1}" for name, n in dups),
+        )
+    cursor.execute("""
+        UPDATE practice_supervisors
+           SET user_id = (
+                SELECT d.user_id FROM practice_supervisors d
+                 WHERE d.full_name = practice_supervisors.full_name AND d.user_id IS NOT NULL
+                 ORDER BY d.id DESC LIMIT 1
+           )
+         WHERE user_id IS NULL
+           AND id = (SELECT MAX(d.id) FROM practice_supervisors d
+                      WHERE d.full_name = practice_supervisors.full_name)
+    """)
+    cursor.execute("""
+        DELETE FROM practice_supervisors
+         WHERE full_name IS NOT NULL
+           AND id NOT IN (SELECT MAX(id) FROM practice_supervisors
+                           WHERE full_name IS NOT NULL GROUP BY full_name)
+    """)
+    cursor.execute("CREATE UNIQUE INDEX ux_ps_full_name ON practice_supervisors (full_name)")
+    conn.commit()
+
+
+WRITER_TIMEOUT: float = 30.0  # сколько фоновый писатель ждёт блокировку записи, сек
+
+
+class ImportCancelled(Exception):
+    """Фоновый импорт остановлен по запросу админа."""
+
+
+@contextmanager
+def writer_connection() -> Iterator[sqlite3.Connection]:
+    """
+    Отдельное соединение для рабочего потока (импорт Excel).
+
+    Общее `conn` обслуживает хэндлеры в event loop; у фоновой задачи своё
+    соединение, чтобы её транзакции не смешивались с их коммитами.  В WAL
+    оно не мешает читателям, а с другими писателями делит блокировку
+    записи — поэтому фоновые задачи коммитят короткими порциями.
+    Незакоммиченное при ошибке или остановке откатывается.
+    """
+    db = sqlite3.connect(BASE_DIR / "database.db", timeout=WRITER_TIMEOUT, check_same_thread=False)
+    db.row_factory = sqlite3.Row
+    try:
+        yield db
+    finally:
+        db.close()
 
 
 def create_admin_registration_table():
@@ -1277,6 +1549,188 @@ def create_admin_registration_table():
     conn.commit()
 
 
+def create_file_cache_table():
+    """
+    Индекс локального кэша файлов Telegram (см. db/file_cache.py).
+
+    Одна строка на `file_id`; несколько `file_id` могут указывать на один
+    файл на диске (тот же `file_unique_id` или то же содержимое).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS file_cache (
+            file_id TEXT PRIMARY KEY,
+            file_unique_id TEXT,
+            sha256 TEXT NOT NULL,
+            path TEXT NOT NULL,          -- относительно db/file_cache/
+            size INTEGER NOT NULL,
+            mime TEXT,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_cache_unique ON file_cache (file_unique_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_cache_sha ON file_cache (sha256)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_cache_path ON file_cache (path)")
+    conn.commit()
+
+
+def create_export_jobs_table():
+    """
+    Очередь выгрузок (отчёты, архив кандидатов).
+
+    `export_jobs` — одна строка на задачу; одинаковые задачи (тот же
+    `job_key`), пока они ждут или выполняются, не дублируются — новый
+    запросивший просто добавляется в `export_job_waiters` и получит тот же файл.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,                       -- report / candidates
+            params TEXT NOT NULL,                     -- JSON
+            job_key TEXT NOT NULL,                    -- kind + канонический JSON параметров
+            status TEXT NOT NULL DEFAULT 'pending',   -- pending / running / done / failed
+            progress INTEGER NOT NULL DEFAULT 0,      -- 0..100
+            result_path TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_export_jobs_status
+        ON export_jobs (status, job_key)
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS export_job_waiters (
+            job_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,              -- статусное сообщение, которое правим
+            delivered INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (job_id, chat_id, message_id)
+        )
+    """)
+    conn.commit()
+
+
+def create_mailing_deliveries_table():
+    """
+    Очередь доставки рассылок: одна строка на (рассылка, запуск, получатель).
+
+    `run_at` — плановое время конкретного запуска, чтобы у периодических
+    рассылок каждый запуск имел свою очередь.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS mailing_deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            mailing_id INTEGER NOT NULL,
+            run_at TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',  -- queued / sending / delivered / blocked / failed / interrupted
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (mailing_id, run_at, user_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_mailing_deliveries_status
+        ON mailing_deliveries (status, mailing_id, run_at)
+    """)
+    conn.commit()
+
+
+def ensure_mailing_media_columns():
+    """
+    Колонки для медиа-рассылок в `mailings`:
+
+    * `source_chat_id` / `source_message_id` — исходное сообщение админа,
+      которое рассылается через `copy_message` (фото, видео, документ …);
+    * `media` — JSON-список элементов альбома `{"type", "file_id", "caption"}`
+      для `send_media_group`.
+    """
+    cursor.execute("PRAGMA table_info(mailings)")
+    cols = {row[1] for row in cursor.fetchall()}
+    for name, col_type in (
+        ("source_chat_id", "INTEGER"),
+        ("source_message_id", "INTEGER"),
+        ("media", "TEXT"),
+    ):
+        if name not in cols:
+            cursor.execute(f"ALTER TABLE mailings ADD COLUMN {name} {col_type}")
+    conn.commit()
+
+
+def create_users_audience_index():
+    """Индекс под выборку аудитории рассылок (роль + тик)."""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_role_tik
+        ON users (role, tik)
+    """)
+    conn.commit()
+
+
+def create_user_deliverability_table():
+    """
+    Итоги доставки сообщений по пользователям: если чат «мёртв»
+    (бот заблокирован / чат не найден), рассылки его пропускают.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_deliverability (
+            user_id INTEGER PRIMARY KEY,
+            deliverable INTEGER NOT NULL DEFAULT 1,
+            last_error TEXT,
+            last_error_at TIMESTAMP,
+            last_success_at TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_deliverability_dead
+        ON user_deliverability (deliverable, user_id)
+    """)
+    conn.commit()
+
+
+def record_delivery_outcome(user_id: int, status: str, error: str | None = None) -> None:
+    """
+    Запоминает исход доставки: 'delivered' → чат жив,
+    'blocked' → чат мёртв, остальное → только текст ошибки.
+    """
+    now = datetime.now().strftime(FMT_ISO)
+    if status == "delivered":
+        conn.execute(
+            """
+            INSERT INTO user_deliverability (user_id, deliverable, last_success_at) VALUES (?, 1, ?)
+            ON CONFLICT(user_id) DO UPDATE SET deliverable = 1, last_success_at = excluded.last_success_at
+            """,
+            (user_id, now),
+        )
+    else:
+        conn.execute(
+            """
+            INSERT INTO user_deliverability (user_id, deliverable, last_error, last_error_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET deliverable = MIN(deliverable, excluded.deliverable),
+                                               last_error = excluded.last_error,
+                                               last_error_at = excluded.last_error_at
+            """,
+            (user_id, 0 if status == "blocked" else 1, error, now),
+        )
+    conn.commit()
+
+
+def mark_user_deliverable(user_id: int) -> None:
+    """Пользователь снова написал боту (/start) → чат жив."""
+    conn.execute(
+        "UPDATE user_deliverability SET deliverable = 1 WHERE user_id = ? AND deliverable = 0",
+        (user_id,),
+    )
+    conn.commit()
+
+
+def count_undeliverable() -> int:
+    row = conn.execute("SELECT COUNT(*) FROM user_deliverability WHERE deliverable = 0").fetchone()
+    return row[0]
+
+
 def add_admin_registration(user_id: int, target_role: str, fio: str) -> int:
     """Добавляет новую заявку на регистрацию."""
     cursor.execute("""
@@ -1345,4 +1799,286 @@ def is_stage1_complete(user_id: int) -> bool:
         return False
     
     # Проверяем, что все обязательные поля заполнены
-    return all(row) and row['age'] is not None
\ No newline at end of file
+    return all(row) and row['age'] is not None
+
+
+# (таблица, колонка) с датами, по которым отчёты фильтруют период
+REPORT_DATE_COLUMNS = (
+    ("room_cleanliness_reports", "created_at"),
+    ("event_attendance", "checked_at"),
+    ("violations", "violation_date"),
+    ("absences", "date_from"),
+    ("absences", "date_to"),
+)
+
+
+def normalize_report_dates():
+    """
+    Приводит даты в `REPORT_DATE_COLUMNS` к виду 'YYYY-MM-DD[ HH:MM:SS]'.
+
+    Исторически встречаются ISO с 'T' и микросекундами (`isoformat()`) и
+    'DD.MM.YYYY'.  В едином виде строки сравниваются как даты, и отчёты
+    фильтруют период по индексу, не оборачивая колонку в DATE().
+    Уже нормальные строки не трогаются.
+    """
+    for table, col in REPORT_DATE_COLUMNS:
+        # 2025-08-20T15:34:12.123456 → 2025-08-20 15:34:12
+        cursor.execute(f"""
+            UPDATE {table} SET {col} = datetime({col})
+             WHERE {col} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]T*'
+               AND datetime({col}) IS NOT NULL
+        """)
+        # 20.08.2025[ 15:34:12] → 2025-08-20[ 15:34:12]
+        cursor.execute(f"""
+            UPDATE {table}
+               SET {col} = substr({col}, 7, 4) || '-' || substr({col}, 4, 2) || '-'
+                           || substr({col}, 1, 2) || substr({col}, 11)
+             WHERE {col} GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]*'
+        """)
+    conn.commit()
+
+
+def create_report_indexes():
+    """Индексы под фильтр периода в отчётах (см. QUERIES в reports/exporter.py)."""
+    for table, col in REPORT_DATE_COLUMNS:
+        if col != "date_to":  # для пересечения периодов достаточно date_from
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col} ON {table} ({col})")
+    # присоединяемые таблицы — иначе SQLite строит временный индекс на каждый запрос
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_absence_files_absence ON absence_files (absence_id)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_documents_type_user
+        ON user_documents (document_type, user_id)
+    """)
+    conn.commit()
+
+
+# таблицы, от которых зависят выгрузки отчётов; версия меняется триггерами
+VERSIONED_TABLES = (
+    "users",
+    "room_cleanliness_reports",
+    "events",
+    "event_attendance",
+    "violations",
+    "user_documents",
+    "absences",
+    "absence_files",
+)
+
+# колонки, UPDATE которых меняет версию (по умолчанию — любые).  users
+# обновляется постоянно (/start, язык, доставляемость, роли), а отчёты и
+# кэш подразделений читают из неё только эти поля
+VERSIONED_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "users": ("user_id", "full_name", "department", "module"),
+}
+
+
+def create_data_versions_table():
+    """
+    Счётчик изменений по таблицам (`data_versions`) и триггеры к нему.
+
+    Любой INSERT/DELETE в таблице из `VERSIONED_TABLES` увеличивает её
+    `version`, UPDATE — только если изменилась одна из `VERSIONED_COLUMNS`
+    (для таблиц без списка — любой).  По набору версий выгрузка понимает,
+    что данные с прошлого раза не менялись (см. `data_stamp`).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    existing = {row[0] for row in cursor.fetchall()}
+    for table in VERSIONED_TABLES:
+        if table not in existing:
+            continue
+        cursor.execute("INSERT OR IGNORE INTO data_versions (table_name) VALUES (?)", (table,))
+        columns = VERSIONED_COLUMNS.get(table)
+        # UPDATE-триггер пересоздаём: в старых базах он срабатывал на любые колонки
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_version_update")
+        for action in ("INSERT", "UPDATE", "DELETE"):
+            event = f"{action} ON {table}"
+            if action == "UPDATE" and columns:
+                changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in columns)
+                event = f"UPDATE OF {', '.join(columns)} ON {table} WHEN {changed}"
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{action.lower()}
+                AFTER {event}
+                BEGIN
+                    UPDATE data_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            """)
+    conn.commit()
+
+
+def data_stamp(tables, source: sqlite3.Connection = conn) -> str:
+    """Отпечаток версий таблиц: 'absences:12,users:40'. Совпал — данные те же."""
+    tables = sorted(tables)
+    ph = ", ".join("?" * len(tables))
+    rows = dict(source.execute(
+        f"SELECT table_name, version FROM data_versions WHERE table_name IN ({ph})", tables
+    ).fetchall())
+    return ",".join(f"{t}:{rows.get(t, 0)}" for t in tables)
+
+
+def create_export_logs_table():
+    """
+    Журнал выгрузок отчётов.
+
+    * `request_key` — все параметры запроса; вместе с `data_stamp` позволяет
+      отдать прошлый ZIP, если данные не менялись;
+    * `scope_key` — отчёт без формата (тип, период, объекты), `max_row_id` —
+      последняя выгруженная строка: от неё считается режим «только новые».
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS export_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_type TEXT,
+            start_date DATE,
+            end_date DATE,
+            file_path TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("PRAGMA table_info(export_logs)")
+    cols = {row[1] for row in cursor.fetchall()}
+    for name, col_type in (
+        ("request_key", "TEXT"),
+        ("scope_key", "TEXT"),
+        ("data_stamp", "TEXT"),
+        ("max_row_id", "INTEGER"),
+    ):
+        if name not in cols:
+            cursor.execute(f"ALTER TABLE export_logs ADD COLUMN {name} {col_type}")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_export_logs_request
+        ON export_logs (request_key, data_stamp)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_export_logs_scope
+        ON export_logs (scope_key, max_row_id)
+    """)
+    conn.commit()
+
+
+# метрика → (таблица, день, разрез, условие, колонки для UPDATE-триггера);
+# {r} — NEW / OLD в триггере или сама таблица при пересчёте
+STATS_METRICS = {
+    "clean": ("room_cleanliness_reports", "date({r}.created_at)", "''", "1", "created_at"),
+    "attended": ("event_attendance", "date({r}.checked_at)", "''", "{r}.attended = 1",
+                 "attended, checked_at"),
+    "violations": ("violations", "date({r}.violation_date)", "''", "1", "violation_date"),
+    "absence": ("absences", "date({r}.date_from)", "COALESCE({r}.place, '')", "1",
+                "place, date_from"),
+}
+
+
+def _stats_upsert(metric: str, row: str, sign: int) -> str:
+    _, day, bucket, cond, _ = STATS_METRICS[metric]
+    return f"""
+        INSERT INTO stats_counters (metric, bucket, day, cnt)
+        SELECT '{metric}', {bucket.format(r=row)}, COALESCE({day.format(r=row)}, ''), {sign}
+         WHERE {cond.format(r=row)}
+        ON CONFLICT (metric, bucket, day) DO UPDATE SET cnt = cnt + excluded.cnt;
+    """
+
+
+def create_stats_counters_table():
+    """
+    Сводка для экрана «Статистика»: `stats_counters` (метрика, разрез, день) → число.
+
+    Счётчики ведут триггеры на исходных таблицах (см. `STATS_METRICS`), так
+    что экран читает несколько сотен строк сводки вместо полного прохода по
+    таблицам.  При первом создании сводка заполняется из имеющихся данных;
+    пересчитать её заново — `rebuild_stats_counters()` (/rebuild_stats).
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters'")
+    is_new = cursor.fetchone() is None
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            metric TEXT NOT NULL,               -- clean / attended / violations / absence
+            bucket TEXT NOT NULL DEFAULT '',    -- разрез (объект для отсутствий)
+            day TEXT NOT NULL,                  -- YYYY-MM-DD ('' — без даты)
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, bucket, day)
+        ) WITHOUT ROWID
+    """)
+    for metric, (table, *_, columns) in STATS_METRICS.items():
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert
+            AFTER INSERT ON {table}
+            BEGIN {_stats_upsert(metric, "NEW", 1)} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete
+            AFTER DELETE ON {table}
+            BEGIN {_stats_upsert(metric, "OLD", -1)} END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_update
+            AFTER UPDATE OF {columns} ON {table}
+            BEGIN {_stats_upsert(metric, "OLD", -1)} {_stats_upsert(metric, "NEW", 1)} END
+        """)
+    conn.commit()
+    if is_new:
+        rebuild_stats_counters()
+
+
+def rebuild_stats_counters() -> int:
+    """Пересчитывает `stats_counters` с нуля одной транзакцией; → число строк сводки."""
+    with conn:
+        conn.execute("DELETE FROM stats_counters")
+        for metric, (table, day, bucket, cond, _) in STATS_METRICS.items():
+            conn.execute(f"""
+                INSERT INTO stats_counters (metric, bucket, day, cnt)
+                SELECT '{metric}', {bucket.format(r=table)}, COALESCE({day.format(r=table)}, ''), COUNT(*)
+                  FROM {table}
+                 WHERE {cond.format(r=table)}
+                 GROUP BY 2, 3
+            """)
+    return conn.execute("SELECT COUNT(*) FROM stats_counters").fetchone()[0]
+
+
+def get_stats_summary(
+    periods: Dict[str, str], source: sqlite3.Connection = conn
+) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """
+    Сводка из `stats_counters` → {метрика: {разрез: {"total": n, <период>: n, …}}}.
+
+    `periods` — {название: первый день 'YYYY-MM-DD'}, например
+    {"today": "2025-05-31", "week": "2025-05-25"}; период идёт по сегодня.
+    `source` — соединение, из которого читать (по умолчанию боевое).
+    """
+    names = list(periods)
+    cols = "".join(
+        f", SUM(CASE WHEN day >= :p{i} THEN cnt ELSE 0 END)" for i in range(len(names))
+    )
+    rows = source.execute(
+        f"SELECT metric, bucket, SUM(cnt){cols} FROM stats_counters GROUP BY metric, bucket",
+        {f"p{i}": periods[name] for i, name in enumerate(names)},
+    ).fetchall()
+    summary: Dict[str, Dict[str, Dict[str, int]]] = {m: {} for m in STATS_METRICS}
+    for metric, bucket, total, *by_period in rows:
+        summary.setdefault(metric, {})[bucket] = {"total": total, **dict(zip(names, by_period))}
+    return summary
+
+
+def create_import_row_hashes_table():
+    """
+    Хэши строк последнего импорта участников из Excel (см. utils/import_excel.py).
+
+    Одна строка на (user_id, data_period, seq), где `seq` — номер повтора
+    участника в периоде в пределах файла: совпал хэш — строка Excel с прошлого
+    импорта не менялась, и её не нужно применять заново.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS import_row_hashes (
+            user_id INTEGER NOT NULL,
+            data_period TEXT NOT NULL DEFAULT '',
+            seq INTEGER NOT NULL DEFAULT 0,
+            row_hash TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, data_period, seq)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
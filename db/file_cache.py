@@ -0,0 +1,171 @@
+"""
+Локальный кэш файлов Telegram
+=============================
+
+Все места, где бот скачивает файлы по `file_id` (экспорт отчётов, архив
+кандидатов, коллаж отчёта о чистоте), идут через этот модуль:
+
+* индекс `file_cache` хранит `file_id → (file_unique_id, sha256, путь,
+  размер, mime)`; попадание по `file_id` не делает ни одного запроса к Bot API;
+* один и тот же файл может прийти под разными `file_id` — они склеиваются
+  по `file_unique_id` (один `get_file`, без скачивания) и по хэшу содержимого;
+* на диске файл лежит под именем своего sha256, поэтому одинаковое
+  содержимое хранится один раз;
+* объём кэша ограничен `MAX_BYTES`: при превышении удаляются давно не
+  использованные файлы (LRU по `last_used`), пока не останется `TRIM_TO`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import mimetypes
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from db.database import BASE_DIR, conn
+
+CACHE_DIR = BASE_DIR / "file_cache"
+MAX_BYTES: int = 1024 * 1024 * 1024   # 1 ГиБ на весь кэш
+TRIM_TO: int = int(MAX_BYTES * 0.8)   # до скольких ужимаемся при вытеснении
+FETCH_ATTEMPTS: int = 3               # попыток на сетевые ошибки и флуд-лимит
+RETRY_AFTER_MAX: int = 30             # дольше этого (сек) флуд-лимит не ждём — ошибка
+
+# file_id → задача скачивания: параллельные запросы одного файла качают его один раз
+_INFLIGHT: Dict[str, asyncio.Task] = {}
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _lookup(column: str, value: str) -> Optional[Path]:
+    """Путь по значению в индексе, если файл на диске ещё жив."""
+    row = conn.execute(f"SELECT path FROM file_cache WHERE {column} = ? LIMIT 1", (value,)).fetchone()
+    if row is None:
+        return None
+    path = CACHE_DIR / row[0]
+    if path.is_file():
+        return path
+    conn.execute(f"DELETE FROM file_cache WHERE {column} = ?", (value,))  # файл удалили руками
+    conn.commit()
+    return None
+
+
+def _touch(file_id: str) -> None:
+    conn.execute("UPDATE file_cache SET last_used = ? WHERE file_id = ?", (_now(), file_id))
+    conn.commit()
+
+
+def _remember(file_id: str, unique_id: str, sha: str, rel: str, size: int) -> None:
+    conn.execute(
+        """
+        INSERT INTO file_cache (file_id, file_unique_id, sha256, path, size, mime, last_used)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(file_id) DO UPDATE SET
+            file_unique_id = excluded.file_unique_id,
+            sha256 = excluded.sha256,
+            path = excluded.path,
+            size = excluded.size,
+            mime = excluded.mime,
+            last_used = excluded.last_used
+        """,
+        (file_id, unique_id, sha, rel, size, mimetypes.guess_type(rel)[0], _now()),
+    )
+    conn.commit()
+
+
+def _write_blob(dst: Path, data: bytes) -> None:
+    """Атомарная запись файла кэша (через .part)."""
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_suffix(dst.suffix + ".part")
+    tmp.write_bytes(data)
+    tmp.replace(dst)
+
+
+async def _store(data: bytes, suffix: str) -> tuple[str, str]:
+    """Кладёт байты в кэш под именем sha256 → (sha256, относительный путь)."""
+    sha = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    known = _lookup("sha256", sha)
+    if known is not None:  # такое содержимое уже лежит в кэше
+        return sha, known.relative_to(CACHE_DIR).as_posix()
+
+    rel = f"{sha[:2]}/{sha}{suffix}"
+    await asyncio.to_thread(_write_blob, CACHE_DIR / rel, data)
+    return sha, rel
+
+
+def evict(max_bytes: int = MAX_BYTES, trim_to: int = TRIM_TO) -> int:
+    """Удаляет давно не использованные файлы, если кэш больше `max_bytes`; → сколько байт освобождено."""
+    blobs = conn.execute(
+        "SELECT path, MAX(size), MAX(last_used) AS used FROM file_cache GROUP BY path ORDER BY used"
+    ).fetchall()
+    total = sum(b[1] or 0 for b in blobs)
+    if total <= max_bytes:
+        return 0
+
+    freed = 0
+    for path, size, _ in blobs:
+        if total - freed <= trim_to:
+            break
+        (CACHE_DIR / path).unlink(missing_ok=True)
+        conn.execute("DELETE FROM file_cache WHERE path = ?", (path,))
+        freed += size or 0
+    conn.commit()
+    return freed
+
+
+async def _download(bot, file_id: str) -> Path:
+    """Промах по file_id: `get_file` и, если содержимое ещё не знакомо, скачивание."""
+    attempts = 0
+    while True:
+        try:
+            tg_file = await bot.get_file(file_id)
+            known = _lookup("file_unique_id", tg_file.file_unique_id)
+            if known is not None:  # тот же файл под другим file_id — не качаем
+                sha, rel = known.stem, known.relative_to(CACHE_DIR).as_posix()
+                size = known.stat().st_size
+            else:
+                buf = await bot.download_file(tg_file.file_path)
+                data = buf.getvalue()
+                sha, rel = await _store(data, Path(tg_file.file_path).suffix or ".bin")
+                size = len(data)
+            break
+        except TelegramRetryAfter as e:
+            attempts += 1
+            if attempts >= FETCH_ATTEMPTS or e.retry_after > RETRY_AFTER_MAX:
+                raise
+            await asyncio.sleep(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError):
+            attempts += 1
+            if attempts >= FETCH_ATTEMPTS:
+                raise
+            await asyncio.sleep(2 ** attempts)
+
+    _remember(file_id, tg_file.file_unique_id, sha, rel, size)
+    evict()
+    return CACHE_DIR / rel
+
+
+async def get_path(bot, file_id: str) -> Path:
+    """Локальный путь к файлу `file_id`; сеть трогается только при промахе."""
+    path = _lookup("file_id", file_id)
+    if path is not None:
+        _touch(file_id)
+        return path
+
+    task = _INFLIGHT.get(file_id)
+    if task is None:
+        task = asyncio.ensure_future(_download(bot, file_id))
+        _INFLIGHT[file_id] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(file_id, None))
+    return await asyncio.shield(task)
+
+
+async def get_bytes(bot, file_id: str) -> bytes:
+    """Содержимое файла `file_id` (через кэш)."""
+    path = await get_path(bot, file_id)
+    return await asyncio.to_thread(path.read_bytes)
@@ -1,9 +1,58 @@
-from .database import conn, create_admin_registration_table
+from .database import (
+    conn,
+    create_admin_registration_table,
+    enable_wal,
+    create_data_versions_table,
+    create_export_logs_table,
+    create_export_jobs_table,
+    create_file_cache_table,
+    create_import_row_hashes_table,
+    create_mailing_deliveries_table,
+    create_practice_supervisors_unique_index,
+    create_report_indexes,
+    create_stats_counters_table,
+    normalize_report_dates,
+    ensure_mailing_media_columns,
+    create_users_audience_index,
+    create_user_deliverability_table,
+)
 
 def init_db():
     """Инициализирует базу данных, создавая необходимые таблицы."""
+    # WAL: снимки для отчётов (db/replica.py) снимаются, не мешая записи
+    enable_wal()
+
     # Создаём таблицу для заявок на регистрацию администраторов
     create_admin_registration_table()
+
+    # Очередь доставки рассылок (переживает перезапуск бота)
+    create_mailing_deliveries_table()
+    ensure_mailing_media_columns()
+    create_users_audience_index()
+    create_user_deliverability_table()
+
+    # Индекс локального кэша файлов Telegram
+    create_file_cache_table()
+
+    # Очередь выгрузок (отчёты / архив кандидатов)
+    create_export_jobs_table()
+    create_export_logs_table()
+
+    # Единый формат дат + индексы под фильтр периода в отчётах
+    normalize_report_dates()
+    create_report_indexes()
+
+    # Версии данных для кэша выгрузок (триггеры на исходных таблицах)
+    create_data_versions_table()
+
+    # Сводка для экрана «Статистика» (триггеры + первичное заполнение)
+    create_stats_counters_table()
+
+    # Хэши строк импорта участников: повторный импорт пропускает неизменённые
+    create_import_row_hashes_table()
+
+    # full_name РП уникален (UPSERT при загрузке из Excel); дубли схлопываются
+    create_practice_supervisors_unique_index()
     
     # Здесь можно добавить создание других таблиц, если потребуется
     
@@ -0,0 +1,144 @@
+"""
+Снимок базы для тяжёлых чтений
+==============================
+
+Отчёты, архив кандидатов и статистика читают не боевое соединение `conn`,
+в которое пишут хэндлеры, а копию базы на диске:
+
+* копия снимается штатным online backup API SQLite в отдельном потоке.
+  Боевая база работает в WAL (см. `enable_wal`), поэтому копия делается
+  за один шаг внутри одной read-транзакции: в WAL читатель не мешает
+  писателям, а снимок получается согласованным.  Пошаговое копирование
+  здесь не годится: любая запись с другого соединения между шагами
+  начинает backup заново, и при постоянных записях он не заканчивается.
+  Без WAL копируем порциями по `PAGES_PER_STEP` страниц с паузой
+  `STEP_PAUSE` — между шагами писатели успевают взять блокировку; если
+  копия начиналась заново больше `MAX_RESTARTS` раз, снимаем её за один шаг;
+* снимок обновляется по требованию: если он старше `MAX_AGE` секунд
+  (или старше `max_age`, переданного в `snapshot()`), снимается новый;
+* читатель, открывший снимок через `async with snapshot() as db:`, дочитывает
+  его до конца, даже если тем временем появился более свежий; старый файл
+  удаляется, когда его отпустит последний читатель.
+
+Модуль нарочно не импортирует `db.database`, чтобы тот мог использовать его сам.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+log = logging.getLogger(__name__)
+
+DB_PATH = Path(__file__).resolve().parent / "database.db"
+SNAPSHOT_DIR = DB_PATH.parent / "replica"
+
+MAX_AGE: float = 60.0        # допустимое отставание снимка от боевой базы, сек
+PAGES_PER_STEP: int = 256    # без WAL: страниц за шаг backup (~1 МиБ при 4 КиБ)
+STEP_PAUSE: float = 0.005    # без WAL: пауза между шагами — окно для писателей, сек
+MAX_RESTARTS: int = 3        # без WAL: столько перезапусков backup, потом — за один шаг
+
+
+@dataclass(eq=False)
+class _Snapshot:
+    path: Path
+    conn: sqlite3.Connection
+    taken_at: float              # time.monotonic()
+    readers: int = 0
+
+
+_current: Optional[_Snapshot] = None
+_lock = asyncio.Lock()
+
+
+class _Restarted(Exception):
+    """Пошаговый backup слишком часто начинался заново из-за записей."""
+
+
+def _copy_in_steps(src: sqlite3.Connection, dst: sqlite3.Connection) -> None:
+    last = None
+    restarts = 0
+
+    def _progress(status: int, remaining: int, total: int) -> None:
+        nonlocal last, restarts
+        if last is not None and remaining > last:  # источник изменился — копия сначала
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                raise _Restarted
+        last = remaining
+
+    try:
+        src.backup(dst, pages=PAGES_PER_STEP, progress=_progress, sleep=STEP_PAUSE)
+    except _Restarted:
+        log.warning("Снимок базы: %s перезапусков, копирую за один шаг", restarts)
+        src.backup(dst)
+
+
+def _take() -> _Snapshot:
+    """(в потоке) Копирует боевую базу в новый файл и открывает его на чтение."""
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    path = SNAPSHOT_DIR / f"snapshot_{time.time_ns()}.db"
+    started = time.perf_counter()
+
+    src = sqlite3.connect(DB_PATH)
+    dst = sqlite3.connect(path)
+    try:
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        if wal:
+            src.backup(dst)
+        else:
+            _copy_in_steps(src, dst)
+    finally:
+        dst.close()
+        src.close()
+
+    ro = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    ro.row_factory = sqlite3.Row
+    log.info("Снимок базы обновлён за %.2f с", time.perf_counter() - started)
+    return _Snapshot(path, ro, time.monotonic())
+
+
+def _drop(snap: _Snapshot) -> None:
+    snap.conn.close()
+    snap.path.unlink(missing_ok=True)
+
+
+def _drop_leftovers() -> None:
+    """Снимки, оставшиеся от прошлого запуска бота."""
+    for path in SNAPSHOT_DIR.glob("snapshot_*.db"):
+        path.unlink(missing_ok=True)
+
+
+async def _fresh(max_age: float) -> _Snapshot:
+    global _current
+    async with _lock:  # одновременно снимается не больше одной копии
+        if _current is None or time.monotonic() - _current.taken_at > max_age:
+            if _current is None:
+                await asyncio.to_thread(_drop_leftovers)
+            old, _current = _current, await asyncio.to_thread(_take)
+            if old is not None and old.readers == 0:
+                _drop(old)
+        _current.readers += 1
+        return _current
+
+
+@asynccontextmanager
+async def snapshot(max_age: Optional[float] = None) -> AsyncIterator[sqlite3.Connection]:
+    """
+    Соединение (только чтение) со снимком не старше `max_age` секунд.
+
+    По умолчанию — `MAX_AGE`; `max_age=0` — снять свежую копию прямо сейчас.
+    """
+    snap = await _fresh(MAX_AGE if max_age is None else max_age)
+    try:
+        yield snap.conn
+    finally:
+        snap.readers -= 1
+        if snap is not _current and snap.readers == 0:
+            _drop(snap)
@@ -2,6 +2,7 @@ import asyncio
 import logging
 
 from admins.superadmin.mailing.scheduler import mailing_scheduler
+from admins.superadmin.reports.jobs import export_worker
 from user.auth.handlers import *
 from user.registration.handlers import *
 
@@ -24,17 +25,31 @@ from admins.registration import setup_admin_registration
 from db.init_db import init_db
 from admins.role_commands import router as role_router
 
+# ссылки на фоновые задачи: без них event loop держит задачу лишь слабо,
+# и она может быть собрана сборщиком мусора, а её исключение — потеряно
+_background_tasks: set = set()
+
+
+def _background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Фоновая задача %s завершилась с ошибкой", task.get_name(), exc_info=task.exception())
+
+
+def _start_background(coro, name: str) -> None:
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
+
+
 async def on_startup(bot: Bot) -> None:
     """
     Вызывается автоматически при старте Dispatcher'а.
-    Запускаем планировщик рассылок в отдельной задаче
+    Запускаем планировщик рассылок и воркер выгрузок в отдельных задачах
     **(без await, чтобы не блокировать запуск бота).**
     """
-    asyncio.create_task(mailing_scheduler(bot))
-
-
-# Инициализируем базу данных
-init_db()
+    _start_background(mailing_scheduler(bot), "mailing_scheduler")
+    _start_background(export_worker(bot), "export_worker")
 
 
 # Регистрация всех роутеров
@@ -57,4 +72,7 @@ async def main() -> None:
 
 
 if __name__ == "__main__":
+    # только в основном процессе: дочерние процессы пула миниатюр
+    # (spawn) импортируют этот модуль заново
+    init_db()  # Инициализируем базу данных
     asyncio.run(main())
@@ -11,6 +11,7 @@ from aiogram_media_group import media_group_handler
 
 from admins.filters.allowed_ids import AllowedIDs
 from config import *
+from db import file_cache
 from db.database import *
 from user.auth.keyboards import *
 from user.auth.other_func import create_collage, build_user_card_text, is_event_open, trp
@@ -578,10 +579,7 @@ async def cleanreport_process_and_send(message: Message, state: FSMContext):
     if admin_chat_id != 0:
         images_pil = []
         for file_id in photos_list:
-            file_info = await bot.get_file(file_id)
-            file_obj = await bot.download_file(file_info.file_path)
-            file_obj.seek(0)
-            images_pil.append(Image.open(file_obj))
+            images_pil.append(Image.open(await file_cache.get_path(bot, file_id)))
 
         collage_img = create_collage(images_pil, cols=3, rows=3)
 
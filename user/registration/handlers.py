@@ -74,6 +74,7 @@ async def start_message(message: types.Message, state: FSMContext):
     # обновляем / создаём запись пользователя
     if user_exists(user_id):
         db_user_update(user_id, username, tg_full_name)
+        mark_user_deliverable(user_id)  # чат снова жив — возвращаем в рассылки
         from db.database import is_stage1_complete, is_stage2_complete
         
         if is_stage2_complete(user_id):
@@ -251,14 +252,15 @@ async def inline_country(iq: types.InlineQuery, state: FSMContext):
     if query.lower().startswith("country:"):
         query = query[8:].lstrip()
 
+    names = COUNTRIES.get().names[lang]
     if len(query) == 0:
-        countries = COUNTRY_LIST[lang]
+        countries = names
         # Если ввёл меньше 2 символов — не ищем
     elif len(query) < 2:
         return await iq.answer([], cache_time=1)
         # Иначе фильтруем по подстроке
     else:
-        countries = [c for c in COUNTRY_LIST[lang] if query.lower() in c.lower()]
+        countries = [c for c in names if query.lower() in c.lower()]
 
     if not countries:
         return await iq.answer(
@@ -327,17 +329,18 @@ async def inline_phone(iq: types.InlineQuery, state: FSMContext):
     m = re.match(r"^\+(\d{1,4})", query)  # до 4 цифр после «+»
     if m:
         digits_in_query = m.group(1)  # «224123…»
-        # ищем самый длинный префикс, который есть в CODE_MASK
+        # ищем самый длинный префикс, который есть в code_mask
+        code_mask = COUNTRIES.get().code_mask
         new_code = None
         for end in range(len(digits_in_query), 0, -1):
             candidate = "+" + digits_in_query[:end]
-            if candidate in CODE_MASK:
+            if candidate in code_mask:
                 new_code = candidate
                 break
 
         if new_code and new_code != code:
             code = new_code
-            mask = CODE_MASK[code]
+            mask = code_mask[code]
             await state.update_data(phone_code=code, phone_mask=mask)
 
     # --------- ➌ убираем сам код из строки и оставляем «хвост» -----
@@ -1096,7 +1099,7 @@ async def admin_process_reply(msg: Message, state: FSMContext):
 @dp.callback_query(F.data == "go_stage_3")
 async def info_root(callback_query: CallbackQuery, state: FSMContext):
     lang = get_user_lang(callback_query.from_user.id)
-    if not INFO_DATA.get(lang):
+    if not INFO.get().get(lang):
         await callback_query.answer(tr(lang, "no_info"), show_alert=True)
         return
     await callback_query.message.edit_text(
@@ -1133,7 +1136,7 @@ async def info_show_article(callback_query: CallbackQuery, state: FSMContext):
     _, _, idx, page = callback_query.data.split("_")
     idx, page = int(idx), int(page)
     try:
-        title, body = INFO_DATA[lang][idx]
+        title, body = INFO.get()[lang][idx]
     except IndexError:
         await callback_query.answer("⚠️ not found", show_alert=True)
         return
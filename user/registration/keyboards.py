@@ -6,7 +6,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config import PHOTO_CIS, PHOTO_WORLD
 from db.database import has_photo, has_passport, has_both_sims
 from user.registration.utils.countries import *
-from user.registration.utils.info import INFO_DATA, PAGE_SIZE
+from user.registration.utils.info import INFO, PAGE_SIZE
 from user.registration.utils.locale_to_excel import TRANSLATIONS, ensure_up_to_date
 
 
@@ -16,14 +16,13 @@ def tr(lang: str, key: str, **kwargs) -> str:
     Автоматически перечитывает Excel, если файл был изменён.
     """
     ensure_up_to_date()
-    if lang not in TRANSLATIONS:
-        TRANSLATIONS[lang] = {}
+    translations = TRANSLATIONS.get()  # один снимок на весь вызов
 
-    if key in TRANSLATIONS[lang]:
-        return TRANSLATIONS[lang][key].format(**kwargs)
+    if key in translations.get(lang, {}):
+        return translations[lang][key].format(**kwargs)
 
     # fallback: русский
-    return TRANSLATIONS["ru"].get(key, key).format(**kwargs)
+    return translations["ru"].get(key, key).format(**kwargs)
 
 
 def stage2_intro_text(lang: str, user_id: int) -> str:
@@ -186,7 +185,7 @@ def get_admin_reply_kb(user_id: int):
 # ───────────────── меню «Полезная информация» с пагинацией ─────────
 
 def build_info_menu_kb(lang: str, page: int = 0):
-    items = INFO_DATA.get(lang, [])
+    items = INFO.get().get(lang, ())
     if not items:
         return _kb_single(tr(lang, "btn_back"), "go_stage_2")
 
@@ -225,7 +224,7 @@ def build_back_to_info_kb(lang: str, page: int):
 
 
 def build_country_kb(lang: str, page: int = 0):
-    items = COUNTRY_LIST.get(lang, [])
+    items = COUNTRIES.get().names.get(lang, ())
     kb = InlineKeyboardBuilder()
 
     start = page * PAGE_SIZE_COUNTRY
@@ -1,78 +1,86 @@
 # === file: countries.py ======================================================
 import re
+from dataclasses import dataclass
 from pathlib import Path
-from threading import RLock
-from typing import Dict, List, Set
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, Tuple
 
 import pandas as pd
 
+from user.registration.utils.refdata import register
+
 XL_PATH = Path(__file__).with_name("excel").joinpath("countries.xlsx")
 PAGE_SIZE_COUNTRY = 8
 LANGS = ["ru", "en", "es", "fr", "pt", "ar"]
 N_CIS = 7
 
-COUNTRY_LIST: Dict[str, List[str]] = {}
-CIS_SET: Dict[str, Set[str]] = {lang: set() for lang in LANGS}
 
-PHONE_CODE: Dict[str, str] = {}   # "Russia" → "+7"
-PHONE_MASK: Dict[str, str] = {}   # "Russia" → "___ ___-__-__"
-CODE_MASK: Dict[str, str] = {}    # "+7"     → "___ ___-__-__"
+@dataclass(frozen=True)
+class CountryData:
+    """Неизменяемый снимок countries.xlsx (см. refdata)."""
+    names: Mapping[str, Tuple[str, ...]]      # lang → названия стран по порядку
+    cis: Mapping[str, FrozenSet[str]]         # lang → первые N_CIS стран (СНГ)
+    phone_code: Mapping[str, str]             # "Russia" → "+7"
+    phone_mask: Mapping[str, str]             # "Russia" → "___ ___-__-__"
+    code_mask: Mapping[str, str]              # "+7"     → "___ ___-__-__"
+
+
+def _read_countries() -> CountryData:
+    """Считать Excel в новый снимок; живые данные при этом не трогаются."""
+    if not XL_PATH.exists():
+        raise FileNotFoundError(f"{XL_PATH} not found")
+
+    df = pd.read_excel(XL_PATH, header=None, engine="openpyxl")
+
+    # --- названия стран --------------------------------------------
+    names, cis = {}, {}
+    for col, lang in enumerate(LANGS):
+        col_data = df.iloc[:, col].fillna("").astype(str).str.strip()
+        names[lang] = tuple(col_data.tolist())
+        cis[lang] = frozenset(col_data.head(N_CIS))
+
+    # --- коды телефонов / маски ------------------------------------
+    codes = df.iloc[:, 6].astype(str).str.strip().str.lstrip("+")
+    raw_masks = df.iloc[:, 7].astype(str).str.strip()
+
+    phone_code, phone_mask, code_mask = {}, {}, {}
+    for i, (code, mask_raw) in enumerate(zip(codes, raw_masks)):
+        if not code.isdigit():
+            continue  # пропускаем строки без кода
+
+        code = f"+{code}"
+        mask = re.sub(r"[+#0-9]", "_", mask_raw) or "__________"
+
+        code_mask[code] = mask
+        for lang_names in names.values():
+            name = lang_names[i].strip()
+            if name:
+                phone_code[name] = code
+                phone_mask[name] = mask
+
+    return CountryData(
+        names=MappingProxyType(names),
+        cis=MappingProxyType(cis),
+        phone_code=MappingProxyType(phone_code),
+        phone_mask=MappingProxyType(phone_mask),
+        code_mask=MappingProxyType(code_mask),
+    )
+
 
-# потокобезопасная «горячая» перезагрузка
-_LOCK = RLock()
+# читатели: `data = COUNTRIES.get()` — один снимок на весь хэндлер
+COUNTRIES = register("countries", _read_countries)
 
 
 def load_countries() -> None:
     """
-    Считать Excel и ПОЛНОСТЬЮ пере-инициализировать все словари даже во время
-    работы бота. Можно вызывать сколько угодно раз — данные всегда актуальны.
+    Перечитать Excel и атомарно подменить снимок даже во время работы бота.
+    Тяжёлая (читает файл) — из event loop вызывайте через asyncio.to_thread.
     """
-    with _LOCK:
-        if not XL_PATH.exists():
-            raise FileNotFoundError(f"{XL_PATH} not found")
-
-        # ─ 1. очищаем все кэш-структуры ─────────────────────────────
-        COUNTRY_LIST.clear()
-        for lang in LANGS:
-            COUNTRY_LIST[lang] = []
-
-        for lang in LANGS:
-            CIS_SET[lang].clear()
-
-        PHONE_CODE.clear()
-        PHONE_MASK.clear()
-        CODE_MASK.clear()
-
-        # ─ 2. читаем файл ───────────────────────────────────────────
-        df = pd.read_excel(XL_PATH, header=None, engine="openpyxl")
-
-        # --- названия стран ----------------------------------------
-        for col, lang in enumerate(LANGS):
-            col_data = df.iloc[:, col].fillna("").astype(str).str.strip()
-            COUNTRY_LIST[lang] = col_data.tolist()
-            CIS_SET[lang] = set(col_data.head(N_CIS))
-
-        # --- коды телефонов / маски --------------------------------
-        codes = df.iloc[:, 6].astype(str).str.strip().str.lstrip("+")
-        raw_masks = df.iloc[:, 7].astype(str).str.strip()
-
-        for i, (code, mask_raw) in enumerate(zip(codes, raw_masks)):
-            if not code.isdigit():
-                continue  # пропускаем строки без кода
-
-            code = f"+{code}"
-            mask = re.sub(r"[+#0-9]", "_", mask_raw) or "__________"
-
-            CODE_MASK[code] = mask
-            for lang, names in COUNTRY_LIST.items():
-                name = names[i].strip()
-                if name:
-                    PHONE_CODE[name] = code
-                    PHONE_MASK[name] = mask
+    COUNTRIES.reload()
 
 
 # первоначальная загрузка при старте модуля
-load_countries()
+COUNTRIES.get()
 # =========================================================================
 
 
@@ -81,11 +89,12 @@ def get_meta_by_country(country_name: str) -> tuple[str, str]:
     Вернуть (телефонный код, маску) по названию страны на любом из 6 языков.
     Если страна не найдена — ('+', '__________').
     """
+    data = COUNTRIES.get()
     return (
-        PHONE_CODE.get(country_name, "+"),
-        PHONE_MASK.get(country_name, "__________"),
+        data.phone_code.get(country_name, "+"),
+        data.phone_mask.get(country_name, "__________"),
     )
 
 
 def is_cis(country: str, lang: str) -> bool:
-    return country in CIS_SET.get(lang, set())
+    return country in COUNTRIES.get().cis.get(lang, frozenset())
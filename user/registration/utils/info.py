@@ -1,10 +1,12 @@
 # === file: info.py ===========================================================
 import os
-from threading import RLock
-from typing import Dict, List, Tuple
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple
 
 import pandas as pd
 
+from user.registration.utils.refdata import register
+
 # ------------------ настройки --------------------------
 XL_PATH = os.path.join(os.path.dirname(__file__), "excel", "info.xlsx")
 
@@ -15,13 +17,6 @@ ANSWER_COL2LANG = {idx + len(QUESTION_COL2LANG): lang for idx, lang in QUESTION_
 
 PAGE_SIZE = 4  # сколько пунктов в одном «листе» меню
 
-# потокобезопасная «горячая» перезагрузка
-_LOCK = RLock()
-
-# глобальная структура для хранения загруженных данных
-INFO_DATA: Dict[str, List[Tuple[str, str]]] = {lang: [] for lang in QUESTION_COL2LANG.values()}
-
-
 def _load() -> Dict[str, List[Tuple[str, str]]]:
     """
     Загружает данные из XLSX и возвращает:
@@ -55,21 +50,22 @@ def _load() -> Dict[str, List[Tuple[str, str]]]:
     return data
 
 
+def _read_info() -> Mapping[str, Tuple[Tuple[str, str], ...]]:
+    """Неизменяемый снимок FAQ для refdata: {lang: ((вопрос, ответ), ...)}."""
+    return MappingProxyType({lang: tuple(qa) for lang, qa in _load().items()})
+
+
+# читатели: `data = INFO.get()` — один снимок на весь хэндлер
+INFO = register("info", _read_info)
+
+
 def load_info() -> None:
     """
-    Полностью пере-инициализировать INFO_DATA, считав данные из XLSX.
-    Можно вызывать в любое время работы бота, чтобы обновить FAQ.
+    Перечитать XLSX и атомарно подменить снимок FAQ.
+    Можно вызывать в любое время работы бота (из event loop — через asyncio.to_thread).
     """
-    with _LOCK:
-        # очищаем текущие данные
-        for lang in INFO_DATA:
-            INFO_DATA[lang].clear()
-
-        # загружаем свежие данные
-        new_data = _load()
-        for lang, qa_list in new_data.items():
-            INFO_DATA[lang].extend(qa_list)
+    INFO.reload()
 
 
 # первоначальная загрузка при старте модуля
-load_info()
+INFO.get()
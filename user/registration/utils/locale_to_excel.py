@@ -4,11 +4,16 @@
 Поддерживает «горячую» подгрузку: если файл изменён, переводы перечитываются.
 """
 from pathlib import Path
-from typing import Dict
+from types import MappingProxyType
+from typing import Callable, Mapping, Optional
 import pandas as pd
+import sqlite3
 import threading
 
-from db.database import load_translations_from_db, replace_all_translations
+from db.database import (
+    ImportCancelled, conn, load_translations_from_db, replace_all_translations, writer_connection,
+)
+from user.registration.utils.refdata import register
 
 # ─────────────── НАСТРОЙКИ ────────────────────────────────────────
 EXCEL_PATH = Path(__file__).with_name("translations.xlsx")
@@ -23,21 +28,36 @@ LANG_COLUMNS = {
 }
 # ──────────────────────────────────────────────────────────────────
 
-TRANSLATIONS: Dict[str, Dict[str, str]] = load_translations_from_db()
+
+
+def _read_translations() -> Mapping[str, Mapping[str, str]]:
+    """Неизменяемый снимок таблицы translations (своё соединение — годится для рабочего потока)."""
+    with writer_connection() as db:
+        data = load_translations_from_db(db)
+    return MappingProxyType({lang: MappingProxyType(pairs) for lang, pairs in data.items()})
+
+
+# Снимок переводов публикуется одной подменой ссылки (см. refdata): берите
+# `TRANSLATIONS.get()` один раз на вызов — пустого или наполовину
+# заполненного словаря не бывает.
+TRANSLATIONS = register("translations", _read_translations)
+TRANSLATIONS.get()
 _last_mtime: float = 0.0
 _lock = threading.RLock()  # безопасно для нескольких потоков
 
 
 def _load_from_db() -> None:
-    global TRANSLATIONS, _last_mtime
-    TRANSLATIONS.clear()
-    TRANSLATIONS.update(load_translations_from_db())
+    global _last_mtime
+    TRANSLATIONS.reload()
     _last_mtime = EXCEL_PATH.stat().st_mtime
 
 
 def reload_translations(force: bool = False) -> None:
-    """Прочитать файл заново (используйте force=True для ручного перезагрузки)."""
-    global TRANSLATIONS, _last_mtime
+    """
+    Прочитать файл заново (используйте force=True для ручного перезагрузки).
+    Из event loop вызывайте через asyncio.to_thread — читает всю таблицу.
+    """
+    global _last_mtime
 
     with _lock:
         mtime = EXCEL_PATH.stat().st_mtime
@@ -48,24 +68,49 @@ def reload_translations(force: bool = False) -> None:
         _last_mtime = mtime
 
 
-def import_excel_to_db(path: Path = EXCEL_PATH) -> None:
-    """Считываем Excel и полностью заменяем таблицу translations."""
+def import_excel_to_db(
+    path: Path = EXCEL_PATH,
+    *,
+    db: sqlite3.Connection = conn,
+    reload: bool = True,
+    on_progress: Optional[Callable[[str], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> int:
+    """
+    Считываем Excel и полностью заменяем таблицу translations → число ключей.
+
+    Для запуска в рабочем потоке: `db` — его соединение, `reload=False` —
+    снимок TRANSLATIONS обновит вызывающий (см. reload_translations),
+    `on_progress(текст)` сообщает этап, выставленный `cancel` до записи
+    в БД прерывает импорт (`ImportCancelled`).
+    """
+    if on_progress is not None:
+        on_progress("читаю файл")
     df = pd.read_excel(path, engine="openpyxl")
     if "Ключ" not in df.columns:
         raise ValueError("Нет столбца «Ключ»")
-    data = {}
+
+    df = df[df["Ключ"].notna()]
+    keys = df["Ключ"].astype(str).str.strip()
+    df = df[(keys != "") & (keys.str.lower() != "nan")]
     data = {code: {} for code in LANG_COLUMNS}
-    for _, row in df.iterrows():
-        key = str(row["Ключ"]).strip()
-        if not key or key.lower() == "nan":
+    for code, col in LANG_COLUMNS.items():
+        if col not in df.columns:
             continue
-        for code, col in LANG_COLUMNS.items():
-            val = row.get(col, "")
-            if pd.notna(val) and str(val).strip():
-                data[code][key] = str(val).replace("\\n", "\n")
-
-    replace_all_translations(data)  # -> SQLite
-    _load_from_db()
+        vals = df[col].dropna().astype(str)
+        vals = vals[vals.str.strip() != ""]
+        # при повторе ключа побеждает последняя строка
+        data[code] = dict(zip(keys[vals.index], vals.str.replace("\\n", "\n", regex=False)))
+
+    if cancel is not None and cancel.is_set():
+        raise ImportCancelled("Импорт переводов остановлен до записи в БД")
+    keys = len({k for pairs in data.values() for k in pairs})
+    if on_progress is not None:
+        on_progress(f"записываю {keys} ключей")
+    replace_all_translations(data, db)  # -> SQLite, одна транзакция
+    if reload:
+        _load_from_db()  # новый снимок TRANSLATIONS — только после коммита
+    return keys
 
 
 def ensure_up_to_date() -> None:
@@ -0,0 +1,88 @@
+"""
+Справочники с «горячей» перезагрузкой
+=====================================
+
+Страны, FAQ «Полезная информация» и переводы меняются админами прямо во
+время работы бота.  Раньше перезагрузка чистила живые словари и заполняла
+их заново — параллельный хэндлер мог увидеть пустые или наполовину
+заполненные данные.  Теперь каждый справочник — `RefData`:
+
+* новый снимок целиком собирает `loader` в стороне от читателей (вызывайте
+  `reload()` из рабочего потока: `await asyncio.to_thread(...)`);
+* готовый снимок публикуется одной подменой ссылки, версия растёт на 1;
+* читатели берут снимок через `get()` без блокировок и работают с ним до
+  конца обработки — он неизменяем (MappingProxyType / tuple / frozenset);
+* если `loader` упал, остаётся прежний снимок.
+
+    COUNTRIES = register("countries", _read_countries)
+    countries = COUNTRIES.get()          # один снимок на весь хэндлер
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Snapshot(Generic[T]):
+    version: int
+    data: T
+    loaded_at: float  # time.time()
+
+
+class RefData(Generic[T]):
+    """Справочник: неизменяемый снимок + его версия."""
+
+    def __init__(self, name: str, loader: Callable[[], T]) -> None:
+        self.name = name
+        self._loader = loader
+        self._snapshot: Optional[Snapshot[T]] = None
+        self._reload_lock = threading.Lock()  # только для перезагрузок, читатели его не берут
+
+    def get(self) -> T:
+        """Текущий снимок (при первом обращении — загружает)."""
+        snap = self._snapshot
+        if snap is None:
+            return self.reload()
+        return snap.data
+
+    @property
+    def version(self) -> int:
+        """0 — ещё не загружен; растёт с каждой перезагрузкой."""
+        snap = self._snapshot
+        return snap.version if snap else 0
+
+    def reload(self) -> T:
+        """Собирает новый снимок и публикует его одной подменой ссылки."""
+        with self._reload_lock:  # параллельные перезагрузки — по очереди
+            started = time.perf_counter()
+            data = self._loader()
+            self._snapshot = Snapshot(self.version + 1, data, time.time())
+        log.info("Справочник %s: версия %s за %.2f с", self.name, self.version, time.perf_counter() - started)
+        return data
+
+
+_REGISTRY: Dict[str, RefData] = {}
+
+
+def register(name: str, loader: Callable[[], T]) -> RefData[T]:
+    """Регистрирует справочник `name` (повторная регистрация заменяет загрузчик)."""
+    ref = _REGISTRY.get(name)
+    if ref is None:
+        ref = _REGISTRY[name] = RefData(name, loader)
+    else:
+        ref._loader = loader  # importlib.reload модуля-владельца: снимок и версия сохраняются
+    return ref
+
+
+def get(name: str) -> RefData:
+    """Справочник по имени (KeyError, если не зарегистрирован)."""
+    return _REGISTRY[name]